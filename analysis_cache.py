@@ -0,0 +1,220 @@
+"""
+Persistent cache of GPT analysis results.
+
+Entries live in the call state database and are keyed by a SHA-256 of the
+normalized transcript, the hash of all loaded prompt files, the models and
+the sampling settings, so re-processing the same call (deployment checks,
+retries, replays) does not pay for a second analysis. When the prompt files
+change, entries of the old prompts are deleted: on prompt_loader.reload_prompts()
+and on the first lookup of a process started with different prompts.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import functools
+import threading
+
+import call_state
+import metrics
+from prompt_loader import prompt_loader
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    key TEXT PRIMARY KEY,
+    prompts_hash TEXT NOT NULL,
+    model TEXT,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used);
+"""
+
+_lock = threading.Lock()
+# Базы, в которых уже создана таблица и удалены записи старых промптов
+_prepared = {}
+cache_stats = {"hits": 0, "misses": 0, "writes": 0}
+
+def is_enabled():
+    return os.environ.get("ANALYSIS_CACHE_ENABLED", "1") != "0"
+
+def _count(name):
+    with _lock:
+        cache_stats[name] += 1
+    metrics.inc("analyzer_cache_events_total", cache="analysis", event=name)
+
+def get_cache_stats():
+    """Return a snapshot of hit, miss and write counters"""
+    with _lock:
+        return dict(cache_stats)
+
+def format_cache_stats():
+    """Return the counters with the hit rate as a one-line summary for cycle reports"""
+    stats = get_cache_stats()
+    lookups = stats['hits'] + stats['misses']
+    rate = stats['hits'] / lookups * 100 if lookups else 0
+    return f"{stats['hits']} hits, {stats['misses']} misses ({rate:.0f}% hit rate)"
+
+def reset_cache_stats():
+    """Reset the counters, e.g. at the start of a processing cycle"""
+    with _lock:
+        for name in cache_stats:
+            cache_stats[name] = 0
+
+def normalize_transcript(transcript):
+    """Collapse whitespace so formatting-only differences share an entry"""
+    return re.sub(r'\s+', ' ', transcript or '').strip()
+
+def make_key(transcript, call_info=None, params=None, prompts_hash=None):
+    """
+    Build the cache key of an analysis.
+
+    call_info is part of the key because it is rendered into the user block
+    of the prompt.
+
+    Args:
+        transcript (str): Transcript that is analyzed
+        call_info (dict): Call metadata passed to the prompt
+        params (dict): Models, temperature and other settings that affect the result
+        prompts_hash (str): Hash of the prompt files, defaults to the loaded ones
+
+    Returns:
+        str: Hex SHA-256 key
+    """
+    transcript_hash = hashlib.sha256(normalize_transcript(transcript).encode('utf-8')).hexdigest()
+    prompts_hash = prompts_hash or prompt_loader.prompts_hash
+    params_json = json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+    call_info_json = json.dumps(call_info or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(
+        f"{transcript_hash}\n{prompts_hash}\n{params_json}\n{call_info_json}".encode('utf-8')
+    ).hexdigest()
+
+def _get_connection():
+    """Connection to the call state DB with the cache table and no entries of other prompts"""
+    conn = call_state.get_connection()
+    db_path = call_state.CALL_STATE_DB
+    with _lock:
+        prepared_hash = _prepared.get(db_path)
+    if prepared_hash != prompt_loader.prompts_hash:
+        conn.executescript(SCHEMA)
+        _delete_other_prompts(conn, prompt_loader.prompts_hash)
+        with _lock:
+            _prepared[db_path] = prompt_loader.prompts_hash
+    return conn
+
+def _delete_other_prompts(conn, prompts_hash):
+    cursor = conn.execute("DELETE FROM analysis_cache WHERE prompts_hash != ?", (prompts_hash,))
+    if cursor.rowcount:
+        print(f"🗑️ Prompts changed: dropped {cursor.rowcount} cached analyses")
+    return cursor.rowcount
+
+def invalidate(old_hash=None, new_hash=None):
+    """
+    Delete all entries that were not produced with the current prompts.
+
+    Registered as a prompt_loader change listener; the arguments are ignored.
+
+    Returns:
+        int: Number of deleted entries
+    """
+    conn = call_state.get_connection()
+    conn.executescript(SCHEMA)
+    deleted = _delete_other_prompts(conn, prompt_loader.prompts_hash)
+    with _lock:
+        _prepared[call_state.CALL_STATE_DB] = prompt_loader.prompts_hash
+    return deleted
+
+prompt_loader.add_change_listener(invalidate)
+
+def get_analysis(transcript, call_info=None, params=None):
+    """
+    Look up a cached analysis and mark it as recently used.
+
+    Returns:
+        dict: Cached result, None on a miss or when the cache is disabled
+    """
+    if not is_enabled():
+        return None
+
+    conn = _get_connection()
+    key = make_key(transcript, call_info, params)
+    row = conn.execute("SELECT result FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        _count("misses")
+        return None
+
+    conn.execute("UPDATE analysis_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+    _count("hits")
+    return json.loads(row[0])
+
+def put_analysis(transcript, call_info, params, result, model=None):
+    """
+    Store an analysis result.
+
+    Args:
+        transcript (str): Analyzed transcript
+        call_info (dict): Call metadata passed to the prompt
+        params (dict): Settings that affect the result
+        result (dict): Parsed analysis JSON
+        model (str): Model that produced the result
+    """
+    if not is_enabled():
+        return
+
+    conn = _get_connection()
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO analysis_cache (key, prompts_hash, model, result, created_at, last_used) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (make_key(transcript, call_info, params), prompt_loader.prompts_hash, model,
+         json.dumps(result, ensure_ascii=False), now, now)
+    )
+    _count("writes")
+
+def prune_cache(retention_days=None):
+    """
+    Delete entries not used for longer than the retention period.
+
+    Args:
+        retention_days (float): Defaults to ANALYSIS_CACHE_RETENTION_DAYS (30)
+
+    Returns:
+        int: Number of deleted entries
+    """
+    if retention_days is None:
+        retention_days = float(os.environ.get("ANALYSIS_CACHE_RETENTION_DAYS", "30"))
+    cutoff = time.time() - retention_days * 86400
+    cursor = _get_connection().execute("DELETE FROM analysis_cache WHERE last_used < ?", (cutoff,))
+    return cursor.rowcount
+
+def cached_analysis(params_func=None):
+    """
+    Decorator that serves func(transcript, call_info=None) from the analysis cache.
+
+    Results with an "error" key (missing API key, API failures, unparsable
+    answers) are not stored, so they are retried on the next cycle. The
+    undecorated function stays available as func.__wrapped__.
+
+    Args:
+        params_func (callable): Returns the settings that affect the result
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(transcript, call_info=None):
+            if not transcript or not is_enabled():
+                return func(transcript, call_info)
+
+            params = params_func() if params_func else {}
+            cached = get_analysis(transcript, call_info, params)
+            if cached is not None:
+                print(f"💾 Analysis cache hit (prompts {prompt_loader.prompt_version}): status = {cached.get('status')}")
+                return cached
+
+            result = func(transcript, call_info)
+            if isinstance(result, dict) and "error" not in result:
+                put_analysis(transcript, call_info, params, result, model=params.get("analysis_model"))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Replay labelled transcripts through the analysis with and without the model cascade.
+
+Usage:
+    OPENAI_API_KEY=... python analysis_replay.py [fixtures.json]
+
+Prints median latency per call, token usage per tier and every call whose
+alert decision differs between the single-model and the cascade run.
+"""
+import os
+import sys
+import time
+import statistics
+from dotenv import load_dotenv
+import main
+from prefilter_report import load_fixtures, DEFAULT_FIXTURES
+
+def replay(cases, cascade_enabled):
+    """Analyze every case once; return (alert flags by id, per-call latencies, usage snapshot)"""
+    os.environ["ANALYSIS_CASCADE_ENABLED"] = "1" if cascade_enabled else "0"
+    main.reset_analysis_usage()
+    alerts = {}
+    latencies = []
+    for case in cases:
+        started = time.monotonic()
+        result = main.analyze_with_gpt_new(case['transcript'], {"duration": case.get('duration', 0)})
+        latencies.append(time.monotonic() - started)
+        alerts[case['id']] = result.get('status') == 'alert'
+    return alerts, latencies, main.format_analysis_usage()
+
+def main_replay():
+    load_dotenv()
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FIXTURES
+    cases = [case for case in load_fixtures(path) if case.get('transcript')]
+    
+    single_alerts, single_latencies, single_usage = replay(cases, cascade_enabled=False)
+    cascade_alerts, cascade_latencies, cascade_usage = replay(cases, cascade_enabled=True)
+    
+    print(f"\n=== Analysis replay: {len(cases)} calls from {path} ===")
+    print(f"Single model: median {statistics.median(single_latencies):.2f}s per call | {single_usage}")
+    print(f"Cascade:      median {statistics.median(cascade_latencies):.2f}s per call | {cascade_usage}")
+    print(f"Alerts: single={sum(single_alerts.values())}, cascade={sum(cascade_alerts.values())}")
+    
+    lost = [case_id for case_id, alert in single_alerts.items() if alert and not cascade_alerts[case_id]]
+    extra = [case_id for case_id, alert in cascade_alerts.items() if alert and not single_alerts[case_id]]
+    if extra:
+        print(f"⚠️ Alerts only in cascade run: {', '.join(extra)}")
+    if lost:
+        print(f"❌ Alerts lost by the cascade: {', '.join(lost)}")
+        sys.exit(1)
+    print("✅ No alerts lost by the cascade")
+
+if __name__ == "__main__":
+    main_replay()
@@ -0,0 +1,122 @@
+"""
+Response schemas of the GPT analysis and helpers for streamed answers.
+
+ANALYSIS_RESPONSE_FORMAT and TRIAGE_RESPONSE_FORMAT are passed as
+response_format (structured outputs), so the model can only answer with JSON
+of that shape. "status" is the first property of the analysis schema, which
+lets a streamed answer be classified after a few tokens: sniff_status() reads
+it from the partial text and an "ignore" stream can be closed right away.
+validate_analysis() checks that alerts carry every field the Telegram alert
+template needs. parse_analysis_json() turns the raw model text into a dict
+for both the real-time path and batch_analysis.py.
+"""
+import re
+import json
+
+from tracing import log_event
+
+ALERT_FIELDS = ("error_code", "error_description", "context", "solution")
+ERROR_CODE_RE = re.compile(r'^M[1-9]$')
+
+def _nullable_string(description):
+    return {"type": ["string", "null"], "description": description}
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        # status идёт первым - по нему решаем, дочитывать ли поток
+        "status": {"type": "string", "enum": ["alert", "ignore"]},
+        "error_code": _nullable_string("Код ошибки менеджера M1-M9, null для ignore"),
+        "error_description": _nullable_string("Краткое описание ошибки менеджера"),
+        "client_wanted": _nullable_string("Что хотел клиент"),
+        "price_mentioned": _nullable_string("Названная цена или бюджет"),
+        "context": _nullable_string("Контекст ситуации"),
+        "solution": _nullable_string("Как менеджеру следовало поступить"),
+    },
+    "required": ["status", "error_code", "error_description", "client_wanted",
+                 "price_mentioned", "context", "solution"],
+    "additionalProperties": False,
+}
+
+TRIAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["SUCCESS_SALE", "FAILED_SALE", "LOGISTICS", "OTHER"]},
+        "responsibility": {"type": "string", "enum": ["MANAGER_FAULT", "CLIENT_FAULT", "UNSURE", "NONE"]},
+    },
+    "required": ["category", "responsibility"],
+    "additionalProperties": False,
+}
+
+ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "call_analysis", "strict": True, "schema": ANALYSIS_SCHEMA},
+}
+
+TRIAGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "call_triage", "strict": True, "schema": TRIAGE_SCHEMA},
+}
+
+_STATUS_RE = re.compile(r'^\s*\{\s*"status"\s*:\s*"([a-z]+)"')
+
+def sniff_status(partial_json):
+    """
+    Read the status from the beginning of a streamed analysis answer.
+
+    Args:
+        partial_json (str): Text received so far
+
+    Returns:
+        str: "alert" or "ignore" once the status value is complete, else None
+    """
+    match = _STATUS_RE.match(partial_json)
+    return match.group(1) if match else None
+
+def parse_analysis_json(raw_response):
+    """Parse model output as JSON, stripping markdown fences; None if it is not JSON"""
+    raw_response = raw_response.strip()
+    # Убираем возможные markdown обёртки
+    if raw_response.startswith('```json'):
+        raw_response = raw_response[7:-3].strip()
+    elif raw_response.startswith('```'):
+        raw_response = raw_response[3:-3].strip()
+    try:
+        return json.loads(raw_response)
+    except json.JSONDecodeError as e:
+        log_event("WARNING", "analysis_json_invalid", error=str(e), characters=len(raw_response))
+        log_event("DEBUG", "analysis_json_raw", response=raw_response[:200])
+        return None
+
+def validate_analysis(result):
+    """
+    Check an analysis result against the schema.
+
+    Args:
+        result (dict): Parsed analysis JSON
+
+    Returns:
+        list: Validation errors, empty if the result is valid
+    """
+    if not isinstance(result, dict):
+        return ["result is not a JSON object"]
+    status = result.get('status')
+    if status == 'ignore':
+        return []
+    if status != 'alert':
+        return [f"unknown status {status!r}"]
+
+    errors = []
+    for field in ALERT_FIELDS:
+        value = result.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{field} is missing")
+    if not errors and not ERROR_CODE_RE.match(result['error_code'].strip()):
+        errors.append(f"unknown error_code {result['error_code']!r}")
+    return errors
+
+def normalize_analysis(result):
+    """Drop the null fields structured outputs fill in, so results match the pre-schema format"""
+    if result.get('status') == 'ignore':
+        return {"status": "ignore"}
+    return {key: value for key, value in result.items() if value is not None}
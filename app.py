@@ -1,5 +1,6 @@
 import os
-from flask import Flask
+from flask import Flask, Response
+from metrics import render_metrics, CONTENT_TYPE
 
 app = Flask(__name__)
 
@@ -15,6 +16,10 @@ def home():
 def health():
     return {"status": "healthy", "service": "29ROZ Call Analyzer"}
 
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,363 @@
+"""
+In-memory audio helpers for the Yandex SpeechKit path.
+
+Recording duration is read from MP3/MP4 headers in pure Python, and the
+conversion to OGG Opus runs as a single ffmpeg process fed over stdin/stdout,
+so no temp files and no separate ffprobe call are needed per recording.
+Long recordings are decoded to PCM and split into chunks at silences.
+"""
+import os
+import re
+import struct
+import subprocess
+import tempfile
+
+# Битрейты в kbps: (версия MPEG, слой) -> таблица по индексу из заголовка кадра
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+# Opus в OGG всегда считает granule position в 48 kHz
+OPUS_GRANULE_RATE = 48000
+
+# 16 kHz mono s16le: 30 секунд = 960 000 байт, укладывается в лимит Yandex в 1 MB
+PCM_SAMPLE_RATE = 16000
+
+SILENCE_START_RE = re.compile(r'silence_start: (-?[\d.]+)')
+SILENCE_END_RE = re.compile(r'silence_end: (-?[\d.]+)')
+
+def is_mp4_audio(audio_data):
+    """Check if audio data is an MP4/M4A container"""
+    return audio_data[4:8] == b'ftyp'
+
+def _parse_mp3_frame_header(header):
+    """
+    Parse a 4-byte MPEG audio frame header.
+
+    Returns:
+        dict: version, layer, bitrate (bps), sample_rate, samples, frame_length, mono; None if invalid
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    version = {0: 2.5, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or version == 1) else 576
+        frame_length = samples // 8 * bitrate // sample_rate + padding
+
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples': samples,
+        'frame_length': frame_length,
+        'mono': (header[3] >> 6) == 3,
+    }
+
+def _find_first_mp3_frame(audio_data, offset):
+    """Find the first frame header that is followed by another valid frame"""
+    limit = min(len(audio_data) - 4, offset + 64 * 1024)
+    position = audio_data.find(b'\xff', offset, limit + 1)
+    while 0 <= position <= limit:
+        frame = _parse_mp3_frame_header(audio_data[position:position + 4])
+        if frame:
+            next_position = position + frame['frame_length']
+            # Проверяем следующий кадр, чтобы не принять случайный 0xFF за синхрослово
+            if next_position + 4 > len(audio_data) or _parse_mp3_frame_header(audio_data[next_position:next_position + 4]):
+                return position, frame
+        position = audio_data.find(b'\xff', position + 1, limit + 1)
+    return None, None
+
+def get_mp3_duration(audio_data):
+    """
+    Read MP3 duration from the frame headers without decoding.
+
+    Uses the Xing/Info or VBRI frame count when present, otherwise estimates
+    the duration of a constant bitrate stream from its size.
+
+    Args:
+        audio_data (bytes): Binary MP3 content
+
+    Returns:
+        float: Duration in seconds, None if no valid MPEG audio frame was found
+    """
+    offset = 0
+    if audio_data.startswith(b'ID3') and len(audio_data) >= 10:
+        tag_size = (audio_data[6] << 21) | (audio_data[7] << 14) | (audio_data[8] << 7) | audio_data[9]
+        offset = 10 + tag_size + (10 if audio_data[5] & 0x10 else 0)
+
+    position, frame = _find_first_mp3_frame(audio_data, offset)
+    if frame is None:
+        return None
+
+    if frame['version'] == 1:
+        side_info = 17 if frame['mono'] else 32
+    else:
+        side_info = 9 if frame['mono'] else 17
+
+    xing_offset = position + 4 + side_info
+    if audio_data[xing_offset:xing_offset + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', audio_data[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 0x01:
+            frame_count = struct.unpack('>I', audio_data[xing_offset + 8:xing_offset + 12])[0]
+            return frame_count * frame['samples'] / frame['sample_rate']
+
+    vbri_offset = position + 4 + 32
+    if audio_data[vbri_offset:vbri_offset + 4] == b'VBRI':
+        frame_count = struct.unpack('>I', audio_data[vbri_offset + 14:vbri_offset + 18])[0]
+        return frame_count * frame['samples'] / frame['sample_rate']
+
+    audio_bytes = len(audio_data) - position
+    if audio_data[-128:-125] == b'TAG':
+        audio_bytes -= 128
+    return audio_bytes * 8 / frame['bitrate']
+
+def _iter_mp4_boxes(audio_data, start, end):
+    """Yield (box_type, payload_start, box_end) for boxes between start and end"""
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack('>I4s', audio_data[position:position + 8])
+        header_size = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            size = struct.unpack('>Q', audio_data[position + 8:position + 16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, min(position + size, end)
+        position += size
+
+def get_mp4_duration(audio_data):
+    """
+    Read MP4/M4A duration from the movie header (moov/mvhd).
+
+    Args:
+        audio_data (bytes): Binary MP4 content
+
+    Returns:
+        float: Duration in seconds, None if the header is missing or malformed
+    """
+    for box_type, payload_start, box_end in _iter_mp4_boxes(audio_data, 0, len(audio_data)):
+        if box_type != b'moov':
+            continue
+        for child_type, child_start, child_end in _iter_mp4_boxes(audio_data, payload_start, box_end):
+            if child_type != b'mvhd':
+                continue
+            mvhd = audio_data[child_start:child_end]
+            try:
+                if mvhd[0] == 1:
+                    timescale, duration = struct.unpack('>IQ', mvhd[20:32])
+                else:
+                    timescale, duration = struct.unpack('>II', mvhd[12:20])
+            except (IndexError, struct.error):
+                return None
+            return duration / timescale if timescale else None
+    return None
+
+def _mp4_needs_seek(audio_data):
+    """True if the moov box comes after mdat, which ffmpeg cannot read from a pipe"""
+    for box_type, _, _ in _iter_mp4_boxes(audio_data, 0, len(audio_data)):
+        if box_type == b'moov':
+            return False
+        if box_type == b'mdat':
+            return True
+    return True
+
+def get_audio_duration(audio_data):
+    """
+    Get duration of an MP3 or MP4 recording from its headers.
+
+    Args:
+        audio_data (bytes): Binary MP3/MP4 content
+
+    Returns:
+        float: Duration in seconds, None if the format is unknown or unparsable
+    """
+    try:
+        if is_mp4_audio(audio_data):
+            return get_mp4_duration(audio_data)
+        return get_mp3_duration(audio_data)
+    except Exception as e:
+        print(f"Could not read audio duration from headers: {e}")
+        return None
+
+def get_ogg_opus_duration(ogg_data):
+    """
+    Get duration of an OGG Opus stream from the granule position of its last page.
+
+    Args:
+        ogg_data (bytes): Binary OGG Opus content
+
+    Returns:
+        float: Duration in seconds, None if the stream is not OGG Opus
+    """
+    head = ogg_data.find(b'OpusHead')
+    last_page = ogg_data.rfind(b'OggS')
+    if head < 0 or last_page < 0 or len(ogg_data) < last_page + 14 or len(ogg_data) < head + 12:
+        return None
+    pre_skip = struct.unpack('<H', ogg_data[head + 10:head + 12])[0]
+    granule = struct.unpack('<q', ogg_data[last_page + 6:last_page + 14])[0]
+    return max(0, granule - pre_skip) / OPUS_GRANULE_RATE
+
+def _run_ffmpeg(audio_data, output_args, loglevel='error'):
+    """
+    Run ffmpeg once with the recording on stdin and the result on stdout.
+
+    MP4 files whose moov box follows the media data cannot be demuxed from a
+    pipe; only for those the input is written to a temp file first.
+
+    Returns:
+        subprocess.CompletedProcess: Finished process, None if ffmpeg failed
+    """
+    timeout = float(os.environ.get("FFMPEG_TIMEOUT_SECONDS", "60"))
+    input_path = None
+
+    try:
+        if is_mp4_audio(audio_data) and _mp4_needs_seek(audio_data):
+            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as input_file:
+                input_file.write(audio_data)
+                input_path = input_file.name
+
+        result = subprocess.run([
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', loglevel,
+            '-i', input_path or 'pipe:0', '-vn'
+        ] + output_args + ['pipe:1'], input=b'' if input_path else audio_data, capture_output=True, timeout=timeout)
+
+        if result.returncode != 0 or not result.stdout:
+            print(f"FFmpeg conversion failed: {result.stderr.decode('utf-8', 'replace').strip()[-500:]}")
+            return None
+        return result
+    except subprocess.TimeoutExpired:
+        print(f"FFmpeg conversion timed out after {timeout:g}s")
+        return None
+    except Exception as e:
+        print(f"Error during audio conversion: {e}")
+        return None
+    finally:
+        if input_path and os.path.exists(input_path):
+            os.unlink(input_path)
+
+def convert_to_ogg_opus(audio_data, bitrate="64k"):
+    """
+    Convert a recording to OGG Opus with one ffmpeg run over stdin/stdout.
+
+    Args:
+        audio_data (bytes): Binary MP3/MP4 content
+        bitrate (str): Opus bitrate passed to ffmpeg
+
+    Returns:
+        bytes: OGG Opus data, None if conversion failed
+    """
+    # bitexact: фиксированный serial OGG-потока и без версии энкодера в тегах,
+    # чтобы одинаковый вход давал одинаковые байты (ключ кэша транскрипций)
+    result = _run_ffmpeg(audio_data, [
+        '-c:a', 'libopus', '-b:a', bitrate, '-fflags', '+bitexact', '-flags:a', '+bitexact', '-f', 'ogg'
+    ])
+    return result.stdout if result else None
+
+def _parse_silences(ffmpeg_log, total_duration):
+    """Extract (start, end) silence intervals from silencedetect output"""
+    silences = []
+    silence_start = None
+    for line in ffmpeg_log.splitlines():
+        match = SILENCE_START_RE.search(line)
+        if match:
+            silence_start = float(match.group(1))
+            continue
+        match = SILENCE_END_RE.search(line)
+        if match and silence_start is not None:
+            silences.append((max(0.0, silence_start), float(match.group(1))))
+            silence_start = None
+    # Тишина до конца записи не закрывается строкой silence_end
+    if silence_start is not None and silence_start < total_duration:
+        silences.append((silence_start, total_duration))
+    return silences
+
+def decode_to_pcm(audio_data, sample_rate=PCM_SAMPLE_RATE):
+    """
+    Decode a recording to 16-bit mono PCM and detect silences in the same ffmpeg run.
+
+    Silence detection is tuned with SILENCE_THRESHOLD_DB (default -35) and
+    SILENCE_MIN_SECONDS (default 0.3).
+
+    Args:
+        audio_data (bytes): Binary MP3/MP4/OGG content
+        sample_rate (int): Output sample rate in Hz
+
+    Returns:
+        tuple: (pcm_data: bytes or None, silences: list of (start, end) seconds)
+    """
+    threshold_db = os.environ.get("SILENCE_THRESHOLD_DB", "-35")
+    min_silence = os.environ.get("SILENCE_MIN_SECONDS", "0.3")
+
+    result = _run_ffmpeg(audio_data, [
+        '-af', f'silencedetect=noise={threshold_db}dB:d={min_silence}',
+        '-ac', '1', '-ar', str(sample_rate), '-f', 's16le'
+    ], loglevel='info')
+    if result is None:
+        return None, []
+
+    total_duration = len(result.stdout) / (2 * sample_rate)
+    return result.stdout, _parse_silences(result.stderr.decode('utf-8', 'replace'), total_duration)
+
+def split_at_silences(total_duration, silences, max_chunk_seconds, min_chunk_seconds=5.0):
+    """
+    Plan chunk boundaries no longer than max_chunk_seconds, cutting inside silences.
+
+    Each cut is placed in the middle of the latest silence that keeps the chunk
+    within the limit. Without a suitable silence the chunk is cut at the limit.
+
+    Args:
+        total_duration (float): Recording duration in seconds
+        silences (list): (start, end) silence intervals in seconds
+        max_chunk_seconds (float): Maximum chunk length
+        min_chunk_seconds (float): Cuts closer than this to the chunk start are ignored
+
+    Returns:
+        list: (start, end) chunk boundaries in seconds covering the whole recording
+    """
+    cut_points = sorted((start + end) / 2 for start, end in silences)
+    chunks = []
+    chunk_start = 0.0
+
+    while total_duration - chunk_start > max_chunk_seconds:
+        limit = chunk_start + max_chunk_seconds
+        candidates = [point for point in cut_points if chunk_start + min_chunk_seconds <= point <= limit]
+        cut = candidates[-1] if candidates else limit
+        chunks.append((chunk_start, cut))
+        chunk_start = cut
+
+    if total_duration > chunk_start:
+        chunks.append((chunk_start, total_duration))
+    return chunks
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+OpenAI Batch API mode for non-urgent re-analysis of many transcripts.
+
+Builds a JSONL file of chat completion requests (one per call_uuid) in the
+Batch API format, uploads and submits it, polls until the batch finishes and
+merges the results into call state (analyses table) by call_uuid. Real-time
+alerting keeps using the synchronous path in main.py.
+
+Usage:
+    python batch_analysis.py build transcripts.jsonl
+    python batch_analysis.py submit batch_jobs/analysis_<timestamp>.jsonl
+    python batch_analysis.py poll <batch_id>
+    python batch_analysis.py run transcripts.jsonl
+
+transcripts.jsonl holds one {"call_uuid", "transcript", "call_info"} object
+per line. Set OPENAI_BASE_URL to run against fake_openai_server.py offline.
+"""
+import os
+import sys
+import json
+import time
+from datetime import datetime
+import openai
+from dotenv import load_dotenv
+from prompt_loader import prompt_loader
+from transcript_compaction import compact_transcript
+from analysis_schema import ANALYSIS_RESPONSE_FORMAT, validate_analysis, normalize_analysis, parse_analysis_json
+import call_state
+
+# Не requests.jsonl в корне репозитория - файлы батчей складываются отдельно
+BATCH_DIR = os.environ.get("BATCH_DIR", "batch_jobs")
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def load_transcripts(path):
+    """
+    Load transcripts for a backfill.
+    
+    Args:
+        path (str): JSONL file with call_uuid, transcript and optional call_info per line
+    
+    Returns:
+        list: Items with a call_uuid and a non-empty transcript
+    """
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get('call_uuid') or not item.get('transcript'):
+                print(f"⚠️ Line {line_number}: call_uuid or transcript missing, skipped")
+                continue
+            items.append(item)
+    return items
+
+def build_batch_file(items, path=None, model=None):
+    """
+    Write analysis requests in the Batch API JSONL format.
+    
+    Args:
+        items (list): Dicts with call_uuid, transcript and optional call_info
+        path (str): Output file, defaults to BATCH_DIR/analysis_<timestamp>.jsonl
+        model (str): Model, defaults to ANALYSIS_MODEL (gpt-4o)
+    
+    Returns:
+        str: Path of the written file
+    """
+    model = model or os.environ.get("ANALYSIS_MODEL", "gpt-4o")
+    if path is None:
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        path = os.path.join(BATCH_DIR, f"analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    
+    seen = set()
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            # custom_id должен быть уникальным в пределах батча
+            if item['call_uuid'] in seen:
+                continue
+            seen.add(item['call_uuid'])
+            f.write(json.dumps({
+                "custom_id": item['call_uuid'],
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "messages": prompt_loader.get_analysis_messages(
+                        compact_transcript(item['transcript']), item.get('call_info')
+                    ),
+                    "max_tokens": 800,
+                    "temperature": 0.1,
+                    "response_format": ANALYSIS_RESPONSE_FORMAT
+                }
+            }, ensure_ascii=False) + "\n")
+    
+    print(f"✅ Wrote {len(seen)} analysis requests to {path} (model {model}, prompts {prompt_loader.prompt_version})")
+    return path
+
+def submit_batch(client, path):
+    """
+    Upload a batch file and create the batch.
+    
+    Returns:
+        str: Batch ID
+    """
+    with open(path, 'rb') as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"source": os.path.basename(path)}
+    )
+    print(f"🚀 Submitted batch {batch.id} ({path})")
+    return batch.id
+
+def wait_for_batch(client, batch_id, poll_interval=None, timeout=None):
+    """
+    Poll a batch until it reaches a terminal status.
+    
+    Args:
+        client: OpenAI client
+        batch_id (str): Batch ID
+        poll_interval (float): Seconds between polls, defaults to BATCH_POLL_SECONDS (60)
+        timeout (float): Give up after this many seconds, None waits for the 24h window
+    
+    Returns:
+        Batch: Final batch object, None on timeout
+    """
+    if poll_interval is None:
+        poll_interval = float(os.environ.get("BATCH_POLL_SECONDS", "60"))
+    started = time.monotonic()
+    last_status = None
+    
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status != last_status:
+            counts = batch.request_counts
+            progress = f" ({counts.completed}/{counts.total})" if counts and counts.total else ""
+            print(f"⏳ Batch {batch_id}: {batch.status}{progress}")
+            last_status = batch.status
+        if batch.status in TERMINAL_BATCH_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - started > timeout:
+            print(f"⚠️ Batch {batch_id} not finished after {timeout:g}s")
+            return None
+        time.sleep(poll_interval)
+
+def merge_batch_results(client, batch):
+    """
+    Download batch output and store each analysis in call state by call_uuid.
+    
+    Returns:
+        dict: Counts of merged, alert and failed results
+    """
+    counts = {"merged": 0, "alerts": 0, "failed": 0}
+    if not batch.output_file_id:
+        print(f"❌ Batch {batch.id} has no output ({batch.status})")
+        return counts
+    
+    output = client.files.content(batch.output_file_id).text
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        call_uuid = record.get('custom_id')
+        response = record.get('response') or {}
+        
+        if record.get('error') or response.get('status_code') != 200:
+            print(f"❌ {call_uuid}: {record.get('error') or response.get('status_code')}")
+            counts["failed"] += 1
+            continue
+        
+        body = response.get('body') or {}
+        try:
+            content = body['choices'][0]['message']['content']
+            result = parse_analysis_json(content)
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            # Пустой choices или отказ модели (content = None) - не повод терять остальные результаты
+            print(f"❌ {call_uuid}: no analysis in response ({e.__class__.__name__}: {e})")
+            counts["failed"] += 1
+            continue
+        errors = validate_analysis(result)
+        if errors:
+            print(f"❌ {call_uuid}: {'; '.join(errors)}")
+            counts["failed"] += 1
+            continue
+        result = normalize_analysis(result)
+        
+        call_state.save_analysis(call_uuid, result, f"batch:{batch.id}", body.get('model'))
+        counts["merged"] += 1
+        if result.get('status') == 'alert':
+            counts["alerts"] += 1
+    
+    print(f"✅ Merged {counts['merged']} results from batch {batch.id}: "
+          f"{counts['alerts']} alerts, {counts['failed']} failed")
+    return counts
+
+def get_client():
+    """OpenAI client; OPENAI_BASE_URL points it at a stand-in server if set"""
+    return openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+def main():
+    load_dotenv()
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "submit", "poll", "run"):
+        print(__doc__)
+        sys.exit(1)
+    
+    command, argument = sys.argv[1], sys.argv[2]
+    if command == "build":
+        build_batch_file(load_transcripts(argument))
+        return
+    
+    client = get_client()
+    if command == "submit":
+        submit_batch(client, argument)
+        return
+    
+    if command == "run":
+        batch_id = submit_batch(client, build_batch_file(load_transcripts(argument)))
+    else:
+        batch_id = argument
+    
+    batch = wait_for_batch(client, batch_id)
+    if batch is not None:
+        merge_batch_results(client, batch)
+
+if __name__ == "__main__":
+    main()
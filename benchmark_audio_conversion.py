@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: old temp-file + ffprobe conversion vs in-memory ffmpeg pipe.
+
+Usage:
+    python benchmark_audio_conversion.py recording1.mp3 [recording2.mp3 ...] [--runs N]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+import tempfile
+from audio_utils import get_audio_duration, convert_to_ogg_opus
+
+def legacy_convert(audio_data):
+    """Previous implementation: temp .mp3, ffprobe for duration, ffmpeg to temp .ogg"""
+    mp3_path = None
+    ogg_path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as mp3_file:
+            mp3_file.write(audio_data)
+            mp3_path = mp3_file.name
+        
+        duration_result = subprocess.run([
+            'ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
+            '-of', 'csv=p=0', mp3_path
+        ], capture_output=True, text=True)
+        duration = float(duration_result.stdout.strip()) if duration_result.returncode == 0 else None
+        
+        with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as ogg_file:
+            ogg_path = ogg_file.name
+        
+        subprocess.run([
+            'ffmpeg', '-i', mp3_path, '-c:a', 'libopus', '-b:a', '64k',
+            '-vn', '-f', 'ogg', ogg_path, '-y'
+        ], capture_output=True, text=True)
+        
+        with open(ogg_path, 'rb') as f:
+            return f.read(), duration
+    finally:
+        for path in (mp3_path, ogg_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+def piped_convert(audio_data):
+    """New implementation: duration from headers, one ffmpeg run over stdin/stdout"""
+    return convert_to_ogg_opus(audio_data), get_audio_duration(audio_data)
+
+def time_runs(func, audio_data, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func(audio_data)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def main():
+    args = sys.argv[1:]
+    runs = 5
+    if '--runs' in args:
+        index = args.index('--runs')
+        runs = int(args[index + 1])
+        del args[index:index + 2]
+    
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    
+    for path in args:
+        with open(path, 'rb') as f:
+            audio_data = f.read()
+        
+        legacy_ogg, ffprobe_duration = legacy_convert(audio_data)
+        header_duration = get_audio_duration(audio_data)
+        print(f"\n🎧 {os.path.basename(path)}: {len(audio_data)} bytes")
+        print(f"  Duration: ffprobe={ffprobe_duration}, headers={header_duration}")
+        
+        legacy = time_runs(legacy_convert, audio_data, runs)
+        piped = time_runs(piped_convert, audio_data, runs)
+        
+        for name, timings in (("temp files + ffprobe", legacy), ("in-memory pipe", piped)):
+            print(f"  {name:<22} median {statistics.median(timings) * 1000:7.1f} ms, "
+                  f"min {min(timings) * 1000:7.1f} ms ({runs} runs)")
+        print(f"  Speedup: {statistics.median(legacy) / statistics.median(piped):.2f}x")
+
+if __name__ == "__main__":
+    main()
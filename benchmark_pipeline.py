@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of one processing cycle against local fake services.
+
+Starts the Telphin, Yandex SpeechKit, Telegram (fake_services.py) and OpenAI
+(fake_openai_server.py) stand-ins, points the analyzer at them through
+TELFIN_BASE_URL, YANDEX_STT_URL, TELEGRAM_BASE_URL and OPENAI_BASE_URL, and
+runs main_new() over a synthetic call list with a temporary call state
+database, watermark and transcript cache. Reports calls per minute, p50/p95
+per pipeline stage, peak RSS and the request and error counts of every fake.
+
+The fakes run in the same process, so peak RSS includes them; recordings are
+generated per download and not kept. By default recordings are OGG filler
+that Yandex gets as is; --mp3-seconds serves real MP3s (needs ffmpeg) to
+include the conversion step.
+
+--synthetic replaces the evenly spread calls with a realistic day from
+synthetic_calls.py (hourly profile, missed calls, scenario transcripts, OGG
+filler or MP3 sized by call duration); --scale X runs X times the baseline
+daily volume over a 24-hour window.
+
+Usage:
+    python benchmark_pipeline.py [--calls N] [--recording-kb KB] [--mp3-seconds S]
+        [--latency SECONDS] [--telphin-latency S] [--yandex-latency S]
+        [--openai-latency S] [--telegram-latency S] [--error-rate SHARE]
+        [--alert-share SHARE] [--window-hours H] [--synthetic] [--scale X] [--seed S] [--verbose]
+"""
+import io
+import os
+import sys
+import time
+import uuid
+import resource
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+
+import pytz
+
+import call_state
+import metrics
+import tracing
+import watermark
+import transcript_cache
+from fake_openai_server import FakeOpenAIServer
+from fake_services import (
+    FakeTelphinServer, FakeYandexServer, FakeTelegramServer, default_transcription, fake_recording
+)
+from synthetic_calls import generate_calls, baseline_calls_per_day
+from openai_scheduler import reset_scheduler
+from telegram_notifier import stop_notifier
+
+DEFAULTS = {
+    "calls": 100,
+    "recording_kb": 64,
+    "mp3_seconds": 0,
+    "latency": 0.05,
+    "telphin_latency": None,
+    "yandex_latency": None,
+    "openai_latency": 0.3,
+    "telegram_latency": None,
+    "error_rate": 0.0,
+    "alert_share": 0.3,
+    "window_hours": 6,
+    "synthetic": False,
+    "scale": None,
+    "seed": None,
+}
+
+FLAGS = ("verbose", "synthetic")
+INT_OPTIONS = ("calls", "seed")
+
+def make_calls(count, now_utc=None, window_hours=6, incoming_share=0.8, recorded_share=0.9):
+    """
+    Build Telphin-shaped call and CDR records spread evenly over the window.
+
+    Returns:
+        tuple: (calls: list, cdr_records: list)
+    """
+    now_utc = now_utc or datetime.now(pytz.UTC)
+    first = now_utc - timedelta(hours=window_hours) + timedelta(minutes=5)
+    step = (timedelta(hours=window_hours) - timedelta(minutes=10)) / max(1, count)
+    calls, cdr_records = [], []
+    for i in range(count):
+        call_uuid = str(uuid.uuid4())
+        start_time = (first + step * i).strftime("%Y-%m-%d %H:%M:%S")
+        flow = "in" if (i % 100) < incoming_share * 100 else "out"
+        calls.append({"call_uuid": call_uuid, "flow": flow, "result": "answered",
+                      "duration": 60 + i % 120, "start_time_gmt": start_time})
+        recorded = (i % 100) < recorded_share * 100
+        cdr_records.append({
+            "call_uuid": call_uuid, "flow": flow, "start_time_gmt": start_time,
+            "record_uuid": f"rec-{call_uuid}" if recorded else None,
+            "record_file_size": 1 if recorded else 0,
+        })
+    return calls, cdr_records
+
+def make_mp3(seconds):
+    """Encode a sine tone of the given length to MP3 with ffmpeg"""
+    result = subprocess.run([
+        'ffmpeg', '-v', 'quiet', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-ac', '1', '-b:a', '32k', '-f', 'mp3', 'pipe:1'
+    ], capture_output=True)
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError("ffmpeg could not encode the benchmark MP3")
+    return result.stdout
+
+def _percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def _peak_rss_mb():
+    # ru_maxrss - килобайты на Linux, байты на macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+@contextmanager
+def _isolated_state(tmp_dir, env):
+    """Point state files into tmp_dir and set env; restore everything afterwards"""
+    saved_attrs = {
+        (call_state, "CALL_STATE_DB"): os.path.join(tmp_dir, "call_state.db"),
+        (call_state, "LEGACY_PROCESSED_CALLS_FILE"): os.path.join(tmp_dir, "processed_calls.txt"),
+        (watermark, "WATERMARK_FILE"): os.path.join(tmp_dir, "polling_watermark.json"),
+        (transcript_cache, "TRANSCRIPT_CACHE_DIR"): os.path.join(tmp_dir, "transcript_cache"),
+    }
+    originals = {key: getattr(*key) for key in saved_attrs}
+    original_env = {name: os.environ.get(name) for name in env}
+    try:
+        for (module, name), value in saved_attrs.items():
+            setattr(module, name, value)
+        os.environ.update(env)
+        # Общие клиенты создаются заново - с адресами подставных сервисов
+        reset_scheduler()
+        stop_notifier()
+        metrics.reset_pending_metrics()
+        yield
+    finally:
+        stop_notifier()
+        reset_scheduler()
+        metrics.reset_pending_metrics()
+        for (module, name), value in originals.items():
+            setattr(module, name, value)
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def run_benchmark(call_records=None, cdr_records=None, recording=None, transcribe=None, verbose=False, **options):
+    """
+    Run one main_new() cycle against fresh fake services.
+
+    Args:
+        call_records, cdr_records (list): Telphin-shaped records; built by make_calls() if omitted
+        recording (callable): record_uuid -> audio bytes; OGG filler or MP3 per options if omitted
+        transcribe (callable): audio bytes -> transcript for Yandex and Whisper
+        verbose (bool): Show the analyzer output instead of discarding it
+        **options: Overrides of DEFAULTS
+
+    Returns:
+        dict: result, elapsed, calls_per_minute, stages, peak_rss_mb, services, messages,
+        expected_alerts (None unless synthetic)
+    """
+    import main
+
+    settings = {**DEFAULTS, **options}
+    if settings["scale"]:
+        settings["calls"] = int(baseline_calls_per_day() * settings["scale"])
+        settings["window_hours"] = options.get("window_hours", 24)
+
+    def latency(service):
+        value = settings[f"{service}_latency"]
+        return settings["latency"] if value is None else value
+
+    error_rate = settings["error_rate"]
+    telphin = FakeTelphinServer(latency=latency("telphin"), error_rate=error_rate)
+    expected_alerts = None
+    if call_records is None and settings["synthetic"]:
+        synthetic = generate_calls(settings["calls"], hours=settings["window_hours"], seed=settings["seed"],
+                                   storage_base_url=f"{telphin.base_url}/storage")
+        call_records, cdr_records = synthetic.calls, synthetic.cdr_records
+        if recording is None:
+            mp3_seconds = settings["mp3_seconds"]
+            recording = ((lambda record_uuid: synthetic.mp3_recording(record_uuid, mp3_seconds)) if mp3_seconds
+                         else synthetic.filler_recording)
+        transcribe = transcribe or synthetic.transcribe
+        expected_alerts = len(synthetic.expected_alerts)
+    elif call_records is None:
+        call_records, cdr_records = make_calls(settings["calls"], window_hours=settings["window_hours"])
+    if recording is None:
+        if settings["mp3_seconds"]:
+            mp3 = make_mp3(settings["mp3_seconds"])
+            # Хвост с UUID делает записи разными для кэша транскриптов
+            recording = lambda record_uuid: mp3 + record_uuid.encode("utf-8")
+        else:
+            size = int(settings["recording_kb"] * 1024)
+            recording = lambda record_uuid: fake_recording(record_uuid, size)
+    if transcribe is None:
+        transcribe = lambda audio_data: default_transcription(audio_data, settings["alert_share"])
+
+    yandex = FakeYandexServer(transcribe=transcribe, latency=latency("yandex"), error_rate=error_rate)
+    telegram = FakeTelegramServer(latency=latency("telegram"), error_rate=error_rate)
+    openai_server = FakeOpenAIServer(latency=latency("openai"), error_rate=error_rate, transcribe=transcribe)
+    telphin.load(call_records, cdr_records, recording)
+
+    env = {
+        "TELFIN_HOSTNAME": "telphin.benchmark.local",
+        "TELFIN_LOGIN": "benchmark",
+        "TELFIN_PASSWORD": "benchmark",
+        "TELFIN_BASE_URL": telphin.base_url,
+        "TELFIN_TOKEN_CACHE_FILE": "",
+        "YANDEX_API_KEY": "benchmark",
+        "YANDEX_STT_URL": yandex.recognize_url,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": openai_server.base_url,
+        "TELEGRAM_BOT_TOKEN": "123456:benchmark",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_BASE_URL": telegram.bot_api_url,
+        # Интервал чата измерял бы Telegram, а не конвейер
+        "TELEGRAM_CHAT_INTERVAL_SECONDS": "0",
+        "TIME_WINDOW_HOURS": str(settings["window_hours"]),
+    }
+    log_level = tracing.logger.level
+    with tempfile.TemporaryDirectory() as tmp_dir, telphin, yandex, telegram, openai_server:
+        with _isolated_state(tmp_dir, env):
+            if not verbose:
+                tracing.set_log_level("ERROR")
+            rss_before = _peak_rss_mb()
+            started = time.perf_counter()
+            try:
+                with redirect_stdout(sys.stdout if verbose else io.StringIO()):
+                    result = main.main_new()
+            finally:
+                tracing.logger.setLevel(log_level)
+            elapsed = time.perf_counter() - started
+            timings = tracing.get_stage_timings()
+            messages = telegram.messages
+
+    processed = (result or {}).get('processed', 0)
+    return {
+        "result": result,
+        "elapsed": elapsed,
+        "calls_per_minute": processed / elapsed * 60 if elapsed else 0.0,
+        "stages": {stage: {"count": len(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95)}
+                   for stage, values in timings.items() if values},
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_before_mb": rss_before,
+        "services": {
+            "telphin": telphin.stats,
+            "yandex": yandex.stats,
+            "openai": {"requests": openai_server.httpd.requests, "errors": openai_server.httpd.errors},
+            "telegram": telegram.stats,
+        },
+        "messages": len(messages),
+        "expected_alerts": expected_alerts,
+    }
+
+def format_report(report):
+    """Return the benchmark report as text"""
+    result = report["result"] or {}
+    expected = "" if report.get("expected_alerts") is None else f" (scripted: {report['expected_alerts']})"
+    lines = [
+        f"Cycle: {report['elapsed']:.1f}s, new calls {result.get('new_calls', 0)}, "
+        f"processed {result.get('processed', 0)}, alerts {result.get('alerts', 0)}{expected}",
+        f"Throughput: {report['calls_per_minute']:.1f} calls/min",
+        f"Peak RSS: {report['peak_rss_mb']:.1f} MB (before the cycle {report['rss_before_mb']:.1f} MB)",
+        f"{'stage':<12}{'count':>7}{'p50':>9}{'p95':>9}",
+    ]
+    order = [stage for stage in tracing.STAGES + ("call",) if stage in report["stages"]]
+    order += sorted(stage for stage in report["stages"] if stage not in order)
+    for stage in order:
+        row = report["stages"][stage]
+        lines.append(f"{stage:<12}{row['count']:>7}{row['p50']:>8.3f}s{row['p95']:>8.3f}s")
+    for name, stats in report["services"].items():
+        lines.append(f"{name}: {stats['requests']} requests, {stats['errors']} injected errors")
+    return "\n".join(lines)
+
+def parse_options(args):
+    """Parse --name value pairs and --flags into DEFAULTS overrides"""
+    options = {"verbose": False}
+    args = list(args)
+    for flag in FLAGS:
+        if f"--{flag}" in args:
+            args.remove(f"--{flag}")
+            options[flag] = True
+    if len(args) % 2:
+        raise ValueError(f"Missing value for {args[-1]}")
+    for flag, value in zip(args[::2], args[1::2]):
+        name = flag.lstrip("-").replace("-", "_")
+        if not flag.startswith("--") or name not in DEFAULTS or name in FLAGS:
+            raise ValueError(f"Unknown option {flag}")
+        options[name] = int(value) if name in INT_OPTIONS else float(value)
+    return options
+
+def main():
+    try:
+        options = parse_options(sys.argv[1:])
+    except ValueError as e:
+        print(f"Error: {e}")
+        print(__doc__)
+        sys.exit(1)
+    if options.get("scale"):
+        calls = int(baseline_calls_per_day() * options["scale"])
+    else:
+        calls = options.get("calls", DEFAULTS["calls"])
+    print(f"🏁 Benchmarking one cycle over {calls} calls against local fakes...")
+    report = run_benchmark(**options)
+    print(format_report(report))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Local pre-filter in front of the GPT analysis.
+
+The analysis prompt only alerts on FAILED_SALE + MANAGER_FAULT calls; calls
+that are clearly SUCCESS_SALE, LOGISTICS or OTHER are answered with
+{"status": "ignore"} anyway. This module recognizes those calls from the call
+result, duration, transcript length and a Russian keyword lexicon, so only
+plausible failed sales are sent to the model. Any sign of a lost sale always
+sends the call to the model: the filter trades precision for recall.
+"""
+import os
+import re
+
+# Признаки сорвавшейся продажи - при любом совпадении звонок уходит в модель
+FAILURE_PATTERNS = [
+    r'перезвон\w*',
+    r'подума\w+',
+    r'не надо',
+    r'не нужно',
+    r'откаж\w+|отказыва\w+',
+    r'дорог\w*',
+    r'нет в наличии|нету в наличии|в наличии \w+ нет\w*|закончил\w+',
+    r'не успе\w+',
+    r'не (можем|сможем|получится)',
+    r'к сожалению',
+    r'в другом месте|в другой магазин',
+]
+
+# Интерес к покупке
+PURCHASE_PATTERNS = [
+    r'букет\w*',
+    r'цвет(ы|ов|ами|очк\w*)',
+    r'роз(ы|а|у|ами|ов)?\b',
+    r'тюльпан\w*|пион\w*|хризантем\w*|гортенз\w*|орхиде\w*',
+    r'купить|куплю|приобрести',
+    r'хочу|хотел\w*|хотим',
+    r'сколько стоит|стоимост\w+|цен(а|у|ы|е)\b|почем',
+    r'в наличии',
+    r'можно (ли )?(заказать|собрать|сделать)',
+    r'заказать',
+]
+
+# Доставка, курьер, адрес, статус уже оформленного заказа
+LOGISTICS_PATTERNS = [
+    r'доставк\w+|доставит\w*|доставил\w*',
+    r'курьер\w*',
+    r'адрес\w*',
+    r'привез\w+|привоз\w+',
+    r'(где|когда) (мой |наш )?заказ',
+    r'(статус|номер\w*) заказа',
+    r'получател\w+',
+    r'уже оплатил\w*|оплатил\w* заказ',
+]
+
+# Подтверждение оформленного заказа
+CONFIRMATION_PATTERNS = [
+    r'спасибо (вам )?(за заказ|за покупку)',
+    r'заказ (оформлен|принят|создан)',
+    r'оформ(ил|ила|или|им|ляю|лю) (вам |ваш )?заказ',
+    r'реквизит\w*',
+    r'ссылк\w* (на|для) оплат\w*',
+    r'номер карты',
+]
+
+def _compile(patterns):
+    return [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+FAILURE_RE = _compile(FAILURE_PATTERNS)
+PURCHASE_RE = _compile(PURCHASE_PATTERNS)
+LOGISTICS_RE = _compile(LOGISTICS_PATTERNS)
+CONFIRMATION_RE = _compile(CONFIRMATION_PATTERNS)
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def _matches(compiled, text):
+    """Return the matched phrases of all patterns found in text"""
+    found = []
+    for regex in compiled:
+        match = regex.search(text)
+        if match:
+            found.append(match.group(0))
+    return found
+
+def prefilter_call(transcript, call_info=None):
+    """
+    Decide whether a transcribed call needs the GPT analysis.
+
+    Thresholds: PREFILTER_MIN_DURATION_SECONDS (default 10) and
+    PREFILTER_MIN_WORDS (default 12).
+
+    Args:
+        transcript (str): Transcribed text of the call
+        call_info (dict): Optional call metadata (duration, result, ...)
+
+    Returns:
+        dict: {"send_to_llm": bool, "category": str, "reason": str}
+    """
+    call_info = call_info or {}
+    text = (transcript or "").replace('ё', 'е').replace('Ё', 'Е')
+
+    def decision(send_to_llm, category, reason):
+        return {"send_to_llm": send_to_llm, "category": category, "reason": reason}
+
+    result = call_info.get('result')
+    if result and result != 'answered':
+        return decision(False, "OTHER", f"call result is '{result}'")
+
+    duration = call_info.get('duration') or 0
+    min_duration = _env_float("PREFILTER_MIN_DURATION_SECONDS", "10")
+    if 0 < duration < min_duration:
+        return decision(False, "OTHER", f"call lasted {duration}s (< {min_duration:g}s)")
+
+    word_count = len(re.findall(r'\w+', text))
+    min_words = _env_float("PREFILTER_MIN_WORDS", "12")
+    if word_count < min_words:
+        return decision(False, "OTHER", f"transcript has {word_count} words (< {min_words:g})")
+
+    failure = _matches(FAILURE_RE, text)
+    if failure:
+        return decision(True, "FAILED_SALE", f"failure signals: {', '.join(failure)}")
+
+    confirmation = _matches(CONFIRMATION_RE, text)
+    if confirmation:
+        return decision(False, "SUCCESS_SALE", f"order confirmed: {', '.join(confirmation)}")
+
+    purchase = _matches(PURCHASE_RE, text)
+    logistics = _matches(LOGISTICS_RE, text)
+    if len(logistics) >= 2 and len(purchase) <= 1:
+        return decision(False, "LOGISTICS", f"logistics: {', '.join(logistics)}")
+
+    if not purchase:
+        return decision(False, "OTHER", "no purchase intent")
+
+    return decision(True, "FAILED_SALE", f"purchase intent without confirmation: {', '.join(purchase)}")
+
+def evaluate_prefilter(cases):
+    """
+    Measure the pre-filter against labelled calls.
+
+    A call labelled FAILED_SALE is a positive: it must be sent to the model.
+
+    Args:
+        cases (list): Dicts with label, transcript and optional duration/result
+
+    Returns:
+        dict: tp, fp, fn, tn, precision, recall, skip_rate and per-case decisions
+    """
+    counts = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    decisions = []
+    for case in cases:
+        result = prefilter_call(case['transcript'], case)
+        positive = case['label'] == "FAILED_SALE"
+        if result['send_to_llm']:
+            counts["tp" if positive else "fp"] += 1
+        else:
+            counts["fn" if positive else "tn"] += 1
+        decisions.append((case, result))
+
+    sent = counts["tp"] + counts["fp"]
+    positives = counts["tp"] + counts["fn"]
+    return {
+        **counts,
+        "precision": counts["tp"] / sent if sent else 1.0,
+        "recall": counts["tp"] / positives if positives else 1.0,
+        "skip_rate": (counts["fn"] + counts["tn"]) / len(cases) if cases else 0.0,
+        "decisions": decisions,
+    }
@@ -0,0 +1,236 @@
+"""
+SQLite-backed call state store (replaces processed_calls.txt).
+
+One row per call_uuid with status, timestamps, attempt count and last error.
+The database runs in WAL mode so the worker can write while other processes
+read. Rows older than CALL_STATE_RETENTION_DAYS are pruned by time.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+CALL_STATE_DB = os.environ.get("CALL_STATE_DB", "call_state.db")
+LEGACY_PROCESSED_CALLS_FILE = "processed_calls.txt"
+
+# Максимум параметров в одном IN (...) - ниже лимита SQLite
+LOOKUP_BATCH_SIZE = 500
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_uuid TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_calls_updated_at ON calls (updated_at);
+CREATE TABLE IF NOT EXISTS analyses (
+    call_uuid TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    model TEXT,
+    result TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def get_connection():
+    """
+    Get the SQLite connection of the current thread, creating the schema on first use.
+
+    Returns:
+        sqlite3.Connection: Connection to CALL_STATE_DB
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(CALL_STATE_DB)
+    if conn is None:
+        conn = sqlite3.connect(CALL_STATE_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[CALL_STATE_DB] = conn
+
+        with _init_lock:
+            if CALL_STATE_DB not in _initialized_paths:
+                conn.executescript(SCHEMA)
+                _import_legacy_file(conn)
+                _initialized_paths.add(CALL_STATE_DB)
+    return conn
+
+def _import_legacy_file(conn, path=None):
+    """One-time import of call IDs from the old processed_calls.txt"""
+    path = path or LEGACY_PROCESSED_CALLS_FILE
+    row = conn.execute("SELECT value FROM meta WHERE key = 'legacy_import_done'").fetchone()
+    if row:
+        return
+
+    imported = 0
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                call_ids = [line.strip() for line in f if line.strip()]
+            now = time.time()
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO calls (call_uuid, status, first_seen, updated_at, attempts) "
+                "VALUES (?, 'imported', ?, ?, 0)",
+                [(call_id, now, now) for call_id in call_ids]
+            )
+            conn.execute("COMMIT")
+            imported = len(call_ids)
+        except Exception as e:
+            print(f"Error importing {path}: {e}")
+            return
+
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_import_done', ?)", (str(imported),))
+    if imported:
+        print(f"✅ Imported {imported} call IDs from {path} into {CALL_STATE_DB}")
+
+def mark_call(call_uuid, status, error=None):
+    """
+    Insert or update the state of a call.
+
+    Args:
+        call_uuid (str): Call ID
+        status (str): Processing status ("processing", "analyzed_ignore", "critical_alert_sent", ...)
+        error (str): Optional error message for failed statuses
+    """
+    now = time.time()
+    attempt = 1 if status == "processing" else 0
+    get_connection().execute(
+        """
+        INSERT INTO calls (call_uuid, status, first_seen, updated_at, attempts, error)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(call_uuid) DO UPDATE SET
+            status = excluded.status,
+            updated_at = excluded.updated_at,
+            attempts = calls.attempts + excluded.attempts,
+            error = excluded.error
+        """,
+        (call_uuid, status, now, now, attempt, error)
+    )
+
+def get_call(call_uuid):
+    """
+    Get the stored state of one call.
+
+    Returns:
+        dict: Row as dict, None if the call is unknown
+    """
+    conn = get_connection()
+    cursor = conn.execute(
+        "SELECT call_uuid, status, first_seen, updated_at, attempts, error FROM calls WHERE call_uuid = ?",
+        (call_uuid,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+def get_statuses(call_uuids):
+    """
+    Batch lookup of call statuses.
+
+    Args:
+        call_uuids (iterable): Call IDs to look up
+
+    Returns:
+        dict: call_uuid -> status for known calls
+    """
+    call_uuids = [call_uuid for call_uuid in call_uuids if call_uuid]
+    statuses = {}
+    conn = get_connection()
+    for start in range(0, len(call_uuids), LOOKUP_BATCH_SIZE):
+        chunk = call_uuids[start:start + LOOKUP_BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        for call_uuid, status in conn.execute(
+            f"SELECT call_uuid, status FROM calls WHERE call_uuid IN ({placeholders})", chunk
+        ):
+            statuses[call_uuid] = status
+    return statuses
+
+def annotate_known_calls(calls, batch_size=200):
+    """
+    Attach stored statuses to a stream of calls with one lookup per batch.
+
+    Args:
+        calls (iterable): Call records with call_uuid
+        batch_size (int): Calls per lookup
+
+    Yields:
+        tuple: (call, status or None)
+    """
+    batch = []
+    for call in calls:
+        batch.append(call)
+        if len(batch) >= batch_size:
+            yield from _annotate_batch(batch)
+            batch = []
+    if batch:
+        yield from _annotate_batch(batch)
+
+def _annotate_batch(batch):
+    statuses = get_statuses(call.get('call_uuid') for call in batch)
+    for call in batch:
+        yield call, statuses.get(call.get('call_uuid'))
+
+def save_analysis(call_uuid, result, source, model=None):
+    """
+    Store the analysis result of a call, e.g. from a batch backfill.
+
+    Args:
+        call_uuid (str): Call ID
+        result (dict): Parsed analysis JSON
+        source (str): Where the result comes from, e.g. "batch:<batch_id>"
+        model (str): Model that produced the result
+    """
+    get_connection().execute(
+        "INSERT OR REPLACE INTO analyses (call_uuid, source, model, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+        (call_uuid, source, model, json.dumps(result, ensure_ascii=False), time.time())
+    )
+
+def get_analysis(call_uuid):
+    """
+    Get the stored analysis of a call.
+
+    Returns:
+        dict: {"source", "model", "result", "updated_at"}, None if there is none
+    """
+    row = get_connection().execute(
+        "SELECT source, model, result, updated_at FROM analyses WHERE call_uuid = ?", (call_uuid,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"source": row[0], "model": row[1], "result": json.loads(row[2]), "updated_at": row[3]}
+
+def load_call_ids():
+    """Return the set of all stored call IDs"""
+    return {row[0] for row in get_connection().execute("SELECT call_uuid FROM calls")}
+
+def prune_calls(retention_days=None):
+    """
+    Delete call rows not updated for longer than the retention period.
+
+    Args:
+        retention_days (float): Defaults to CALL_STATE_RETENTION_DAYS (30)
+
+    Returns:
+        int: Number of deleted rows
+    """
+    if retention_days is None:
+        retention_days = float(os.environ.get("CALL_STATE_RETENTION_DAYS", "30"))
+    cutoff = time.time() - retention_days * 86400
+    cursor = get_connection().execute("DELETE FROM calls WHERE updated_at < ?", (cutoff,))
+    return cursor.rowcount
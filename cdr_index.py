@@ -0,0 +1,55 @@
+"""
+Per-cycle index of Telphin CDR records.
+
+The CDR list is fetched once per processing cycle and every lookup
+(has_recording, download_recording, filtering) is served from memory.
+"""
+
+
+class CDRIndex:
+    """In-memory index of CDR records keyed by call_uuid and record_uuid"""
+
+    def __init__(self):
+        self.by_call_uuid = {}
+        self.by_record_uuid = {}
+        self.request_count = 0
+
+    def add_records(self, cdr_records):
+        """
+        Add a page of CDR records to the index.
+
+        Args:
+            cdr_records (list): CDR records as returned by the /cdr/ endpoint
+        """
+        for cdr_record in cdr_records:
+            call_uuid = cdr_record.get('call_uuid')
+            record_uuid = cdr_record.get('record_uuid')
+
+            if call_uuid:
+                existing = self.by_call_uuid.get(call_uuid)
+                # Один звонок может иметь несколько CDR-записей (переводы, плечи) -
+                # предпочитаем ту, у которой есть запись разговора
+                if not existing or (existing.get('record_file_size') or 0) < (cdr_record.get('record_file_size') or 0):
+                    self.by_call_uuid[call_uuid] = cdr_record
+            if record_uuid:
+                self.by_record_uuid[record_uuid] = cdr_record
+
+    def get(self, call_uuid):
+        """Return CDR record for a call_uuid or None"""
+        return self.by_call_uuid.get(call_uuid)
+
+    def has_recording(self, call_uuid):
+        """
+        Check if indexed CDR shows a recording for the call.
+
+        Returns:
+            tuple: (has_recording: bool, file_size: int)
+        """
+        cdr_record = self.get(call_uuid)
+        record_file_size = (cdr_record.get('record_file_size') or 0) if cdr_record else 0
+        if record_file_size > 0:
+            return True, record_file_size
+        return False, 0
+
+    def __len__(self):
+        return len(self.by_call_uuid)
@@ -0,0 +1,150 @@
+"""
+Long-running worker mode: `python main.py daemon`.
+
+Instead of one processing cycle per process start, the daemon runs cycles in
+a loop and keeps the Telphin token, HTTP sessions, the OpenAI client, the
+Telegram sender, prompts and caches warm between them. The pause between
+cycles adapts to the load: short right after a cycle that found new calls,
+longer when idle (doubling up to 4x), and longer outside Moscow business
+hours. SIGTERM or SIGINT lets in-flight calls finish, leaves not yet started
+calls for the next run and then exits.
+"""
+import os
+import time
+import signal
+import threading
+from datetime import datetime, timedelta
+import pytz
+
+from main_backup import MOSCOW_TZ
+from prompt_loader import prompt_loader
+from openai_scheduler import reset_scheduler
+from telegram_notifier import stop_notifier
+
+# Во сколько раз растёт пауза, пока циклы не находят звонков
+MAX_IDLE_BACKOFF = 4
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def get_business_hours():
+    """
+    Parse DAEMON_BUSINESS_HOURS ("9-21" by default, Moscow time).
+
+    Returns:
+        tuple: (start_hour: int, end_hour: int)
+    """
+    try:
+        start, end = os.environ.get("DAEMON_BUSINESS_HOURS", "9-21").split("-")
+        return int(start), int(end)
+    except ValueError:
+        return 9, 21
+
+def is_business_hours(now_utc=None):
+    """True if the Moscow time of now_utc falls into DAEMON_BUSINESS_HOURS"""
+    now_utc = now_utc or datetime.now(pytz.UTC)
+    start, end = get_business_hours()
+    return start <= now_utc.astimezone(MOSCOW_TZ).hour < end
+
+def _seconds_until_business_hours(now_utc):
+    start, _ = get_business_hours()
+    now_moscow = now_utc.astimezone(MOSCOW_TZ)
+    opening = now_moscow.replace(hour=start, minute=0, second=0, microsecond=0)
+    if opening <= now_moscow:
+        opening += timedelta(days=1)
+    return (opening - now_moscow).total_seconds()
+
+def get_poll_interval(idle_cycles, now_utc=None):
+    """
+    Compute the pause before the next cycle.
+
+    Settings: DAEMON_POLL_ACTIVE_SECONDS (default 20) after a cycle with new
+    calls, DAEMON_POLL_BUSINESS_SECONDS (60) and DAEMON_POLL_OFF_HOURS_SECONDS
+    (300) as the idle base, DAEMON_POLL_MAX_SECONDS (900) as the upper limit.
+
+    Args:
+        idle_cycles (int): Consecutive cycles without new calls, 0 if the last one found calls
+        now_utc (datetime): Current aware UTC time, for tests
+
+    Returns:
+        float: Seconds to wait
+    """
+    now_utc = now_utc or datetime.now(pytz.UTC)
+    if idle_cycles <= 0:
+        return _env_float("DAEMON_POLL_ACTIVE_SECONDS", "20")
+
+    business = is_business_hours(now_utc)
+    base = _env_float("DAEMON_POLL_BUSINESS_SECONDS" if business else "DAEMON_POLL_OFF_HOURS_SECONDS",
+                      "60" if business else "300")
+    interval = min(base * 2 ** (idle_cycles - 1), base * MAX_IDLE_BACKOFF, _env_float("DAEMON_POLL_MAX_SECONDS", "900"))
+    if not business:
+        # Утром не досыпаем длинную ночную паузу
+        interval = min(interval, max(1.0, _seconds_until_business_hours(now_utc)))
+    return interval
+
+def _prompts_signature():
+    """Modification times of the prompt files, to reload prompts only after edits"""
+    try:
+        return sorted((path.name, path.stat().st_mtime) for path in prompt_loader.prompts_dir.glob("*.txt"))
+    except OSError:
+        return None
+
+def run_daemon(cycle, stop_event=None):
+    """
+    Run processing cycles until SIGTERM / SIGINT.
+
+    Args:
+        cycle (callable): cycle(stop_event=...) runs one processing cycle and returns
+            a summary dict with "new_calls", or None if the cycle could not run
+        stop_event (threading.Event): Set to stop the daemon, created if not given
+
+    Returns:
+        int: Number of completed cycles
+    """
+    stop_event = stop_event or threading.Event()
+
+    def handle_signal(signum, frame):
+        if stop_event.is_set():
+            # Второй Ctrl+C - выходим, не дожидаясь звонков в работе
+            raise KeyboardInterrupt
+        print(f"🛑 Received {signal.Signals(signum).name}, finishing in-flight calls before exit...")
+        stop_event.set()
+
+    previous_handlers = {signum: signal.signal(signum, handle_signal) for signum in (signal.SIGTERM, signal.SIGINT)}
+    print("=== 🔁 Daemon mode: polling Telphin continuously ===")
+    cycles = 0
+    idle_cycles = 0
+    prompts_signature = _prompts_signature()
+    try:
+        while not stop_event.is_set():
+            started = time.monotonic()
+            try:
+                summary = cycle(stop_event=stop_event)
+            except Exception as e:
+                print(f"❌ Processing cycle failed: {e}")
+                summary = None
+            cycles += 1
+
+            idle_cycles = 0 if summary and summary.get("new_calls") else idle_cycles + 1
+            if stop_event.is_set():
+                break
+            interval = get_poll_interval(idle_cycles)
+            print(f"💤 Cycle {cycles} took {time.monotonic() - started:.1f}s, next poll in {interval:.0f}s")
+            stop_event.wait(interval)
+
+            # Правки промптов подхватываются без перезапуска
+            signature = _prompts_signature()
+            if signature != prompts_signature and not stop_event.is_set():
+                prompt_loader.reload_prompts()
+                prompts_signature = signature
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        # Неотправленные алерты остаются в outbox до следующего запуска
+        stop_notifier()
+        reset_scheduler()
+        print(f"👋 Daemon stopped after {cycles} cycles")
+    return cycles
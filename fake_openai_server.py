@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI API, for offline tests and dry runs.
+
+Implements the parts the analyzer uses: chat completions (also streamed as
+server-sent events), Whisper transcriptions, file upload and download, and
+batches. Answers are
+produced by a keyword rule instead of a model: transcripts that mention a
+callback ("перезвон") get an alert, all others {"status": "ignore"}. With a
+json_schema response_format the answer is shaped like structured outputs:
+triage schemas get a category, missing required properties are null.
+Batches move validating -> in_progress -> completed over successive polls.
+For benchmarks, chat and transcription requests can be delayed by a random
+latency around `latency` seconds and answered with a 500 at `error_rate`.
+
+Usage:
+    python fake_openai_server.py [port]
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 OPENAI_API_KEY=test python batch_analysis.py run ...
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ALERT_RESPONSE = {
+    "status": "alert",
+    "error_code": "M3",
+    "error_description": "Менеджер обещал перезвонить вместо оформления заказа",
+    "client_wanted": "Букет",
+    "price_mentioned": None,
+    "context": "Клиент был готов купить",
+    "solution": "Оформить заказ во время звонка"
+}
+
+# Размер кусков, которыми отдаётся потоковый ответ
+STREAM_CHUNK_CHARS = 8
+
+def fake_analysis(messages, response_format=None):
+    """Deterministic stand-in for the model answer"""
+    text = " ".join(message.get("content", "") for message in messages if message.get("role") == "user")
+    lost_sale = "перезвон" in text.lower()
+    schema = ((response_format or {}).get("json_schema") or {}).get("schema") or {}
+    properties = schema.get("properties", {})
+    if "category" in properties:
+        answer = ({"category": "FAILED_SALE", "responsibility": "MANAGER_FAULT"} if lost_sale
+                  else {"category": "OTHER", "responsibility": "NONE"})
+    else:
+        answer = dict(ALERT_RESPONSE) if lost_sale else {"status": "ignore"}
+    for name in schema.get("required", []):
+        answer.setdefault(name, None)
+    if not schema:
+        answer = {key: value for key, value in answer.items() if value is not None}
+    return json.dumps(answer, ensure_ascii=False)
+
+def _usage(body, content):
+    prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": prompt_tokens + len(content) // 4,
+        "prompt_tokens_details": {"cached_tokens": 0}
+    }
+
+def chat_completion_chunks(body):
+    """Build the chat.completion.chunk objects of a streamed answer"""
+    content = fake_analysis(body.get("messages", []), body.get("response_format"))
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model", "gpt-4o")}
+    chunks = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        chunks.append(dict(base, choices=[{
+            "index": 0, "delta": {"content": content[start:start + STREAM_CHUNK_CHARS]}, "finish_reason": None
+        }]))
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    if (body.get("stream_options") or {}).get("include_usage"):
+        chunks.append(dict(base, choices=[], usage=_usage(body, content)))
+    return chunks
+
+def chat_completion(body):
+    """Build a chat.completion object for a request body"""
+    content = fake_analysis(body.get("messages", []), body.get("response_format"))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(body, content)
+    }
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler; state lives on the server object"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, chunks):
+        """Send chunks as server-sent events; the client may hang up early"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for chunk in chunks:
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.closed_streams += 1
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _inject_fault(self):
+        """Simulate service latency and failures; True if an error was sent"""
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.server.error_rate:
+            with self.server.lock:
+                self.server.errors += 1
+            self._send_json({"error": {"message": "Injected server error", "type": "server_error"}}, 500)
+            return True
+        return False
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path in ("/v1/chat/completions", "/v1/audio/transcriptions") and self._inject_fault():
+            return
+        if self.path == "/v1/chat/completions":
+            params = json.loads(body)
+            if params.get("stream"):
+                self._send_events(chat_completion_chunks(params))
+            else:
+                self._send_json(chat_completion(params))
+        elif self.path == "/v1/audio/transcriptions":
+            _, content = self._parse_form(body).get("file", (None, b""))
+            self._send_json({"text": self.server.transcribe(content)})
+        elif self.path == "/v1/files":
+            self._send_json(self._upload_file(body))
+        elif self.path == "/v1/batches":
+            self._send_json(self._create_batch(json.loads(body)))
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+    def do_GET(self):
+        files = self.server.files
+        if self.path.startswith("/v1/batches/"):
+            batch = self._advance_batch(self.path.rsplit("/", 1)[-1])
+            if batch:
+                self._send_json(batch)
+                return
+        elif self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+            file_id = self.path.split("/")[3]
+            if file_id in files:
+                content = files[file_id]["content"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.wfile.write(content)
+                return
+        self._send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+    def _store_file(self, content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        with self.server.lock:
+            self.server.files[file_id] = {"content": content, "filename": filename, "purpose": purpose}
+        return {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"
+        }
+
+    def _parse_form(self, body):
+        """Parse a multipart/form-data body into {name: (filename, content)}"""
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            fields[part.get_param("name", header="content-disposition")] = (
+                part.get_filename(), part.get_payload(decode=True)
+            )
+        return fields
+
+    def _upload_file(self, body):
+        fields = self._parse_form(body)
+        filename, content = fields.get("file", ("upload.jsonl", b""))
+        purpose = (fields.get("purpose", (None, b"batch"))[1] or b"batch").decode("utf-8")
+        return self._store_file(content, filename or "upload.jsonl", purpose)
+
+    def _create_batch(self, params):
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": params["endpoint"],
+            "input_file_id": params["input_file_id"], "completion_window": params.get("completion_window", "24h"),
+            "status": "validating", "created_at": int(time.time()), "output_file_id": None,
+            "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        with self.server.lock:
+            self.server.batches[batch_id] = batch
+        return batch
+
+    def _advance_batch(self, batch_id):
+        """Each poll moves the batch one step further, the last step writes the output file"""
+        with self.server.lock:
+            batch = self.server.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch["status"] == "validating":
+                batch["status"] = "in_progress"
+                return dict(batch)
+            if batch["status"] != "in_progress":
+                return dict(batch)
+            input_content = self.server.files[batch["input_file_id"]]["content"]
+
+        output_lines = []
+        for line in input_content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output_lines.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": chat_completion(request["body"])},
+                "error": None
+            }, ensure_ascii=False))
+        output_file = self._store_file("\n".join(output_lines).encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+
+        with self.server.lock:
+            batch.update({
+                "status": "completed", "output_file_id": output_file["id"], "completed_at": int(time.time()),
+                "request_counts": {"total": len(output_lines), "completed": len(output_lines), "failed": 0}
+            })
+            return dict(batch)
+
+def default_transcription(audio_data):
+    """Whisper stand-in: the same text for every recording"""
+    return "Здравствуйте, хочу заказать букет. Хорошо, я вам перезвоню."
+
+class FakeOpenAIServer:
+    """
+    Runs the stand-in API on a background thread.
+
+    Args:
+        latency (float): Mean delay of chat and transcription requests in seconds
+        error_rate (float): Share of those requests answered with a 500
+        transcribe (callable): audio bytes -> text for /v1/audio/transcriptions
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, transcribe=None):
+        self.httpd = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.files = {}
+        self.httpd.batches = {}
+        self.httpd.closed_streams = 0
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.transcribe = transcribe or default_transcription
+        self.httpd.requests = 0
+        self.httpd.errors = 0
+        self.httpd.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = FakeOpenAIServer(port=port)
+    print(f"🧪 Fake OpenAI API on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
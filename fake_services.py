@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for Telphin, Yandex SpeechKit and the Telegram Bot API.
+
+Together with fake_openai_server.py they let the whole processing cycle run
+offline: point TELFIN_BASE_URL, YANDEX_STT_URL, TELEGRAM_BASE_URL and
+OPENAI_BASE_URL at them (benchmark_pipeline.py does this). Every service
+delays each request by a random latency around `latency` seconds and fails
+an `error_rate` share of them with a retryable status (503 for Telphin and
+Yandex, 429 with retry_after for Telegram), so retries and backoff are part
+of the measurement. Recordings are produced on request by a callable, so
+payload size is up to the caller and large recordings are not kept in memory.
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FAKE_TELPHIN_TOKEN = "fake-telphin-token"
+
+# Шаблоны для stand-in распознавания: часть звонков с "перезвоню" даёт алерт
+TRANSCRIPTS = (
+    "Здравствуйте, магазин цветов. Хочу заказать букет из роз на завтра. "
+    "Сейчас уточню наличие, я вам перезвоню через пять минут.",
+    "Добрый день. Подскажите, доставка в субботу возможна? Да, оформляем заказ, "
+    "букет будет у вас к обеду, оплата курьеру.",
+    "Алло, я по поводу заказа, который сделала вчера. Всё получили, спасибо, "
+    "цветы очень понравились.",
+)
+
+def default_transcription(audio_data, alert_share=0.3):
+    """
+    Pick a transcript for a recording: deterministic by content, so a retried
+    request gets the same text; alert_share of recordings mention a callback.
+    The order number keeps transcripts of different recordings distinct, so
+    the analysis cache does not turn the benchmark into cache hits.
+    """
+    digest = hashlib.sha1(audio_data).hexdigest()
+    bucket = int(digest[:8], 16) % 1000 / 1000
+    if bucket < alert_share:
+        template = TRANSCRIPTS[0]
+    else:
+        template = TRANSCRIPTS[1 + int(digest[8:12], 16) % (len(TRANSCRIPTS) - 1)]
+    return f"{template} Номер заказа {int(digest[12:18], 16) % 1000000}."
+
+def fake_recording(record_uuid, size_bytes=64 * 1024):
+    """
+    OGG-tagged filler of a given size, unique per recording.
+
+    The analyzer sends non-MP3 recordings to Yandex as is, so this exercises
+    download and transcription without ffmpeg; use generated MP3s to include
+    the conversion step.
+    """
+    header = b"OggS" + record_uuid.encode("utf-8")
+    return header + b"\0" * max(0, size_bytes - len(header))
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    """Shared plumbing; state, latency and error rate live on the server object"""
+    protocol_version = "HTTP/1.1"
+    error_status = 503
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_bytes(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200, headers=None):
+        self._send_bytes(json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", status, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send_error_response(self):
+        self._send_json({"error": "Injected failure"}, self.error_status)
+
+    def _inject_fault(self):
+        """Simulate service latency and failures; True if an error was sent"""
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            self._send_error_response()
+            return True
+        return False
+
+class FakeTelphinHandler(_FakeHandler):
+    """OAuth token, paged /calls/ and /cdr/, recording downloads"""
+
+    def _authorized(self):
+        if self.headers.get("Authorization") == f"Bearer {FAKE_TELPHIN_TOKEN}":
+            return True
+        self._send_json({"error": "invalid_token"}, 401)
+        return False
+
+    def do_POST(self):
+        self._read_body()
+        if self._inject_fault():
+            return
+        if self.path == "/oauth/token":
+            self._send_json({"access_token": FAKE_TELPHIN_TOKEN, "token_type": "bearer", "expires_in": 3600})
+        else:
+            self._send_json({"error": f"Unknown path {self.path}"}, 404)
+
+    def do_GET(self):
+        if self._inject_fault() or not self._authorized():
+            return
+        parts = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        path = parts.path.rstrip("/")
+
+        if path.endswith("/calls"):
+            page, total = self._page(self.server.calls, query)
+            self._send_json({"calls": page, "total": total})
+        elif path.endswith("/cdr"):
+            page, _ = self._page(self.server.cdr, query)
+            self._send_json({"cdr": page})
+        elif "/record/" in path or path.startswith("/storage/"):
+            self._send_recording(path.rsplit("/", 1)[-1])
+        else:
+            self._send_json({"error": f"Unknown path {self.path}"}, 404)
+
+    def _page(self, records, query):
+        """Records of the requested time window and page, and the window total"""
+        start, end = query.get("start_datetime", ""), query.get("end_datetime", "9999")
+        in_window = [record for record in records if start <= (record.get("start_time_gmt") or "") <= end]
+        per_page = int(query.get("per_page", 100))
+        page = int(query.get("page", 1))
+        return in_window[(page - 1) * per_page:page * per_page], len(in_window)
+
+    def _send_recording(self, name):
+        record_uuid = self.server.record_aliases.get(name.split(".")[0])
+        if record_uuid is None:
+            self._send_json({"error": "Record not found"}, 404)
+            return
+        audio_data = self.server.recording(record_uuid)
+        with self.server.lock:
+            self.server.downloaded_bytes += len(audio_data)
+        content_type = "audio/mpeg" if audio_data.startswith(b"ID3") or audio_data[:1] == b"\xff" else "audio/ogg"
+        self._send_bytes(audio_data, content_type)
+
+class FakeYandexHandler(_FakeHandler):
+    """Sync speech recognition: POST /speech/v1/stt:recognize"""
+
+    def do_POST(self):
+        audio_data = self._read_body()
+        if self._inject_fault():
+            return
+        if not self.path.startswith("/speech/v1/stt:recognize"):
+            self._send_json({"error_message": f"Unknown path {self.path}"}, 404)
+            return
+        if not (self.headers.get("Authorization") or "").startswith("Api-Key "):
+            self._send_json({"error_code": "UNAUTHORIZED", "error_message": "Unknown api key"}, 401)
+            return
+        with self.server.lock:
+            self.server.recognized_bytes += len(audio_data)
+        self._send_json({"result": self.server.transcribe(audio_data)})
+
+class FakeTelegramHandler(_FakeHandler):
+    """Bot API methods used by the notifier: getMe and sendMessage"""
+
+    def _send_error_response(self):
+        self._send_json({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                         "parameters": {"retry_after": 1}}, 429)
+
+    def _params(self, body):
+        if (self.headers.get("Content-Type") or "").startswith("application/json"):
+            return json.loads(body or b"{}")
+        return {name: values[0] for name, values in parse_qs(body.decode("utf-8")).items()}
+
+    def do_POST(self):
+        params = self._params(self._read_body())
+        if self._inject_fault():
+            return
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if method == "getMe":
+            self._send_json({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}})
+        elif method == "sendMessage":
+            with self.server.lock:
+                self.server.messages.append(params.get("text", ""))
+                message_id = len(self.server.messages)
+            self._send_json({"ok": True, "result": {
+                "message_id": message_id, "date": int(time.time()), "text": params.get("text", ""),
+                "chat": {"id": int(params.get("chat_id", 1)), "type": "private"}
+            }})
+        else:
+            self._send_json({"ok": False, "error_code": 404, "description": "Not Found"}, 404)
+
+class FakeService:
+    """
+    Runs a stand-in service on a background thread.
+
+    Args:
+        latency (float): Mean delay per request in seconds (uniform in 0.5x..1.5x)
+        error_rate (float): Share of requests answered with a retryable error
+    """
+    handler_class = _FakeHandler
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.requests = 0
+        self.httpd.errors = 0
+        self.httpd.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        with self.httpd.lock:
+            return {"requests": self.httpd.requests, "errors": self.httpd.errors}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class FakeTelphinServer(FakeService):
+    """
+    Telphin API stand-in; calls and CDR records are set with load().
+
+    Args:
+        recording (callable): record_uuid -> audio bytes, called per download
+    """
+    handler_class = FakeTelphinHandler
+
+    def __init__(self, recording=None, **kwargs):
+        super().__init__(**kwargs)
+        self.httpd.recording = recording or fake_recording
+        self.httpd.calls = []
+        self.httpd.cdr = []
+        self.httpd.record_aliases = {}
+        self.httpd.downloaded_bytes = 0
+
+    def load(self, calls, cdr_records, recording=None):
+        """
+        Serve these call and CDR records, both sorted by start_time_gmt.
+        Recordings are found by record_uuid and by call_uuid; recording
+        replaces the recording callable.
+        """
+        aliases = {}
+        for record in cdr_records:
+            if record.get("record_uuid"):
+                aliases[record["record_uuid"]] = record["record_uuid"]
+                aliases.setdefault(record.get("call_uuid"), record["record_uuid"])
+        with self.httpd.lock:
+            self.httpd.calls = sorted(calls, key=lambda call: call.get("start_time_gmt") or "")
+            self.httpd.cdr = sorted(cdr_records, key=lambda record: record.get("start_time_gmt") or "")
+            self.httpd.record_aliases = aliases
+            if recording is not None:
+                self.httpd.recording = recording
+
+    @property
+    def stats(self):
+        stats = super().stats
+        stats["downloaded_bytes"] = self.httpd.downloaded_bytes
+        return stats
+
+class FakeYandexServer(FakeService):
+    """
+    Yandex SpeechKit stand-in.
+
+    Args:
+        transcribe (callable): audio bytes -> text
+    """
+    handler_class = FakeYandexHandler
+
+    def __init__(self, transcribe=None, **kwargs):
+        super().__init__(**kwargs)
+        self.httpd.transcribe = transcribe or default_transcription
+        self.httpd.recognized_bytes = 0
+
+    @property
+    def recognize_url(self):
+        return f"{self.base_url}/speech/v1/stt:recognize"
+
+class FakeTelegramServer(FakeService):
+    """Telegram Bot API stand-in; sent texts are kept in messages"""
+    handler_class = FakeTelegramHandler
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.httpd.messages = []
+
+    @property
+    def bot_api_url(self):
+        """Value for TELEGRAM_BASE_URL; the bot token is appended by python-telegram-bot"""
+        return f"{self.base_url}/bot"
+
+    @property
+    def messages(self):
+        with self.httpd.lock:
+            return list(self.httpd.messages)
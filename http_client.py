@@ -0,0 +1,186 @@
+"""
+Shared HTTP client layer for all outbound requests.
+
+One pooled keep-alive session per host, connect/read timeouts per endpoint
+class, and retries on connection errors, 429 and 5xx with exponential
+backoff and jitter. Latency and retry counts of every request are
+accumulated per endpoint class in http_stats; only retries and failures
+are logged.
+"""
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# (connect, read) таймауты в секундах по классам эндпоинтов;
+# переопределяются через HTTP_TIMEOUT_<CLASS>="connect,read"
+ENDPOINT_TIMEOUTS = {
+    "telphin_auth": (5, 15),
+    "telphin_api": (5, 30),
+    "telphin_download": (5, 120),
+    "yandex_stt": (5, 60),
+    "default": (5, 30),
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats_lock = threading.Lock()
+http_stats = {}
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return int(default)
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def get_timeout(endpoint):
+    """
+    Get (connect, read) timeout for an endpoint class.
+
+    Args:
+        endpoint (str): Endpoint class name, e.g. "telphin_api"
+
+    Returns:
+        tuple: (connect_timeout, read_timeout) in seconds
+    """
+    override = os.environ.get(f"HTTP_TIMEOUT_{endpoint.upper()}")
+    if override:
+        try:
+            connect_timeout, read_timeout = (float(part) for part in override.split(","))
+            return connect_timeout, read_timeout
+        except ValueError:
+            print(f"⚠️ Invalid HTTP_TIMEOUT_{endpoint.upper()}={override!r}, using defaults")
+    return ENDPOINT_TIMEOUTS.get(endpoint, ENDPOINT_TIMEOUTS["default"])
+
+def get_session(url):
+    """
+    Get the shared keep-alive session for the host of a URL.
+
+    Args:
+        url (str): Request URL
+
+    Returns:
+        requests.Session: Pooled session for that host
+    """
+    parts = urlsplit(url)
+    host_key = f"{parts.scheme}://{parts.netloc}"
+
+    with _sessions_lock:
+        session = _sessions.get(host_key)
+        if session is None:
+            pool_size = _env_int("HTTP_POOL_SIZE", "10")
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount(f"{parts.scheme}://", adapter)
+            _sessions[host_key] = session
+        return session
+
+def _backoff_delay(attempt, response=None):
+    """Exponential backoff with full jitter, honouring Retry-After when present"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), _env_float("HTTP_BACKOFF_MAX", "30"))
+            except ValueError:
+                pass
+    base = _env_float("HTTP_BACKOFF_BASE", "0.5")
+    cap = _env_float("HTTP_BACKOFF_MAX", "30")
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def _record_stats(endpoint, latency, retries, failed):
+    with _stats_lock:
+        stats = http_stats.setdefault(endpoint, {
+            "requests": 0, "retries": 0, "failures": 0, "total_latency": 0.0, "max_latency": 0.0
+        })
+        stats["requests"] += 1
+        stats["retries"] += retries
+        stats["failures"] += int(failed)
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+    metrics.inc("analyzer_http_requests_total", endpoint=endpoint)
+    if retries:
+        metrics.inc("analyzer_api_retries_total", retries, api=endpoint)
+    if failed:
+        metrics.inc("analyzer_http_failures_total", endpoint=endpoint)
+
+def get_http_stats():
+    """Return a snapshot of per-endpoint request, retry and latency stats"""
+    with _stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in http_stats.items()}
+
+def reset_http_stats():
+    """Reset per-endpoint stats, e.g. at the start of a processing cycle"""
+    with _stats_lock:
+        http_stats.clear()
+
+def http_request(method, url, endpoint="default", max_retries=None, **kwargs):
+    """
+    Send an HTTP request through the shared pooled session with timeouts and retries.
+
+    Connection errors, timeouts, 429 and 5xx responses are retried with
+    exponential backoff and jitter. Other responses are returned as is.
+
+    Args:
+        method (str): HTTP method
+        url (str): Request URL
+        endpoint (str): Endpoint class used for timeouts and stats
+        max_retries (int): Retry limit, defaults to HTTP_MAX_RETRIES
+        **kwargs: Passed through to requests.Session.request
+
+    Returns:
+        requests.Response: Final response
+
+    Raises:
+        requests.exceptions.RequestException: If every attempt failed with a transport error
+    """
+    if max_retries is None:
+        max_retries = _env_int("HTTP_MAX_RETRIES", "3")
+    kwargs.setdefault("timeout", get_timeout(endpoint))
+
+    session = get_session(url)
+    path = urlsplit(url).path
+    started = time.monotonic()
+    attempt = 0
+
+    while True:
+        response = None
+        try:
+            response = session.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                break
+            reason = f"status {response.status_code}"
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                latency = time.monotonic() - started
+                _record_stats(endpoint, latency, attempt, True)
+                print(f"HTTP {method} {path} failed after {latency:.2f}s ({attempt} retries): {e}")
+                raise
+            reason = type(e).__name__
+
+        delay = _backoff_delay(attempt, response)
+        if response is not None:
+            response.close()
+        attempt += 1
+        print(f"HTTP {method} {path}: {reason}, retry {attempt}/{max_retries} in {delay:.1f}s")
+        time.sleep(delay)
+
+    latency = time.monotonic() - started
+    failed = response.status_code >= 400
+    _record_stats(endpoint, latency, attempt, failed)
+    if failed and attempt:
+        print(f"HTTP {method} {path} -> {response.status_code} after {latency:.2f}s ({attempt} retries)")
+    return response
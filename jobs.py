@@ -0,0 +1,161 @@
+"""
+In-process job queue for processing cycles triggered over HTTP.
+
+/process and /deployment-check no longer run a cycle inside the request:
+submit() queues a job and returns at once, and a single worker thread runs
+the jobs one after another, so two cycles never process the same calls
+concurrently. Single-flight: while a job of the same kind is queued or
+running, a new trigger joins it and gets its id instead of a second job.
+Progress (stage, calls done / total) and results are kept for the last
+JOBS_HISTORY_SIZE (default 50) jobs and served by /jobs/<id>.
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+class Job:
+    """One queued processing cycle and its progress"""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = QUEUED
+        self.stage = None
+        self.done = 0
+        self.total = None
+        self.joined = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, stage=None, total=None, done=None, advance=0):
+        """
+        Report progress from the running cycle; any thread may call it.
+
+        Args:
+            stage (str): Current step of the cycle
+            total (int): Number of calls to process
+            done (int): Number of finished calls
+            advance (int): Add to done, for per-call callbacks
+        """
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            if total is not None:
+                self.total = total
+            if done is not None:
+                self.done = done
+            self.done += advance
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "joined": self.joined,
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+class JobQueue:
+    """
+    Runs submitted jobs one at a time on a background thread.
+
+    Args:
+        runners (dict): kind -> callable(job) that runs the cycle, reports
+            progress through job.update() and returns a JSON-serializable result
+    """
+
+    def __init__(self, runners, history_size=None):
+        self.runners = runners
+        if history_size is None:
+            history_size = int(os.environ.get("JOBS_HISTORY_SIZE", "50"))
+        self.history_size = max(1, history_size)
+        self.jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="job-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind):
+        """
+        Queue a job, or join the queued or running job of the same kind.
+
+        Returns:
+            tuple: (job: Job, joined: bool)
+        """
+        if kind not in self.runners:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._lock:
+            active = self._active.get(kind)
+            if active is not None:
+                with active._lock:
+                    active.joined += 1
+                return active, True
+            job = Job(kind)
+            self.jobs[job.id] = job
+            self._active[kind] = job
+            self._trim_history()
+        self._queue.put(job)
+        return job, False
+
+    def get(self, job_id):
+        """Return the job dict, None if the id is unknown or dropped from history"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def _trim_history(self):
+        finished = [job for job in self.jobs.values() if job.status in (SUCCEEDED, FAILED)]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(self.jobs) - self.history_size)]:
+            del self.jobs[job.id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with job._lock:
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                result = self.runners[job.kind](job)
+                status, error = SUCCEEDED, None
+            except Exception as e:
+                print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
+                result, status, error = None, FAILED, str(e)
+            # Новый запуск того же вида после этой точки - уже отдельное задание
+            with self._lock:
+                if self._active.get(job.kind) is job:
+                    del self._active[job.kind]
+                with job._lock:
+                    job.result = result
+                    job.status = status
+                    job.error = error
+                    job.finished_at = time.time()
+            self._queue.task_done()
+
+    def wait(self, timeout=None):
+        """Block until all queued jobs are finished, for tests and shutdown"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
@@ -7,90 +7,638 @@ import requests
 import openai
 import asyncio
 import json
+import time
+import threading
+import statistics
 from telegram import Bot
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import pytz
+from functools import partial
+from types import SimpleNamespace
 from prompt_loader import prompt_loader
+from watermark import get_polling_window, advance_watermark, load_watermark
+from telphin_auth import get_token_provider
 
 # Импортируем все функции из старого main.py
 from main_backup import (
     load_processed_calls, save_processed_call, authenticate_telfin, 
-    get_recent_calls, download_recording, transcribe_with_yandex, 
-    transcribe_with_openai, send_telegram_report, has_recording, 
-    get_call_cdr, MOSCOW_TZ
+    get_recent_calls, iter_recent_calls, download_recording, transcribe_with_yandex, 
+    transcribe_with_yandex_chunked, transcribe_with_openai, send_telegram_report, has_recording, 
+    get_call_cdr, fetch_cdr_index, reset_cdr_request_count,
+    get_cdr_request_count, is_mp3_audio, convert_for_yandex,
+    YANDEX_MAX_DURATION_SECONDS, YANDEX_MAX_AUDIO_BYTES, MOSCOW_TZ
 )
+from pipeline import Pipeline, Stage
+from transcript_cache import reset_cache_stats, format_cache_stats
+from call_prefilter import prefilter_call
+from analysis_cache import cached_analysis
+import analysis_cache
+from analysis_schema import (
+    ANALYSIS_RESPONSE_FORMAT, TRIAGE_RESPONSE_FORMAT, sniff_status, validate_analysis, normalize_analysis, parse_analysis_json
+)
+from transcript_compaction import compact_transcript, get_token_budget, format_compaction_stats, reset_compaction_stats
+from telegram_notifier import enqueue_alert, get_outbox_entry, get_notifier, prune_outbox
+from openai_scheduler import get_scheduler, estimate_tokens, format_scheduler_stats, reset_scheduler_stats
+from tracing import Trace, log_event, format_stage_table, reset_stage_timings
+import call_state
+import metrics
+
+# Расход токенов и задержки анализа по уровням каскада за текущий цикл обработки
+ANALYSIS_TIERS = ("triage", "analysis")
+analysis_usage_stats = {
+    tier: {"requests": 0, "estimated": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "latencies": []}
+    for tier in ANALYSIS_TIERS
+}
+analysis_usage_lock = threading.Lock()
+
+def record_analysis_usage(response, tier="analysis", latency=0.0):
+    """
+    Add token usage and latency of an analysis response to analysis_usage_stats.
+    Usage marked as estimated (stream closed before the usage chunk) is counted
+    like reported usage and additionally in the "estimated" request counter.
+    
+    Args:
+        response: Chat Completions response
+        tier (str): Cascade tier, "triage" or "analysis"
+        latency (float): Request latency in seconds
+    
+    Returns:
+        tuple: (prompt_tokens: int, cached_tokens: int) of this response
+    """
+    usage = getattr(response, 'usage', None)
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+    estimated = bool(getattr(usage, 'estimated', False))
+    
+    with analysis_usage_lock:
+        stats = analysis_usage_stats[tier]
+        stats["requests"] += 1
+        stats["estimated"] += estimated
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_tokens"] += cached_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["latencies"].append(latency)
+    for kind, tokens in (("prompt", prompt_tokens), ("cached", cached_tokens), ("completion", completion_tokens)):
+        metrics.inc("analyzer_openai_tokens_total", tokens, tier=tier, kind=kind)
+    if estimated:
+        metrics.inc("analyzer_openai_estimated_usage_total", tier=tier)
+    return prompt_tokens, cached_tokens
+
+def reset_analysis_usage():
+    """Reset analysis token and latency counters at the start of a processing cycle"""
+    with analysis_usage_lock:
+        for stats in analysis_usage_stats.values():
+            for key in stats:
+                stats[key] = [] if key == "latencies" else 0
+
+def format_analysis_usage():
+    """Return analysis usage per cascade tier as a one-line summary"""
+    parts = []
+    with analysis_usage_lock:
+        snapshot = {tier: dict(stats, latencies=list(stats["latencies"])) for tier, stats in analysis_usage_stats.items()}
+    for tier, stats in snapshot.items():
+        if not stats["requests"]:
+            continue
+        share = stats["cached_tokens"] / stats["prompt_tokens"] * 100 if stats["prompt_tokens"] else 0
+        median = statistics.median(stats["latencies"]) if stats["latencies"] else 0
+        estimated = f" ({stats['estimated']} with estimated usage)" if stats["estimated"] else ""
+        parts.append(f"{tier}: {stats['requests']} requests{estimated}, median {median:.2f}s, "
+                     f"{stats['prompt_tokens']} prompt tokens ({stats['cached_tokens']} cached, {share:.0f}%), "
+                     f"{stats['completion_tokens']} completion tokens")
+    return "; ".join(parts) or "no requests"
+
+# Задержка от конца звонка до отправки алерта в Telegram за текущий цикл, секунды
+alert_lags = []
+alert_lags_lock = threading.Lock()
+
+def record_alert_lag(call, sent_at):
+    """
+    Record the end-to-end lag of a delivered alert.
+    
+    Args:
+        call (dict): Telphin call record with start_time_gmt and duration
+        sent_at (float): Unix time the alert was accepted by Telegram
+    
+    Returns:
+        float: Lag in seconds, None if the call end time is unknown
+    """
+    try:
+        call_start = datetime.strptime(call.get('start_time_gmt'), "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.UTC)
+        call_end = call_start.timestamp() + float(call.get('duration') or 0)
+    except (ValueError, TypeError):
+        return None
+    lag = max(0.0, sent_at - call_end)
+    with alert_lags_lock:
+        alert_lags.append(lag)
+    metrics.observe("analyzer_alert_lag_seconds", lag)
+    return lag
+
+def reset_alert_lags():
+    """Reset alert lag samples at the start of a processing cycle"""
+    with alert_lags_lock:
+        alert_lags.clear()
+
+def _percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def format_alert_lag():
+    """Return call end → alert lag as a one-line summary"""
+    with alert_lags_lock:
+        lags = list(alert_lags)
+    if not lags:
+        return "no alerts"
+    return (f"{len(lags)} alerts, p50 {_percentile(lags, 0.5) / 60:.1f} min, "
+            f"p95 {_percentile(lags, 0.95) / 60:.1f} min, max {max(lags) / 60:.1f} min")
+
+# Минимальная температура для стабильности JSON
+ANALYSIS_TEMPERATURE = 0.1
+
+def get_analysis_config():
+    """
+    Read the model cascade configuration from the environment.
+    
+    ANALYSIS_CASCADE_ENABLED (default 1), ANALYSIS_TRIAGE_MODEL (gpt-4o-mini),
+    ANALYSIS_MODEL (gpt-4o), ANALYSIS_ESCALATE_CATEGORIES (FAILED_SALE) and
+    ANALYSIS_ESCALATE_RESPONSIBILITY (MANAGER_FAULT,UNSURE).
+    
+    Returns:
+        dict: Cascade settings
+    """
+    def env_set(name, default):
+        return {value.strip().upper() for value in os.environ.get(name, default).split(",") if value.strip()}
+    
+    return {
+        "cascade_enabled": os.environ.get("ANALYSIS_CASCADE_ENABLED", "1") != "0",
+        "triage_model": os.environ.get("ANALYSIS_TRIAGE_MODEL", "gpt-4o-mini"),
+        "analysis_model": os.environ.get("ANALYSIS_MODEL", "gpt-4o"),
+        "escalate_categories": env_set("ANALYSIS_ESCALATE_CATEGORIES", "FAILED_SALE"),
+        "escalate_responsibility": env_set("ANALYSIS_ESCALATE_RESPONSIBILITY", "MANAGER_FAULT,UNSURE"),
+    }
 
+def should_escalate(triage_result, config):
+    """
+    Decide whether a triage result goes on to the full analysis model.
+    
+    Unparsable or incomplete triage answers are always escalated, so an
+    error of the small model can never drop an alert.
+    
+    Args:
+        triage_result (dict): Parsed triage JSON or None
+        config (dict): Settings from get_analysis_config()
+    
+    Returns:
+        bool: True if the call needs the full analysis
+    """
+    if not isinstance(triage_result, dict):
+        return True
+    category = str(triage_result.get('category') or '').upper()
+    responsibility = str(triage_result.get('responsibility') or 'UNSURE').upper()
+    if category not in {"SUCCESS_SALE", "FAILED_SALE", "LOGISTICS", "OTHER"}:
+        return True
+    return category in config["escalate_categories"] and responsibility in config["escalate_responsibility"]
+
+async def _stream_completion(client, model, messages, max_tokens, response_format):
+    """
+    Stream a completion and close the stream as soon as the status is known to be "ignore".
+    
+    Returns:
+        SimpleNamespace: content, usage and stopped_early. A stream closed early
+        never gets the usage chunk, so usage is then estimated from the prompt
+        and the streamed text and marked with estimated=True
+    """
+    extra = {"response_format": response_format} if response_format else {}
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=ANALYSIS_TEMPERATURE,
+        stream=True,
+        stream_options={"include_usage": True},
+        **extra
+    )
+    parts = []
+    usage = None
+    status = None
+    try:
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            for choice in chunk.choices or []:
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+            if status is None:
+                status = sniff_status("".join(parts))
+                if status == "ignore":
+                    break
+    finally:
+        await stream.close()
+    content = "".join(parts)
+    if usage is None:
+        # Без этого ранний "ignore" - самый частый исход - попадал бы в отчёт с нулём токенов
+        usage = SimpleNamespace(prompt_tokens=estimate_tokens(messages, 0),
+                                completion_tokens=estimate_tokens([{"content": content}], 0),
+                                prompt_tokens_details=None, estimated=True)
+    return SimpleNamespace(content=content, usage=usage, stopped_early=status == "ignore")
+
+def _request_analysis(scheduler, model, messages, max_tokens, tier, response_format=None, stream=False):
+    """
+    Send one Chat Completions request through the shared scheduler and record its usage under the tier.
+    
+    Returns:
+        tuple: (raw_response: str, stopped_early: bool); stopped_early means a
+        streamed answer was closed after an "ignore" status
+    """
+    estimated_tokens = estimate_tokens(messages, max_tokens)
+    extra = {"response_format": response_format} if response_format else {}
+    started = time.monotonic()
+    if stream:
+        response = scheduler.run(
+            model,
+            lambda client: _stream_completion(client, model, messages, max_tokens, response_format),
+            estimated_tokens=estimated_tokens
+        )
+        raw_response, stopped_early = response.content.strip(), response.stopped_early
+    else:
+        response = scheduler.run(
+            model,
+            lambda client: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=ANALYSIS_TEMPERATURE,
+                **extra
+            ),
+            estimated_tokens=estimated_tokens
+        )
+        raw_response, stopped_early = response.choices[0].message.content.strip(), False
+    latency = time.monotonic() - started
+    prompt_tokens, cached_tokens = record_analysis_usage(response, tier, latency)
+    if stopped_early:
+        log_event("DEBUG", "analysis_stream_closed", model=model, tier=tier, latency=round(latency, 2),
+                  characters=len(raw_response))
+    else:
+        log_event("DEBUG", "analysis_response", model=model, tier=tier, latency=round(latency, 2),
+                  characters=len(raw_response), prompt_tokens=prompt_tokens, cached_tokens=cached_tokens)
+    return raw_response, stopped_early
+
+def _analysis_cache_params():
+    """Settings that change the analysis result and therefore key the analysis cache"""
+    config = get_analysis_config()
+    return {
+        **config,
+        "escalate_categories": sorted(config["escalate_categories"]),
+        "escalate_responsibility": sorted(config["escalate_responsibility"]),
+        "temperature": ANALYSIS_TEMPERATURE,
+        "transcript_token_budget": get_token_budget(),
+    }
+
+@cached_analysis(_analysis_cache_params)
 def analyze_with_gpt_new(transcript, call_info=None):
     """
     NEW: Analyze call transcript with JSON-based logic focused on critical manager errors.
     
+    With the cascade enabled a small model classifies the call first, and
+    only FAILED_SALE candidates matching the escalation rules are analyzed
+    by the full model with fault codes and detailed-analysis prompts.
+    
+    Both tiers use structured outputs. The full analysis is streamed
+    (ANALYSIS_STREAMING, default 1) and closed as soon as the status is
+    "ignore"; alerts are validated against analysis_schema. Transcripts over
+    ANALYSIS_TRANSCRIPT_TOKEN_BUDGET are compacted first.
+    
     Args:
         transcript (str): Transcribed text from the call
         call_info (dict): Optional call metadata (duration, time, etc.)
     
     Returns:
-        dict: JSON response with analysis or {"status": "ignore"}
+        dict: Validated alert, {"status": "ignore"} or {"status": "error", "error": ...}
     """
     openai_api_key = os.environ.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
     
     if not openai_api_key or openai_api_key == "your_openai_api_key":
-        print("Error: OPENAI_API_KEY not configured")
-        return {"status": "ignore", "error": "no_api_key"}
+        log_event("ERROR", "analysis_unavailable", reason="OPENAI_API_KEY not configured")
+        return {"status": "error", "error": "no_api_key"}
         
     if not transcript:
-        print("Error: No transcript provided for analysis")
-        return {"status": "ignore", "error": "no_transcript"}
+        log_event("ERROR", "analysis_no_transcript")
+        return {"status": "error", "error": "no_transcript"}
+    
+    config = get_analysis_config()
+    # Длинные разговоры ужимаем до бюджета токенов: начало, цены/наличие, концовка
+    transcript = compact_transcript(transcript)
     
     try:
-        # Используем новые внешние промпты
-        print("📝 Loading prompts for critical error detection...")
-        full_prompt = prompt_loader.get_full_analysis_prompt(transcript, call_info)
+        # Один долгоживущий асинхронный клиент на процесс, с общим лимитом RPM/TPM
+        scheduler = get_scheduler(openai_api_key)
         
-        print("🤖 Sending to GPT-4 for critical error analysis...")
-        client = openai.OpenAI(api_key=openai_api_key)
+        if config["cascade_enabled"]:
+            log_event("DEBUG", "triage_request", model=config['triage_model'], prompts=prompt_loader.prompt_version)
+            try:
+                raw_triage, _ = _request_analysis(
+                    scheduler, config["triage_model"],
+                    prompt_loader.get_triage_messages(transcript, call_info),
+                    max_tokens=60, tier="triage",
+                    response_format=TRIAGE_RESPONSE_FORMAT
+                )
+                triage_result = parse_analysis_json(raw_triage)
+            except Exception as e:
+                # Ошибка малой модели не должна терять алерты - идём на полный анализ
+                log_event("WARNING", "triage_failed", error=str(e), fallback="full_analysis")
+                triage_result = None
+            
+            if not should_escalate(triage_result, config):
+                log_event("DEBUG", "triage_ignore", category=triage_result.get('category'),
+                          responsibility=triage_result.get('responsibility'))
+                return {
+                    "status": "ignore",
+                    "category": triage_result.get('category'),
+                    "responsibility": triage_result.get('responsibility'),
+                    "tier": "triage"
+                }
+            log_event("DEBUG", "triage_escalated", model=config['analysis_model'], triage=triage_result)
         
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": full_prompt}
-            ],
+        # Статический system-блок идёт первым, чтобы сработал кэш префикса у провайдера
+        log_event("DEBUG", "analysis_request", model=config['analysis_model'], prompts=prompt_loader.prompt_version)
+        raw_response, stopped_early = _request_analysis(
+            scheduler, config["analysis_model"],
+            prompt_loader.get_analysis_messages(transcript, call_info),
             max_tokens=800,   # Уменьшили - нужен только JSON
-            temperature=0.1   # Минимальная температура для стабильности JSON
+            tier="analysis",
+            response_format=ANALYSIS_RESPONSE_FORMAT,
+            stream=os.environ.get("ANALYSIS_STREAMING", "1") != "0"
         )
+        if stopped_early:
+            return {"status": "ignore"}
         
-        raw_response = response.choices[0].message.content.strip()
-        print(f"✅ GPT-4 response received: {len(raw_response)} characters")
-        
-        # Парсим JSON ответ
-        try:
-            # Убираем возможные markdown обёртки
-            if raw_response.startswith('```json'):
-                raw_response = raw_response[7:-3].strip()
-            elif raw_response.startswith('```'):
-                raw_response = raw_response[3:-3].strip()
-                
-            analysis_json = json.loads(raw_response)
-            print(f"✅ JSON parsed successfully: status = {analysis_json.get('status', 'unknown')}")
-            return analysis_json
-            
-        except json.JSONDecodeError as e:
-            print(f"⚠️ JSON parse error: {e}")
-            print(f"⚠️ Raw response: {raw_response[:200]}...")
-            # В случае ошибки парсинга - игнорируем
-            return {"status": "ignore", "error": "json_parse_failed"}
+        analysis_json = parse_analysis_json(raw_response)
+        errors = validate_analysis(analysis_json)
+        if errors:
+            # Невалидный ответ - это ошибка анализа, а не "ignore": алерт не должен теряться молча
+            log_event("ERROR", "analysis_invalid", errors=errors)
+            return {"status": "error", "error": f"invalid_analysis: {'; '.join(errors)}"}
+        if analysis_json['status'] == 'alert':
+            log_event("DEBUG", "analysis_validated", error_code=analysis_json['error_code'])
+        return normalize_analysis(analysis_json)
         
     except Exception as e:
-        print(f"❌ Error during GPT-4 analysis: {e}")
-        return {"status": "ignore", "error": str(e)}
+        log_event("ERROR", "analysis_request_failed", error=str(e))
+        return {"status": "error", "error": str(e)}
+
+def _stage_download(ctx, job):
+    """Pipeline stage: mark the call as processing and download its recording"""
+    call = job['call']
+    call_uuid = job['call_uuid']
+    
+    # 🔒 EARLY SAVE: Mark call as being processed
+    save_processed_call(call_uuid, "processing")
+        
+    call_time_str = call.get('start_time_gmt', 'N/A')
+    try:
+        call_time_utc = datetime.strptime(call_time_str, "%Y-%m-%d %H:%M:%S")
+        call_time_moscow = call_time_utc.replace(tzinfo=pytz.UTC).astimezone(MOSCOW_TZ)
+        moscow_time_str = call_time_moscow.strftime("%Y-%m-%d %H:%M:%S MSK")
+    except (ValueError, TypeError):
+        moscow_time_str = call_time_str
+    
+    log_event("INFO", "call_processing", index=job['index'], total=job['total'], start_time=moscow_time_str,
+              duration=call.get('duration'), flow=call.get('flow'), result=call.get('result'))
+    
+    audio_data = download_recording(ctx['hostname'], ctx['token_provider'], call_uuid, ctx['cdr_index'])
+    
+    if not audio_data:
+        log_event("WARNING", "no_recording")
+        job['status'] = "no_recording"
+        save_processed_call(call_uuid, job['status'])
+        return None
+    
+    log_event("INFO", "recording_downloaded", bytes=len(audio_data))
+    job['downloaded'] = True
+    job['audio_data'] = audio_data
+    return job
+
+def _stage_convert(ctx, job):
+    """Pipeline stage: convert MP3 to OGG Opus for Yandex or route long recordings to chunked transcription"""
+    audio_data = job['audio_data']
+    
+    if len(audio_data) > YANDEX_MAX_AUDIO_BYTES:
+        log_event("INFO", "chunked_transcription", reason="size", bytes=len(audio_data))
+        job['use_chunks'] = True
+        return job
+    
+    if not is_mp3_audio(audio_data):
+        job['yandex_audio'] = audio_data
+        return job
+    
+    ogg_data, duration = convert_for_yandex(audio_data)
+    
+    if duration is not None and duration > YANDEX_MAX_DURATION_SECONDS:
+        log_event("INFO", "chunked_transcription", reason="duration", duration=round(duration, 1))
+        job['use_chunks'] = True
+        return job
+    
+    if ogg_data is None:
+        log_event("ERROR", "audio_conversion_failed")
+        job['status'] = "transcription_error"
+        save_processed_call(job['call_uuid'], job['status'])
+        return None
+    
+    job['yandex_audio'] = ogg_data
+    return job
+
+def _stage_transcribe(ctx, job):
+    """Pipeline stage: transcribe with Yandex SpeechKit, long recordings in parallel chunks"""
+    call_uuid = job['call_uuid']
+    
+    if job.get('use_chunks'):
+        transcribed_text = transcribe_with_yandex_chunked(ctx['yandex_api_key'], job['audio_data'])
+        if not transcribed_text:
+            log_event("WARNING", "chunked_transcription_failed", fallback="whisper")
+            openai_api_key = os.environ.get("OPENAI_API_KEY")
+            if openai_api_key:
+                transcribed_text = transcribe_with_openai(openai_api_key, job['audio_data'])
+                if not transcribed_text:
+                    log_event("ERROR", "whisper_transcription_failed")
+            else:
+                log_event("ERROR", "whisper_unavailable", reason="OPENAI_API_KEY not configured")
+    else:
+        transcribed_text = transcribe_with_yandex(ctx['yandex_api_key'], job['yandex_audio'])
+    
+    # Аудио больше не нужно - не держим его в памяти до конца конвейера
+    job.pop('audio_data', None)
+    job.pop('yandex_audio', None)
+    
+    if not transcribed_text:
+        log_event("ERROR", "transcription_failed")
+        job['status'] = "transcription_error"
+        save_processed_call(call_uuid, job['status'])
+        return None
+    
+    log_event("INFO", "transcription_completed", characters=len(transcribed_text))
+    metrics.inc("analyzer_calls_total", step="transcribed")
+    job['transcript'] = transcribed_text
+    return job
+
+def _stage_analyze(ctx, job):
+    """Pipeline stage: analyze the transcript and build the alert report if needed"""
+    call = job['call']
+    call_uuid = job['call_uuid']
+    
+    # Передаём информацию о звонке для анализа
+    call_info_for_analysis = {
+        'duration': call.get('duration', 0),
+        'time': call.get('start_time_gmt', ''),
+        'direction': call.get('flow', 'unknown')
+    }
+    
+    # Локальный фильтр: успешные продажи, логистику и прочее не отправляем в GPT
+    if os.environ.get("PREFILTER_ENABLED", "1") != "0":
+        prefilter = prefilter_call(job['transcript'], {**call_info_for_analysis, 'result': call.get('result')})
+        if not prefilter['send_to_llm']:
+            log_event("INFO", "prefilter_ignore", category=prefilter['category'], reason=prefilter['reason'])
+            job['status'] = "prefilter_ignore"
+            save_processed_call(call_uuid, job['status'], prefilter['reason'])
+            return None
+    
+    analysis_result = analyze_with_gpt_new(job['transcript'], call_info_for_analysis)
+    
+    if not analysis_result or not isinstance(analysis_result, dict) or analysis_result.get('status') == 'error':
+        error = analysis_result.get('error') if isinstance(analysis_result, dict) else None
+        log_event("ERROR", "analysis_failed", error=error)
+        job['status'] = "analysis_failed"
+        save_processed_call(call_uuid, job['status'], error)
+        return None
+    
+    if analysis_result.get('status') == 'ignore':
+        log_event("INFO", "analyzed_ignore")
+        job['status'] = "analyzed_ignore"
+        save_processed_call(call_uuid, job['status'])
+        return None
+    
+    if analysis_result.get('status') != 'alert':
+        log_event("ERROR", "analysis_unexpected", result=analysis_result)
+        job['status'] = "analysis_unexpected"
+        save_processed_call(call_uuid, job['status'])
+        return None
+    
+    log_event("WARNING", "manager_error_detected", error_code=analysis_result.get('error_code', 'UNKNOWN'),
+              error_description=analysis_result.get('error_description', 'N/A'))
+    
+    # Извлекаем номер клиента
+    def clean_phone_number(number):
+        if number and number != 'N/A':
+            return number.split('@')[0]
+        return 'N/A'
+    
+    # Определяем номер клиента в зависимости от направления звонка
+    if call.get('flow') == 'in':  # Входящий - клиент звонит нам
+        client_phone = clean_phone_number(call.get('bridged_username') or call.get('from_username'))
+    else:  # Исходящий - мы звоним клиенту
+        client_phone = clean_phone_number(call.get('to_username') or call.get('bridged_username'))
+    
+    # Создаём критический отчёт
+    alert_template = prompt_loader.get_alert_template()
+    job['report'] = alert_template.format(
+        error_code=analysis_result.get('error_code', 'UNKNOWN'),
+        error_description=analysis_result.get('error_description', 'N/A'),
+        client_phone=client_phone,
+        context=analysis_result.get('context', 'N/A'),
+        solution=analysis_result.get('solution', 'N/A')
+    )
+    job['analysis'] = analysis_result
+    return job
+
+def _stage_notify(ctx, job):
+    """Pipeline stage: put the critical report into the durable Telegram outbox"""
+    call_uuid = job['call_uuid']
+    if enqueue_alert(call_uuid, job['report']):
+        job['status'] = "alert_queued"
+        log_event("INFO", "alert_queued")
+        metrics.inc("analyzer_calls_total", step="alerted")
+    else:
+        # Повторная обработка звонка не создаёт второй алерт
+        entry = get_outbox_entry(call_uuid)
+        job['status'] = "critical_alert_sent" if entry and entry['status'] == 'sent' else "alert_queued"
+        log_event("INFO", "alert_already_queued", outbox_status=entry['status'] if entry else None)
+    save_processed_call(call_uuid, job['status'])
+    
+    notifier = ctx.get('notifier')
+    if notifier:
+        notifier.wake()
+    return job
+
+def _traced_stage(name, func, ctx, job):
+    """Run a stage function inside a span of the call's trace"""
+    trace = job.get('trace')
+    if trace is None:
+        return func(ctx, job)
+    with trace.span(name):
+        return func(ctx, job)
+
+def _on_pipeline_error(job, stage_name, error):
+    """Record an unexpected stage failure as the final call status"""
+    job['status'] = f"{stage_name}_error"
+    job['error'] = str(error)
+    save_processed_call(job['call_uuid'], job['status'], job['error'])
+
+def build_call_pipeline(ctx, on_finish=None):
+    """
+    Build the download → convert → transcribe → analyze → notify pipeline.
+    Worker counts come from PIPELINE_<STAGE>_WORKERS env vars.
+    
+    Args:
+        ctx (dict): Shared context (hostname, token_provider, cdr_index, yandex_api_key, notifier)
+        on_finish (callable): Called with every finished job
+    
+    Returns:
+        Pipeline: Ready-to-run pipeline
+    """
+    stages = [
+        Stage("download", partial(_traced_stage, "download", _stage_download, ctx), default_workers=4),
+        Stage("convert", partial(_traced_stage, "convert", _stage_convert, ctx), default_workers=2),
+        Stage("transcribe", partial(_traced_stage, "transcribe", _stage_transcribe, ctx), default_workers=4),
+        # Запросы к OpenAI идут через общий планировщик, темп задаёт квота, а не число воркеров
+        Stage("analyze", partial(_traced_stage, "analyze", _stage_analyze, ctx), default_workers=8),
+        # Одна запись в outbox за раз; саму отправку делает фоновый TelegramNotifier
+        Stage("notify", partial(_traced_stage, "notify", _stage_notify, ctx), default_workers=1),
+    ]
+    return Pipeline(stages, on_error=_on_pipeline_error, on_finish=on_finish)
 
-def main_new(deployment_check=False):
+def main_new(deployment_check=False, stop_event=None, progress=None):
     """
     NEW: Main function with updated logic - only alerts on critical manager errors
     
     Args:
         deployment_check (bool): If True, process only last 2 calls for deployment verification
+        stop_event (threading.Event): Daemon shutdown flag; once set, calls not yet started
+            are left for the next run and the watermark is not advanced
+        progress (callable): progress(stage=..., total=..., done=..., advance=...) receives
+            the cycle step and the number of processed calls, e.g. Job.update of the web job queue
+    
+    Returns:
+        dict: Cycle summary (new_calls, processed, alerts), None if the cycle could not run
     """
+    started = time.monotonic()
+    summary = None
+    try:
+        summary = _run_cycle(deployment_check, stop_event, progress or (lambda **fields: None))
+        return summary
+    finally:
+        # Метрики цикла публикуются и при ошибке - веб-процесс читает их из общей базы
+        result = "ok" if summary is not None else "failed"
+        metrics.inc("analyzer_cycles_total", mode="deployment_check" if deployment_check else "poll", result=result)
+        metrics.observe("analyzer_cycle_duration_seconds", time.monotonic() - started)
+        metrics.set_gauge("analyzer_last_cycle_timestamp_seconds", time.time())
+        current_watermark = load_watermark()
+        if current_watermark is not None:
+            metrics.set_gauge("analyzer_watermark_lag_seconds", (datetime.now(pytz.UTC) - current_watermark).total_seconds())
+        metrics.flush_metrics()
+
+def _run_cycle(deployment_check, stop_event, progress):
+    """One processing cycle of main_new()"""
     if deployment_check:
         print("=== 🚨 DEPLOYMENT CHECK: Processing Last 2 Calls ===")
         print("🔍 Verifying system works after deployment")
@@ -111,182 +659,197 @@ def main_new(deployment_check=False):
         print("Error: YANDEX_API_KEY must be set")
         return
     
+    progress(stage="authenticating")
     print(f"\n1. Authenticating with Telphin API at {hostname}...")
-    token = authenticate_telfin(hostname, login, password)
+    # Провайдер кэширует токен между циклами и обновляет его при 401
+    token_provider = get_token_provider(hostname, login, password)
     
-    if not token:
+    if not token_provider.get_token():
         print("Authentication failed. Cannot proceed.")
         return
     
-    print("\n2. Loading processed calls history...")
-    processed_calls = load_processed_calls()
-    print(f"Found {len(processed_calls)} previously processed calls")
+    print("\n2. Pruning processed calls history...")
+    pruned_calls = call_state.prune_calls()
+    if pruned_calls:
+        print(f"Pruned {pruned_calls} old call state rows")
+    pruned_analyses = analysis_cache.prune_cache()
+    if pruned_analyses:
+        print(f"Pruned {pruned_analyses} unused cached analyses")
+    pruned_alerts = prune_outbox()
+    if pruned_alerts:
+        print(f"Pruned {pruned_alerts} delivered Telegram outbox rows")
+    # Отправитель стартует сразу - дочищает алерты, оставшиеся в outbox с прошлых запусков
+    notifier = get_notifier()
     
+    progress(stage="listing_calls")
     print("\n3. Retrieving recent calls...")
-    calls = get_recent_calls(hostname, token)
-    
-    if calls is None:
-        print("Failed to retrieve calls.")
-        return
+    reset_cdr_request_count()
+    reset_cache_stats()
+    reset_analysis_usage()
+    analysis_cache.reset_cache_stats()
+    reset_scheduler_stats()
+    reset_compaction_stats()
+    reset_alert_lags()
+    reset_stage_timings()
     
     # 🔄 Новая логика: режим проверки развертывания
     if deployment_check:
-        # В режиме проверки - берём последние 2 звонка (игнорируем processed_calls)
-        new_calls = calls[-2:] if len(calls) >= 2 else calls
-        print(f"🔍 DEPLOYMENT CHECK: Processing last {len(new_calls)} calls (ignoring processed history)")
-    else:
-        # Обычный режим - только новые звонки
-        new_calls = [call for call in calls if call.get('call_uuid') not in processed_calls]
-        print(f"Found {len(calls)} total calls, {len(new_calls)} new calls to process")
+        time_window = None
+        calls = get_recent_calls(hostname, token_provider)
         
-        if not new_calls:
-            print("✅ No new calls to process.")
+        if calls is None:
+            print("Failed to retrieve calls.")
             return
+        
+        # В режиме проверки - берём последние 2 звонка (игнорируем processed_calls)
+        calls_stream = calls[-2:] if len(calls) >= 2 else calls
+        print(f"🔍 DEPLOYMENT CHECK: Processing last {len(calls_stream)} calls (ignoring processed history)")
+    else:
+        # Обычный режим - только дельта с последнего watermark, постранично;
+        # ordered=True - стабильный порядок обработки и алертов между запусками
+        time_window = get_polling_window()
+        calls_stream = iter_recent_calls(hostname, token_provider, ordered=True, time_window=time_window)
     
-    processed_count = 0
-    critical_alerts = 0
+    total_calls = 0
+    new_calls_count = 0
     
     print("\n4. Filtering for incoming calls with recordings...")
+    # CDR индекс строится лениво - только если есть новый входящий звонок
+    cdr_index = None
+    cdr_index_loaded = False
     incoming_calls_with_recordings = []
+    # Звонки без записи в CDR (запись могла ещё не появиться) - держат watermark
+    pending_recording_starts = []
+    seen_call_starts = []
+    listing_complete = False
+    # Трасса звонка начинается с поиска записи в CDR и продолжается в конвейере
+    traces = {}
     
-    for call in new_calls:
-        flow = call.get('flow', '')
-        call_uuid = call.get('call_uuid')
-        
-        if flow != 'in':
-            print(f"Skipping call {call_uuid}: flow={flow} (not incoming)")
-            continue
+    try:
+        # Статусы из базы подтягиваются одним запросом на пачку звонков
+        for call, known_status in call_state.annotate_known_calls(calls_stream):
+            total_calls += 1
+            metrics.inc("analyzer_calls_total", step="fetched")
+            seen_call_starts.append(call.get('start_time_gmt'))
+            flow = call.get('flow', '')
+            call_uuid = call.get('call_uuid')
             
-        if not call_uuid:
-            print(f"Skipping call: missing call_uuid")
-            continue
+            if not deployment_check and known_status is not None:
+                continue
+            new_calls_count += 1
+            metrics.inc("analyzer_calls_total", step="new")
+            
+            if flow != 'in':
+                log_event("DEBUG", "call_skipped", call_uuid=call_uuid, reason="not_incoming", flow=flow)
+                continue
+                
+            if not call_uuid:
+                log_event("WARNING", "call_skipped", reason="missing_call_uuid")
+                continue
             
-        has_rec, rec_size = has_recording(hostname, token, call_uuid)
+            trace = Trace(call_uuid)
+            with trace.span("cdr_lookup"):
+                if not cdr_index_loaded:
+                    cdr_index = fetch_cdr_index(hostname, token_provider, time_window)
+                    cdr_index_loaded = True
+                    if cdr_index is None:
+                        print("⚠️ CDR index unavailable, falling back to per-call CDR lookups")
+                    
+                has_rec, rec_size = has_recording(hostname, token_provider, call_uuid, cdr_index)
+            
+            if has_rec:
+                incoming_calls_with_recordings.append(call)
+                traces[call_uuid] = trace
+                metrics.inc("analyzer_calls_total", step="with_recording")
+                log_event("INFO", "call_found", call_uuid=call_uuid, record_bytes=rec_size)
+            else:
+                pending_recording_starts.append(call.get('start_time_gmt'))
+                trace.finish("recording_pending")
+        listing_complete = True
+    except Exception as e:
+        print(f"Failed to retrieve calls: {e}")
+        if not incoming_calls_with_recordings:
+            return
+        print(f"⚠️ Continuing with {len(incoming_calls_with_recordings)} calls retrieved before the error")
+    
+    if not deployment_check:
+        print(f"Found {total_calls} total calls, {new_calls_count} new calls to process")
         
-        if has_rec:
-            incoming_calls_with_recordings.append(call)
-            print(f"✅ Found incoming call with recording: {call_uuid} ({rec_size} bytes)")
-        else:
-            print(f"Skipping call {call_uuid}: no recording available")
+        if not new_calls_count:
+            if listing_complete:
+                advance_watermark(time_window[1], seen_call_starts, pending_recording_starts)
+            print("✅ No new calls to process.")
+            return {'new_calls': 0, 'processed': 0, 'alerts': 0}
     
     print(f"Filtered to {len(incoming_calls_with_recordings)} incoming calls with recordings")
     
     if not incoming_calls_with_recordings:
+        if not deployment_check and listing_complete:
+            advance_watermark(time_window[1], seen_call_starts, pending_recording_starts)
         print("✅ No incoming calls with recordings to process.")
-        return
+        return {'new_calls': new_calls_count, 'processed': 0, 'alerts': 0}
     
-    for i, call in enumerate(incoming_calls_with_recordings):
-        call_uuid = call.get('call_uuid')
-        
-        # 🔒 EARLY SAVE: Mark call as being processed
-        print(f"🔒 Marking call {call_uuid} as processing...")
-        save_processed_call(call_uuid, "processing")
-            
-        call_time_str = call.get('start_time_gmt', 'N/A')
-        try:
-            call_time_utc = datetime.strptime(call_time_str, "%Y-%m-%d %H:%M:%S")
-            call_time_moscow = call_time_utc.replace(tzinfo=pytz.UTC).astimezone(MOSCOW_TZ)
-            moscow_time_str = call_time_moscow.strftime("%Y-%m-%d %H:%M:%S MSK")
-        except (ValueError, TypeError):
-            moscow_time_str = call_time_str
-        
-        print(f"\nProcessing call {i+1}/{len(incoming_calls_with_recordings)}: {call_uuid}")
-        print(f"  Details: {moscow_time_str} | {call.get('duration')}s | {call.get('flow')} | {call.get('result')}")
-        
-        audio_data = download_recording(hostname, token, call_uuid)
-        
-        if audio_data:
-            processed_count += 1
-            print(f"✅ Recording found! Processing...")
-            
-            # Transcribe with Yandex SpeechKit first, fallback to OpenAI
-            transcribed_text = transcribe_with_yandex(yandex_api_key, audio_data)
-            
-            if transcribed_text == "Аудиозапись слишком длинная для транскрипции (более 30 секунд)":
-                print("Yandex limit exceeded, trying OpenAI Whisper...")
-                openai_api_key = os.environ.get("OPENAI_API_KEY")
-                if openai_api_key:
-                    transcribed_text = transcribe_with_openai(openai_api_key, audio_data)
-                    if transcribed_text:
-                        print("✅ OpenAI Whisper transcription completed")
-                    else:
-                        print("❌ OpenAI Whisper transcription failed")
-                else:
-                    print("❌ OPENAI_API_KEY not configured")
-            
-            if transcribed_text:
-                print(f"✅ Transcription completed")
-                
-                # Передаём информацию о звонке для анализа
-                call_info_for_analysis = {
-                    'duration': call.get('duration', 0),
-                    'time': call.get('start_time_gmt', ''),
-                    'direction': call.get('flow', 'unknown')
-                }
-                
-                analysis_result = analyze_with_gpt_new(transcribed_text, call_info_for_analysis)
-                
-                if analysis_result and isinstance(analysis_result, dict):
-                    # Проверяем статус анализа
-                    if analysis_result.get('status') == 'alert':
-                        print(f"🚨 КРИТИЧЕСКАЯ ОШИБКА МЕНЕДЖЕРА ОБНАРУЖЕНА!")
-                        print(f"⚙️ Код: {analysis_result.get('error_code', 'UNKNOWN')}")
-                        print(f"📋 Описание: {analysis_result.get('error_description', 'N/A')}")
-                        
-                        # Извлекаем номер клиента
-                        def clean_phone_number(number):
-                            if number and number != 'N/A':
-                                return number.split('@')[0]
-                            return 'N/A'
-                        
-                        # Определяем номер клиента в зависимости от направления звонка
-                        if call.get('flow') == 'in':  # Входящий - клиент звонит нам
-                            client_phone = clean_phone_number(call.get('bridged_username') or call.get('from_username'))
-                        else:  # Исходящий - мы звоним клиенту
-                            client_phone = clean_phone_number(call.get('to_username') or call.get('bridged_username'))
-                        
-                        # Создаём критический отчёт
-                        alert_template = prompt_loader.get_alert_template()
-                        critical_report = alert_template.format(
-                            error_code=analysis_result.get('error_code', 'UNKNOWN'),
-                            error_description=analysis_result.get('error_description', 'N/A'),
-                            client_phone=client_phone,
-                            context=analysis_result.get('context', 'N/A'),
-                            solution=analysis_result.get('solution', 'N/A')
-                        )
-                        
-                        # Отправляем критический отчёт
-                        telegram_success = asyncio.run(send_telegram_report(critical_report))
-                        
-                        if telegram_success:
-                            critical_alerts += 1
-                            save_processed_call(call_uuid, "critical_alert_sent")
-                            print("🚨 Критический отчёт отправлен в Telegram!")
-                        else:
-                            print("❌ Ошибка отправки критического отчёта")
-                            save_processed_call(call_uuid, "alert_failed")
-                            
-                    elif analysis_result.get('status') == 'ignore':
-                        print(f"✅ Звонок проанализирован: не требует вмешательства")
-                        save_processed_call(call_uuid, "analyzed_ignore")
-                    else:
-                        print(f"❌ Неожиданный результат анализа: {analysis_result}")
-                        save_processed_call(call_uuid, "analysis_unexpected")
-                else:
-                    print(f"❌ Ошибка анализа звонка")
-                    save_processed_call(call_uuid, "analysis_failed")
-            else:
-                print("❌ Transcription failed")
-                save_processed_call(call_uuid, "transcription_error")
-        else:
-            print(f"❌ No recording available")
-            save_processed_call(call_uuid, "no_recording")
+    # Сортировка по времени начала - детерминированный порядок обработки и алертов
+    incoming_calls_with_recordings.sort(key=lambda call: call.get('start_time_gmt') or '')
+    
+    pipeline_context = {
+        'hostname': hostname,
+        'token_provider': token_provider,
+        'cdr_index': cdr_index,
+        'yandex_api_key': yandex_api_key,
+        'notifier': notifier,
+    }
+    left_for_next_run = []
+    
+    def feed_jobs():
+        for i, call in enumerate(incoming_calls_with_recordings):
+            if stop_event is not None and stop_event.is_set():
+                # Остановка демона: начатые звонки дорабатываем, остальные - в следующий запуск
+                left_for_next_run.extend(incoming_calls_with_recordings[i:])
+                print(f"🛑 Shutdown requested, {len(left_for_next_run)} calls left for the next run")
+                return
+            yield {'index': i + 1, 'total': len(incoming_calls_with_recordings), 'call': call,
+                   'call_uuid': call.get('call_uuid'), 'trace': traces.get(call.get('call_uuid'))}
+    
+    progress(stage="processing_calls", total=len(incoming_calls_with_recordings), done=0)
+    finished_jobs = build_call_pipeline(pipeline_context, on_finish=lambda job: progress(advance=1)).run(feed_jobs())
+    
+    processed_count = sum(1 for job in finished_jobs if job.get('downloaded'))
+    alert_jobs = [job for job in finished_jobs if job.get('status') in ("alert_queued", "critical_alert_sent")]
+    if alert_jobs and notifier:
+        progress(stage="sending_alerts")
+        # При остановке не выходим за льготный период SIGTERM - остаток уйдёт из outbox позже
+        still_pending = notifier.flush(timeout=5 if stop_event is not None and stop_event.is_set() else None)
+        if still_pending:
+            print(f"📬 {still_pending} alerts still queued, they will be retried in the background or on the next run")
+    critical_alerts = 0
+    for job in alert_jobs:
+        entry = get_outbox_entry(job['call_uuid'])
+        if entry and entry['status'] == 'sent':
+            job['status'] = "critical_alert_sent"
+            critical_alerts += 1
+            record_alert_lag(job['call'], entry['sent_at'])
+    for job in finished_jobs:
+        if job.get('trace'):
+            job['trace'].finish(job.get('status', 'unknown'))
+    
+    # Пропущенные при остановке звонки не в базе - watermark их не должен перешагнуть
+    if not deployment_check and listing_complete and not left_for_next_run:
+        advance_watermark(time_window[1], seen_call_starts, pending_recording_starts)
     
     if deployment_check:
         print(f"\n=== 🚨 DEPLOYMENT CHECK COMPLETE ===")
-        print(f"Calls checked: {len(new_calls)}")
+        print(f"Calls checked: {new_calls_count}")
         print(f"Incoming calls with recordings found: {len(incoming_calls_with_recordings)}")
         print(f"Calls processed: {processed_count}")
+        print(f"CDR HTTP requests: {get_cdr_request_count()}")
+        print(f"Transcript cache: {format_cache_stats()}")
+        print(f"GPT analysis usage: {format_analysis_usage()}")
+        print(f"Analysis cache: {analysis_cache.format_cache_stats()}")
+        print(f"Transcript compaction: {format_compaction_stats()}")
+        print(f"OpenAI scheduler: {format_scheduler_stats()}")
+        print(f"Alert lag (call end → Telegram): {format_alert_lag()}")
+        print(f"Stage timings:\n{format_stage_table()}")
         print(f"🚨 CRITICAL ALERTS SENT: {critical_alerts}")
         if processed_count > 0:
             print("✅ DEPLOYMENT VERIFICATION: System is working correctly!")
@@ -296,17 +859,30 @@ def main_new(deployment_check=False):
             print("📋 This is normal if recent calls had no recordings")
     else:
         print(f"\n=== NEW ANALYSIS COMPLETE ===")
-        print(f"Total calls retrieved: {len(calls)}")
-        print(f"New calls found: {len(new_calls)}")
+        print(f"Total calls retrieved: {total_calls}")
+        print(f"New calls found: {new_calls_count}")
         print(f"Incoming calls with recordings: {len(incoming_calls_with_recordings)}")
         print(f"Calls processed: {processed_count}")
+        print(f"CDR HTTP requests: {get_cdr_request_count()}")
+        print(f"Transcript cache: {format_cache_stats()}")
+        print(f"GPT analysis usage: {format_analysis_usage()}")
+        print(f"Analysis cache: {analysis_cache.format_cache_stats()}")
+        print(f"Transcript compaction: {format_compaction_stats()}")
+        print(f"OpenAI scheduler: {format_scheduler_stats()}")
+        print(f"Alert lag (call end → Telegram): {format_alert_lag()}")
+        print(f"Stage timings:\n{format_stage_table()}")
         print(f"🚨 CRITICAL ALERTS SENT: {critical_alerts}")
         print("🎯 System focused on critical manager errors only")
+    
+    return {'new_calls': new_calls_count, 'processed': processed_count, 'alerts': critical_alerts}
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == "scheduler":
         main_new()
+    elif len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        from daemon import run_daemon
+        run_daemon(main_new)
     elif len(sys.argv) > 1 and sys.argv[1] == "deployment-check":
         main_new(deployment_check=True)
     elif os.environ.get("PORT"):
@@ -8,72 +8,113 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import pytz
 from prompt_loader import prompt_loader
+from cdr_index import CDRIndex
+import call_state
+from telphin_auth import TelphinTokenProvider, get_token_provider, get_api_base_url
+from http_client import http_request
+from audio_utils import (
+    get_audio_duration, get_ogg_opus_duration, convert_to_ogg_opus,
+    decode_to_pcm, split_at_silences, PCM_SAMPLE_RATE
+)
+from transcript_cache import cached_transcription
+from openai_scheduler import get_scheduler
+from tracing import log_event, is_enabled
 
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
 load_dotenv()
 
-PROCESSED_CALLS_FILE = "processed_calls.json"
+
+CDR_PAGE_SIZE = int(os.environ.get("CDR_PAGE_SIZE", "1000"))
+
+# Лимит синхронного распознавания Yandex SpeechKit
+YANDEX_MAX_DURATION_SECONDS = 30
+YANDEX_MAX_AUDIO_BYTES = 1048576
+YANDEX_RECOGNITION_PARAMS = {"lang": "ru-RU", "topic": "general"}
+YANDEX_STT_URL = "https://stt.api.cloud.yandex.net/speech/v1/stt:recognize"
+
+# Счётчик HTTP-запросов к /cdr/ за текущий цикл обработки
+cdr_request_stats = {"requests": 0}
+
+def reset_cdr_request_count():
+    """Reset the per-cycle counter of CDR HTTP requests."""
+    cdr_request_stats["requests"] = 0
+
+def get_cdr_request_count():
+    """Return the number of CDR HTTP requests made since the last reset."""
+    return cdr_request_stats["requests"]
 
 def load_processed_calls():
     """
-    Load the list of already processed call IDs from persistent file storage.
+    Load the list of already processed call IDs from the call state store.
     
     Returns:
         set: Set of processed call IDs
     """
     try:
-        processed_calls_file = "processed_calls.txt"
-        if os.path.exists(processed_calls_file):
-            with open(processed_calls_file, 'r') as f:
-                call_ids = f.read().strip().split('\n')
-                return set(call_id.strip() for call_id in call_ids if call_id.strip())
-        return set()
+        return call_state.load_call_ids()
     except Exception as e:
         print(f"Error loading processed calls: {e}")
         return set()
 
-def save_processed_call(call_id, status="success"):
+def save_processed_call(call_id, status="success", error=None):
     """
-    Save processed call to persistent file storage with status tracking.
+    Save processed call state (status, timestamps, attempts) to the call state store.
     
     Args:
         call_id (str): Call ID to mark as processed
-        status (str): Processing status ("success", "error", "no_recording")
+        status (str): Processing status ("processing", "analyzed_ignore", "no_recording", ...)
+        error (str): Optional error message
     """
     try:
-        processed_calls_file = "processed_calls.txt"
-        
-        existing_calls = load_processed_calls()
-        
-        if call_id not in existing_calls:
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            with open(processed_calls_file, 'a') as f:
-                f.write(f"{call_id}\n")
-                f.flush()  # Force write to disk immediately
-                import os
-                os.fsync(f.fileno())  # Ensure it's written to storage
-            
-            print(f"✅ Marked call {call_id} as processed ({status}) at {timestamp}")
-            
-            all_calls = load_processed_calls()
-            if len(all_calls) > 1000:
-                recent_calls = list(all_calls)[-1000:]
-                with open(processed_calls_file, 'w') as f:
-                    for call in recent_calls:
-                        f.write(f"{call}\n")
-                print(f"Trimmed processed calls file to last 1000 entries")
-        else:
-            print(f"⚠️ Call {call_id} already marked as processed, skipping duplicate")
-            
+        call_state.mark_call(call_id, status, error)
+        log_event("DEBUG", "call_marked", call_uuid=call_id, status=status)
     except Exception as e:
-        print(f"Error saving processed call: {e}")
+        log_event("ERROR", "call_mark_failed", call_uuid=call_id, status=status, error=str(e))
+
+def telphin_get(url, token, headers=None, endpoint="telphin_api", **kwargs):
+    """
+    Send an authenticated GET request to the Telphin API.
+    
+    When token is a TelphinTokenProvider, a 401 response refreshes the token
+    and the request is retried once transparently.
+    
+    Args:
+        url (str): Request URL
+        token: Bearer token string or TelphinTokenProvider
+        headers (dict): Extra request headers
+        endpoint (str): Endpoint class for timeouts and stats ("telphin_api" or "telphin_download")
+        **kwargs: Passed through to http_request
+    
+    Returns:
+        requests.Response: Response of the (possibly retried) request
+    
+    Raises:
+        requests.exceptions.RequestException: If no token could be obtained
+    """
+    is_provider = isinstance(token, TelphinTokenProvider)
+    bearer = token.get_token() if is_provider else token
+    if not bearer:
+        raise requests.exceptions.RequestException("No Telphin token available, authentication failed")
+    request_headers = dict(headers or {})
+    request_headers["Authorization"] = f"Bearer {bearer}"
+    
+    response = http_request("GET", url, endpoint=endpoint, headers=request_headers, **kwargs)
+    
+    if response.status_code == 401 and is_provider:
+        print("Telphin token rejected (401), refreshing and retrying once...")
+        token.invalidate(bearer)
+        bearer = token.get_token()
+        if bearer:
+            request_headers["Authorization"] = f"Bearer {bearer}"
+            response = http_request("GET", url, endpoint=endpoint, headers=request_headers, **kwargs)
+    
+    return response
 
 def authenticate_telfin(hostname, login, password):
     """
     Authenticate with Telphin API and get bearer token.
+    The token is cached by the process-wide token provider and reused until shortly before it expires.
     
     Args:
         hostname (str): Telphin hostname
@@ -83,94 +124,167 @@ def authenticate_telfin(hostname, login, password):
     Returns:
         str: Bearer token if successful, None if failed
     """
-    auth_url = f"https://{hostname}:443/oauth/token"
+    return get_token_provider(hostname, login, password).get_token()
+
+def get_default_time_window():
+    """
+    Get the classic sliding query window of the last TIME_WINDOW_HOURS.
     
-    auth_data = {
-        "grant_type": "client_credentials",
-        "application_id": login,
-        "application_secret": password
-    }
+    Returns:
+        tuple: (start_datetime: str, end_datetime: str) in UTC, Telphin format
+    """
+    time_window_hours = int(os.environ.get("TIME_WINDOW_HOURS", "6"))
+    moscow_now = datetime.now(MOSCOW_TZ)
+    moscow_now_utc = moscow_now.astimezone(pytz.UTC)
+    end_datetime = moscow_now_utc.strftime("%Y-%m-%d %H:%M:%S")
+    start_datetime = (moscow_now_utc - timedelta(hours=time_window_hours)).strftime("%Y-%m-%d %H:%M:%S")
+    return start_datetime, end_datetime
+
+def _extract_calls_page(calls_data):
+    """
+    Extract the list of calls from a /calls/ response page.
     
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
+    Args:
+        calls_data: Parsed JSON response from the /calls/ endpoint
     
-    try:
-        response = requests.post(auth_url, data=auth_data, headers=headers)
-        response.raise_for_status()
-        
-        auth_result = response.json()
-        token = auth_result.get("access_token")
+    Returns:
+        tuple: (calls: list, total_count: int or None); calls is None for an unknown format
+    """
+    if isinstance(calls_data, list):
+        return calls_data, None
+    
+    if isinstance(calls_data, dict):
+        total_count = None
+        for key in ('total', 'total_count', 'count'):
+            if isinstance(calls_data.get(key), int):
+                total_count = calls_data[key]
+                break
         
-        if token:
-            print(f"Authentication successful. Token received.")
-            return token
-        else:
-            print("Authentication failed: No token in response")
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Authentication error: {e}")
-        return None
-    except Exception as e:
-        print(f"Unexpected error during authentication: {e}")
-        return None
+        if 'calls' in calls_data:
+            return calls_data['calls'], total_count
+        if 'results' in calls_data:
+            return calls_data['results'], total_count
+    
+    print("Unexpected response format for calls data")
+    print(f"Debug: Response keys = {list(calls_data.keys()) if isinstance(calls_data, dict) else 'Not a dict'}")
+    return None, None
 
-def get_recent_calls(hostname, token, client_id="@me"):
+def iter_recent_calls(hostname, token, client_id="@me", ordered=False, time_window=None):
     """
-    Get list of recent calls from Telphin API.
+    Iterate over recent calls from Telphin API, walking every page of the /calls/ endpoint.
+    
+    Calls are yielded as soon as their page arrives, so filtering can start before
+    the last page is fetched. When the first page reports the total count, the
+    remaining pages are fetched concurrently with at most CALLS_FETCH_CONCURRENCY
+    pages in flight, which keeps memory use flat for any window size.
     
     Args:
         hostname (str): Telphin hostname
-        token (str): Bearer token from authentication
+        token (str or TelphinTokenProvider): Bearer token or token provider
         client_id (str): Client ID, defaults to "@me"
+        ordered (bool): Yield pages in page order instead of arrival order
+        time_window (tuple): Optional (start_datetime, end_datetime) in UTC; defaults to last TIME_WINDOW_HOURS
     
-    Returns:
-        list: List of calls if successful, None if failed
+    Yields:
+        dict: Call records
+    
+    Raises:
+        requests.exceptions.RequestException: If a page request fails
+        ValueError: If the response format is not recognized
     """
-    from datetime import datetime, timedelta
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
     
-    time_window_hours = int(os.environ.get("TIME_WINDOW_HOURS", "6"))
-    moscow_now = datetime.now(MOSCOW_TZ)
-    moscow_now_utc = moscow_now.astimezone(pytz.UTC)
-    end_datetime = moscow_now_utc.strftime("%Y-%m-%d %H:%M:%S")
-    start_datetime = (moscow_now_utc - timedelta(hours=time_window_hours)).strftime("%Y-%m-%d %H:%M:%S")
+    page_size = int(os.environ.get("CALLS_PAGE_SIZE", "100"))
+    concurrency = max(1, int(os.environ.get("CALLS_FETCH_CONCURRENCY", "4")))
+    start_datetime, end_datetime = time_window or get_default_time_window()
     
-    calls_url = f"https://{hostname}/api/ver1.0/client/{client_id}/calls/"
+    calls_url = f"{get_api_base_url(hostname)}/api/ver1.0/client/{client_id}/calls/"
     
     headers = {
-        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
     
-    params = {
-        "start_datetime": start_datetime,
-        "end_datetime": end_datetime,
-        "per_page": 100
-    }
-    
-    try:
-        response = requests.get(calls_url, headers=headers, params=params)
+    def fetch_page(page):
+        params = {
+            "start_datetime": start_datetime,
+            "end_datetime": end_datetime,
+            "per_page": page_size,
+            "page": page
+        }
+        response = telphin_get(calls_url, token, headers=headers, params=params)
         response.raise_for_status()
         
-        calls_data = response.json()
-        
-        if isinstance(calls_data, dict) and 'calls' in calls_data:
-            calls_list = calls_data['calls']
-            print(f"Successfully retrieved {len(calls_list)} calls (last {time_window_hours} hours)")
-            return calls_list
-        elif isinstance(calls_data, list):
-            print(f"Successfully retrieved {len(calls_data)} calls (last {time_window_hours} hours)")
-            return calls_data
-        elif isinstance(calls_data, dict) and 'results' in calls_data:
-            calls_list = calls_data['results']
-            print(f"Successfully retrieved {len(calls_list)} calls (last {time_window_hours} hours)")
-            return calls_list
-        else:
-            print("Unexpected response format for calls data")
-            print(f"Debug: Response keys = {list(calls_data.keys()) if isinstance(calls_data, dict) else 'Not a dict'}")
-            return None
-            
+        calls_list, total_count = _extract_calls_page(response.json())
+        if calls_list is None:
+            raise ValueError("Unexpected response format for calls data")
+        return calls_list, total_count
+    
+    calls_list, total_count = fetch_page(1)
+    yielded = len(calls_list)
+    yield from calls_list
+    
+    if len(calls_list) < page_size:
+        print(f"Successfully retrieved {yielded} calls in 1 page ({start_datetime} - {end_datetime} UTC)")
+        return
+    
+    if total_count is None:
+        # Общее количество неизвестно - идём по страницам последовательно до неполной страницы
+        page = 1
+        while len(calls_list) == page_size:
+            page += 1
+            calls_list, _ = fetch_page(page)
+            yielded += len(calls_list)
+            yield from calls_list
+        print(f"Successfully retrieved {yielded} calls in {page} pages ({start_datetime} - {end_datetime} UTC)")
+        return
+    
+    total_pages = (total_count + page_size - 1) // page_size
+    pending_pages = iter(range(2, total_pages + 1))
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = {}
+        for page in pending_pages:
+            in_flight[page] = executor.submit(fetch_page, page)
+            if len(in_flight) >= concurrency:
+                break
+        
+        try:
+            while in_flight:
+                if ordered:
+                    done_pages = [min(in_flight)]
+                    in_flight[done_pages[0]].result()
+                else:
+                    done, _ = wait(in_flight.values(), return_when=FIRST_COMPLETED)
+                    done_pages = [page for page, future in in_flight.items() if future in done]
+                
+                for page in sorted(done_pages):
+                    calls_list, _ = in_flight.pop(page).result()
+                    next_page = next(pending_pages, None)
+                    if next_page is not None:
+                        in_flight[next_page] = executor.submit(fetch_page, next_page)
+                    yielded += len(calls_list)
+                    yield from calls_list
+        finally:
+            for future in in_flight.values():
+                future.cancel()
+    
+    print(f"Successfully retrieved {yielded} calls in {total_pages} pages ({start_datetime} - {end_datetime} UTC)")
+
+def get_recent_calls(hostname, token, client_id="@me", time_window=None):
+    """
+    Get list of recent calls from Telphin API (all pages).
+    
+    Args:
+        hostname (str): Telphin hostname
+        token (str or TelphinTokenProvider): Bearer token or token provider
+        client_id (str): Client ID, defaults to "@me"
+        time_window (tuple): Optional (start_datetime, end_datetime) in UTC
+    
+    Returns:
+        list: List of calls if successful, None if failed
+    """
+    try:
+        return list(iter_recent_calls(hostname, token, client_id, ordered=True, time_window=time_window))
     except requests.exceptions.RequestException as e:
         print(f"Error retrieving calls: {e}")
         return None
@@ -178,42 +292,44 @@ def get_recent_calls(hostname, token, client_id="@me"):
         print(f"Unexpected error retrieving calls: {e}")
         return None
 
-def get_call_cdr(hostname, token, call_uuid):
+def get_call_cdr(hostname, token, call_uuid, cdr_index=None, time_window=None):
     """
     Get call detail record (CDR) for a specific call to find recording information.
     
     Args:
         hostname (str): Telphin hostname
-        token (str): Bearer token from authentication
+        token (str or TelphinTokenProvider): Bearer token or token provider
         call_uuid (str): UUID of the call to get CDR for
+        cdr_index (CDRIndex): Optional per-cycle CDR index; when given no HTTP request is made
+        time_window (tuple): Optional (start_datetime, end_datetime) in UTC
     
     Returns:
         dict: CDR data if successful, None if failed
     """
-    from datetime import datetime, timedelta
+    if cdr_index is not None:
+        cdr_record = cdr_index.get(call_uuid)
+        if not cdr_record:
+            log_event("WARNING", "cdr_not_found", call_uuid=call_uuid, source="index")
+        return cdr_record
     
-    time_window_hours = int(os.environ.get("TIME_WINDOW_HOURS", "6"))
-    moscow_now = datetime.now(MOSCOW_TZ)
-    moscow_now_utc = moscow_now.astimezone(pytz.UTC)
-    end_datetime = moscow_now_utc.strftime("%Y-%m-%d %H:%M:%S")
-    start_datetime = (moscow_now_utc - timedelta(hours=time_window_hours)).strftime("%Y-%m-%d %H:%M:%S")
+    start_datetime, end_datetime = time_window or get_default_time_window()
     
-    cdr_url = f"https://{hostname}/api/ver1.0/client/@me/cdr/"
+    cdr_url = f"{get_api_base_url(hostname)}/api/ver1.0/client/@me/cdr/"
     
     headers = {
-        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
     
     params = {
         "start_datetime": start_datetime,
         "end_datetime": end_datetime,
-        "per_page": 1000
+        "per_page": CDR_PAGE_SIZE
     }
     
     try:
-        print(f"Getting CDR data to find recording info for call {call_uuid} (last {time_window_hours} hours)...")
-        response = requests.get(cdr_url, headers=headers, params=params)
+        log_event("DEBUG", "cdr_request", call_uuid=call_uuid, start=start_datetime, end=end_datetime)
+        cdr_request_stats["requests"] += 1
+        response = telphin_get(cdr_url, token, headers=headers, params=params)
         response.raise_for_status()
         
         cdr_data = response.json()
@@ -222,103 +338,219 @@ def get_call_cdr(hostname, token, call_uuid):
             cdr_list = cdr_data['cdr']
             for cdr_record in cdr_list:
                 if cdr_record.get('call_uuid') == call_uuid:
-                    print(f"Found CDR record for call {call_uuid}")
+                    log_event("DEBUG", "cdr_found", call_uuid=call_uuid)
                     return cdr_record
-            print(f"Call {call_uuid} not found in CDR data")
+            log_event("WARNING", "cdr_not_found", call_uuid=call_uuid, source="api")
             return None
         else:
-            print("Unexpected CDR response format")
+            log_event("ERROR", "cdr_unexpected_response", call_uuid=call_uuid)
             return None
             
     except requests.exceptions.RequestException as e:
-        print(f"Error getting CDR for call {call_uuid}: {e}")
+        log_event("ERROR", "cdr_request_failed", call_uuid=call_uuid, error=str(e))
         return None
     except Exception as e:
-        print(f"Unexpected error getting CDR: {e}")
+        log_event("ERROR", "cdr_request_failed", call_uuid=call_uuid, error=str(e), unexpected=True)
         return None
 
-def download_recording(hostname, token, call_uuid):
+def fetch_cdr_index(hostname, token, time_window=None):
+    """
+    Fetch all CDR records for the time window once and index them by call_uuid and record_uuid.
+    Walks every page of the /cdr/ endpoint so that no call is lost on busy days.
+    
+    Args:
+        hostname (str): Telphin hostname
+        token (str or TelphinTokenProvider): Bearer token or token provider
+        time_window (tuple): Optional (start_datetime, end_datetime) in UTC
+    
+    Returns:
+        CDRIndex: Index of CDR records if successful, None if failed
+    """
+    start_datetime, end_datetime = time_window or get_default_time_window()
+    
+    cdr_url = f"{get_api_base_url(hostname)}/api/ver1.0/client/@me/cdr/"
+    
+    headers = {
+        "Content-Type": "application/json"
+    }
+    
+    cdr_index = CDRIndex()
+    page = 1
+    
+    try:
+        print(f"Building CDR index ({start_datetime} - {end_datetime} UTC)...")
+        while True:
+            params = {
+                "start_datetime": start_datetime,
+                "end_datetime": end_datetime,
+                "per_page": CDR_PAGE_SIZE,
+                "page": page
+            }
+            cdr_request_stats["requests"] += 1
+            cdr_index.request_count += 1
+            response = telphin_get(cdr_url, token, headers=headers, params=params)
+            response.raise_for_status()
+            
+            cdr_data = response.json()
+            
+            if not isinstance(cdr_data, dict) or 'cdr' not in cdr_data:
+                print("Unexpected CDR response format")
+                return None
+            
+            cdr_list = cdr_data['cdr']
+            cdr_index.add_records(cdr_list)
+            
+            if len(cdr_list) < CDR_PAGE_SIZE:
+                break
+            page += 1
+        
+        print(f"CDR index built: {len(cdr_index)} calls, {cdr_index.request_count} CDR requests")
+        return cdr_index
+        
+    except requests.exceptions.RequestException as e:
+        print(f"Error building CDR index: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected error building CDR index: {e}")
+        return None
+
+def download_recording(hostname, token, call_uuid, cdr_index=None):
     """
     Download audio recording for a specific call from Telphin API.
     First gets CDR to find recording info, then downloads from storage_url if available.
     
     Args:
         hostname (str): Telphin hostname
-        token (str): Bearer token from authentication
+        token (str or TelphinTokenProvider): Bearer token or token provider
         call_uuid (str): UUID of the call to download recording for
+        cdr_index (CDRIndex): Optional per-cycle CDR index to look the call up in
     
     Returns:
         bytes: Binary audio content if successful, None if failed
     """
-    cdr_record = get_call_cdr(hostname, token, call_uuid)
+    cdr_record = get_call_cdr(hostname, token, call_uuid, cdr_index)
     
     if not cdr_record:
-        print(f"Could not get CDR for call {call_uuid}")
+        log_event("WARNING", "recording_cdr_missing", call_uuid=call_uuid)
         return None
     
     record_file_size = cdr_record.get('record_file_size', 0)
     storage_url = cdr_record.get('storage_url')
     record_uuid = cdr_record.get('record_uuid')
     
-    print(f"CDR info - File size: {record_file_size}, Storage URL: {storage_url}, Record UUID: {record_uuid}")
+    log_event("DEBUG", "recording_cdr", call_uuid=call_uuid, file_size=record_file_size,
+              storage_url=storage_url, record_uuid=record_uuid)
     
-    if record_file_size == 0:
-        print(f"No recording available for call {call_uuid} (file size is 0)")
+    if not record_file_size:
+        log_event("INFO", "recording_empty", call_uuid=call_uuid)
         return None
     
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-    
     if storage_url:
         try:
-            print(f"Trying to download from storage_url: {storage_url}")
-            response = requests.get(storage_url, headers=headers)
+            log_event("DEBUG", "recording_download", call_uuid=call_uuid, method="storage_url", url=storage_url)
+            response = telphin_get(storage_url, token, endpoint="telphin_download")
             if response.status_code == 200:
-                print(f"Successfully downloaded recording from storage_url ({len(response.content)} bytes)")
+                log_event("DEBUG", "recording_download_ok", call_uuid=call_uuid, method="storage_url",
+                          bytes=len(response.content))
                 return response.content
             else:
-                print(f"Storage URL failed with status {response.status_code}")
+                log_event("WARNING", "recording_download_failed", call_uuid=call_uuid, method="storage_url",
+                          status=response.status_code)
         except Exception as e:
-            print(f"Error downloading from storage_url: {e}")
+            log_event("WARNING", "recording_download_failed", call_uuid=call_uuid, method="storage_url", error=str(e))
     
     if record_uuid:
         try:
-            recording_url = f"https://{hostname}/api/ver1.0/client/@me/record/{record_uuid}/"
-            print(f"Trying to download using record_uuid: {recording_url}")
-            response = requests.get(recording_url, headers=headers)
+            recording_url = f"{get_api_base_url(hostname)}/api/ver1.0/client/@me/record/{record_uuid}/"
+            log_event("DEBUG", "recording_download", call_uuid=call_uuid, method="record_uuid", url=recording_url)
+            response = telphin_get(recording_url, token, endpoint="telphin_download")
             if response.status_code == 200:
-                print(f"Successfully downloaded recording using record_uuid ({len(response.content)} bytes)")
+                log_event("DEBUG", "recording_download_ok", call_uuid=call_uuid, method="record_uuid",
+                          bytes=len(response.content))
                 return response.content
             else:
-                print(f"Record UUID method failed with status {response.status_code}")
+                log_event("WARNING", "recording_download_failed", call_uuid=call_uuid, method="record_uuid",
+                          status=response.status_code)
         except Exception as e:
-            print(f"Error downloading using record_uuid: {e}")
+            log_event("WARNING", "recording_download_failed", call_uuid=call_uuid, method="record_uuid", error=str(e))
     
     try:
-        recording_url = f"https://{hostname}/api/ver1.0/client/@me/record/{call_uuid}/"
-        print(f"Trying original method with call_uuid: {recording_url}")
-        response = requests.get(recording_url, headers=headers)
+        recording_url = f"{get_api_base_url(hostname)}/api/ver1.0/client/@me/record/{call_uuid}/"
+        log_event("DEBUG", "recording_download", call_uuid=call_uuid, method="call_uuid", url=recording_url)
+        response = telphin_get(recording_url, token, endpoint="telphin_download")
         
         if response.status_code == 404:
-            print(f"No recording found for call {call_uuid} using original method")
+            log_event("INFO", "recording_not_found", call_uuid=call_uuid, method="call_uuid")
             return None
         elif response.status_code == 200:
-            print(f"Successfully downloaded recording using original method ({len(response.content)} bytes)")
+            log_event("DEBUG", "recording_download_ok", call_uuid=call_uuid, method="call_uuid",
+                      bytes=len(response.content))
             return response.content
         else:
             response.raise_for_status()
             
     except requests.exceptions.RequestException as e:
-        print(f"Error downloading recording for call {call_uuid}: {e}")
+        log_event("ERROR", "recording_download_failed", call_uuid=call_uuid, method="call_uuid", error=str(e))
         return None
     except Exception as e:
-        print(f"Unexpected error downloading recording: {e}")
+        log_event("ERROR", "recording_download_failed", call_uuid=call_uuid, method="call_uuid", error=str(e),
+                  unexpected=True)
         return None
 
+def is_mp3_audio(audio_data):
+    """Check if audio data is an MP3/MP4 recording as delivered by Telphin."""
+    return audio_data.startswith(b'ID3') or audio_data[4:8] == b'ftyp'
+
+def convert_for_yandex(audio_data):
+    """
+    Convert an MP3/MP4 recording to OGG Opus for Yandex SpeechKit.
+    Recordings longer than the Yandex sync limit are not converted.
+    
+    The duration is read from the file headers; if they cannot be parsed it
+    is taken from the converted OGG stream of the same ffmpeg run.
+    
+    Args:
+        audio_data (bytes): Binary MP3/MP4 audio content
+    
+    Returns:
+        tuple: (ogg_data: bytes or None, duration: float or None);
+               ogg_data is None if the recording is too long or conversion failed
+    """
+    duration = get_audio_duration(audio_data)
+    if duration is not None:
+        log_event("DEBUG", "audio_duration", duration=round(duration, 1))
+        if duration > YANDEX_MAX_DURATION_SECONDS:
+            log_event("INFO", "conversion_skipped", duration=round(duration, 1), limit=YANDEX_MAX_DURATION_SECONDS)
+            return None, duration
+    
+    ogg_data = convert_to_ogg_opus(audio_data)
+    if ogg_data is None:
+        return None, duration
+    
+    if duration is None:
+        duration = get_ogg_opus_duration(ogg_data)
+        if duration is not None and duration > YANDEX_MAX_DURATION_SECONDS:
+            log_event("INFO", "conversion_skipped", duration=round(duration, 1), limit=YANDEX_MAX_DURATION_SECONDS)
+            return None, duration
+    
+    log_event("DEBUG", "audio_converted", format="oggopus", bytes=len(ogg_data))
+    return ogg_data, duration
+
+def _yandex_chunk_settings():
+    """Chunking settings that affect the chunked transcript, also used as cache parameters"""
+    return {
+        **YANDEX_RECOGNITION_PARAMS,
+        "chunk_seconds": min(float(os.environ.get("YANDEX_CHUNK_SECONDS", "28")), YANDEX_MAX_DURATION_SECONDS),
+        "silence_threshold_db": os.environ.get("SILENCE_THRESHOLD_DB", "-35"),
+        "silence_min_seconds": os.environ.get("SILENCE_MIN_SECONDS", "0.3"),
+    }
+
+@cached_transcription("yandex", _yandex_chunk_settings)
 def transcribe_with_yandex(api_key, audio_data):
     """
     Transcribe audio data using Yandex SpeechKit API.
+    MP3/MP4 input is converted to OGG Opus first; OGG Opus input is sent as is.
+    Recordings over the sync limits are transcribed in chunks.
     
     Args:
         api_key (str): Yandex SpeechKit API key
@@ -328,124 +560,147 @@ def transcribe_with_yandex(api_key, audio_data):
         str: Transcribed text if successful, None if failed
     """
     if not api_key or api_key == "your_yandex_api_key":
-        print("Error: YANDEX_API_KEY not configured")
+        log_event("ERROR", "yandex_stt_unavailable", reason="YANDEX_API_KEY not configured")
         return None
         
     if not audio_data:
-        print("Error: No audio data provided")
+        log_event("ERROR", "yandex_stt_no_audio")
         return None
     
-    if len(audio_data) > 1048576:
-        print(f"Error: Audio file too large ({len(audio_data)} bytes). Maximum size is 1 MB.")
-        return None
+    if len(audio_data) > YANDEX_MAX_AUDIO_BYTES:
+        log_event("DEBUG", "yandex_stt_chunked", reason="size", bytes=len(audio_data))
+        return transcribe_with_yandex_chunked.__wrapped__(api_key, audio_data)
     
-    if audio_data.startswith(b'ID3') or audio_data[4:8] == b'ftyp':
-        print("Detected MP3 format from Telphin. Converting to OGG Opus for Yandex SpeechKit...")
-        
-        import tempfile
-        import subprocess
+    if is_mp3_audio(audio_data):
+        log_event("DEBUG", "audio_conversion", source="mp3", target="oggopus")
         
-        try:
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as mp3_file:
-                mp3_file.write(audio_data)
-                mp3_path = mp3_file.name
-            
-            duration_cmd = [
-                'ffprobe', '-v', 'quiet', '-show_entries', 'format=duration',
-                '-of', 'csv=p=0', mp3_path
-            ]
-            
-            duration_result = subprocess.run(duration_cmd, capture_output=True, text=True)
-            if duration_result.returncode == 0:
-                try:
-                    duration = float(duration_result.stdout.strip())
-                    print(f"Audio duration: {duration:.1f} seconds")
-                    
-                    if duration > 30:
-                        print(f"⚠️ Skipping transcription: audio duration ({duration:.1f}s) exceeds Yandex SpeechKit limit of 30s")
-                        import os
-                        os.unlink(mp3_path)
-                        return "Аудиозапись слишком длинная для транскрипции (более 30 секунд)"
-                except ValueError:
-                    print("Could not parse audio duration, proceeding with conversion...")
-            
-            with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as ogg_file:
-                ogg_path = ogg_file.name
-            
-            result = subprocess.run([
-                'ffmpeg', '-i', mp3_path, '-c:a', 'libopus', '-b:a', '64k', 
-                '-vn', '-f', 'ogg', ogg_path, '-y'
-            ], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                with open(ogg_path, 'rb') as f:
-                    audio_data = f.read()
-                print(f"Successfully converted MP3 to OGG Opus ({len(audio_data)} bytes)")
-            else:
-                print(f"FFmpeg conversion failed: {result.stderr}")
-                return None
-                
-            import os
-            os.unlink(mp3_path)
-            os.unlink(ogg_path)
-            
-        except Exception as e:
-            print(f"Error during audio conversion: {e}")
+        ogg_data, duration = convert_for_yandex(audio_data)
+        if duration is not None and duration > YANDEX_MAX_DURATION_SECONDS:
+            return transcribe_with_yandex_chunked.__wrapped__(api_key, audio_data)
+        if ogg_data is None:
             return None
+        audio_data = ogg_data
+    
+    return recognize_with_yandex(api_key, audio_data, {"format": "oggopus"})
+
+def recognize_with_yandex(api_key, audio_data, audio_params):
+    """
+    Send one audio fragment to the Yandex SpeechKit sync recognition API.
     
-    transcription_url = "https://stt.api.cloud.yandex.net/speech/v1/stt:recognize"
+    Args:
+        api_key (str): Yandex SpeechKit API key
+        audio_data (bytes): Audio within the sync limits (30 s, 1 MB)
+        audio_params (dict): Format parameters, e.g. {"format": "oggopus"}
+    
+    Returns:
+        str: Transcribed text (empty for silence), None if failed
+    """
+    transcription_url = os.environ.get("YANDEX_STT_URL", YANDEX_STT_URL)
     
     headers = {
         "Authorization": f"Api-Key {api_key}",
         "Content-Type": "application/octet-stream"
     }
     
-    params = {
-        "lang": "ru-RU",
-        "format": "oggopus",
-        "topic": "general"
-    }
+    params = {**YANDEX_RECOGNITION_PARAMS, **audio_params}
     
     try:
-        print(f"Sending {len(audio_data)} bytes to Yandex SpeechKit for transcription...")
-        print(f"Request URL: {transcription_url}")
-        print(f"Parameters: {params}")
+        log_event("DEBUG", "yandex_stt_request", bytes=len(audio_data), url=transcription_url, params=params)
         
-        response = requests.post(
+        response = http_request(
+            "POST",
             transcription_url, 
+            endpoint="yandex_stt",
             headers=headers, 
             params=params, 
             data=audio_data
         )
         
-        print(f"Response status: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
+        # Заголовки и тело ответа пишем только в DEBUG - на каждом фрагменте это лишний I/O
+        if is_enabled("DEBUG"):
+            log_event("DEBUG", "yandex_stt_response", status=response.status_code, headers=dict(response.headers))
         
         if response.status_code != 200:
-            print(f"Response content: {response.text}")
+            log_event("WARNING", "yandex_stt_http_error", status=response.status_code, body=response.text[:500])
             response.raise_for_status()
         
         result = response.json()
-        print(f"Response JSON: {result}")
         
         if 'result' in result:
             transcribed_text = result['result']
-            print(f"Transcription successful: {len(transcribed_text)} characters")
+            log_event("DEBUG", "yandex_stt_result", characters=len(transcribed_text))
             return transcribed_text
         else:
-            print("Unexpected response format from Yandex SpeechKit")
-            print(f"Response: {result}")
+            log_event("ERROR", "yandex_stt_unexpected_response", response=result)
             return None
             
     except requests.exceptions.RequestException as e:
-        print(f"Error during transcription: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Error response content: {e.response.text}")
+        body = e.response.text[:500] if getattr(e, 'response', None) is not None else None
+        log_event("ERROR", "yandex_stt_failed", error=str(e), body=body)
         return None
     except Exception as e:
-        print(f"Unexpected error during transcription: {e}")
+        log_event("ERROR", "yandex_stt_failed", error=str(e))
+        return None
+
+@cached_transcription("yandex_chunked", _yandex_chunk_settings)
+def transcribe_with_yandex_chunked(api_key, audio_data):
+    """
+    Transcribe a recording longer than the Yandex sync limits in parallel chunks.
+    
+    The recording is decoded to 16 kHz PCM once, split at silences into chunks
+    of at most YANDEX_CHUNK_SECONDS (default 28), and the chunks are recognized
+    concurrently by YANDEX_CHUNK_CONCURRENCY (default 4) workers. The texts are
+    joined in order, each prefixed with its start time.
+    
+    Args:
+        api_key (str): Yandex SpeechKit API key
+        audio_data (bytes): Binary audio content to transcribe
+    
+    Returns:
+        str: Transcript with "[mm:ss]" timestamps, None if any chunk failed
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    pcm_data, silences = decode_to_pcm(audio_data)
+    if not pcm_data:
+        log_event("ERROR", "chunked_decode_failed")
         return None
+    
+    bytes_per_second = 2 * PCM_SAMPLE_RATE
+    total_duration = len(pcm_data) / bytes_per_second
+    max_chunk_seconds = _yandex_chunk_settings()["chunk_seconds"]
+    chunks = split_at_silences(total_duration, silences, max_chunk_seconds)
+    concurrency = max(1, int(os.environ.get("YANDEX_CHUNK_CONCURRENCY", "4")))
+    log_event("DEBUG", "chunked_transcription_start", duration=round(total_duration, 1), chunks=len(chunks),
+              concurrency=concurrency)
+    
+    audio_params = {"format": "lpcm", "sampleRateHertz": str(PCM_SAMPLE_RATE)}
+    
+    def recognize_chunk(chunk):
+        start, end = chunk
+        # Границы выравниваем по сэмплам (2 байта на сэмпл)
+        fragment = pcm_data[int(start * PCM_SAMPLE_RATE) * 2:int(end * PCM_SAMPLE_RATE) * 2]
+        return recognize_with_yandex(api_key, fragment, audio_params)
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        texts = list(executor.map(recognize_chunk, chunks))
+    
+    if any(text is None for text in texts):
+        failed = sum(1 for text in texts if text is None)
+        log_event("ERROR", "chunked_transcription_incomplete", failed=failed, chunks=len(chunks))
+        return None
+    
+    lines = []
+    for (start, _), text in zip(chunks, texts):
+        if text.strip():
+            minutes, seconds = divmod(int(start), 60)
+            lines.append(f"[{minutes:02d}:{seconds:02d}] {text.strip()}")
+    
+    transcript = "\n".join(lines)
+    log_event("DEBUG", "chunked_transcription_done", characters=len(transcript), chunks=len(chunks))
+    return transcript
 
+@cached_transcription("whisper", lambda: {"model": "whisper-1", "language": "ru"})
 def transcribe_with_openai(api_key, audio_data):
     """
     Transcribe audio data using OpenAI Whisper API as fallback for longer recordings.
@@ -458,50 +713,36 @@ def transcribe_with_openai(api_key, audio_data):
         str: Transcribed text if successful, None if failed
     """
     if not api_key:
-        print("Error: OPENAI_API_KEY not configured")
+        log_event("ERROR", "whisper_unavailable", reason="OPENAI_API_KEY not configured")
         return None
         
     if not audio_data:
-        print("Error: No audio data provided")
+        log_event("ERROR", "whisper_no_audio")
         return None
     
     if len(audio_data) > 25 * 1024 * 1024:
-        print(f"Error: Audio file too large ({len(audio_data)} bytes). Maximum size is 25 MB.")
+        log_event("ERROR", "whisper_audio_too_large", bytes=len(audio_data), limit=25 * 1024 * 1024)
         return None
     
     try:
-        import tempfile
+        log_event("DEBUG", "whisper_request", bytes=len(audio_data))
         
-        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-            temp_file.write(audio_data)
-            temp_path = temp_file.name
-        
-        print(f"Sending {len(audio_data)} bytes to OpenAI Whisper for transcription...")
-        
-        client = openai.OpenAI(api_key=api_key)
-        
-        with open(temp_path, 'rb') as audio_file:
-            transcript = client.audio.transcriptions.create(
+        # Общий асинхронный клиент и лимит запросов вместо нового клиента на каждый вызов
+        transcript = get_scheduler(api_key).run(
+            "whisper-1",
+            lambda client: client.audio.transcriptions.create(
                 model="whisper-1",
-                file=audio_file,
+                file=("audio.mp3", audio_data),
                 language="ru"
             )
-        
-        import os
-        os.unlink(temp_path)
+        )
         
         transcribed_text = transcript.text
-        print(f"OpenAI Whisper transcription successful: {len(transcribed_text)} characters")
+        log_event("DEBUG", "whisper_result", characters=len(transcribed_text))
         return transcribed_text
         
     except Exception as e:
-        print(f"Error during OpenAI Whisper transcription: {e}")
-        if 'temp_path' in locals():
-            import os
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        log_event("ERROR", "whisper_failed", error=str(e))
         return None
 
 def analyze_with_gpt(transcript, call_info=None):
@@ -609,19 +850,22 @@ async def send_telegram_report(report_text):
         print(f"Error sending Telegram report: {e}")
         return False
 
-def has_recording(hostname, token, call_uuid):
+def has_recording(hostname, token, call_uuid, cdr_index=None):
     """
     Check if a call has an audio recording available by checking CDR data.
     
     Args:
         hostname (str): Telphin hostname
-        token (str): Bearer token from authentication
+        token (str or TelphinTokenProvider): Bearer token or token provider
         call_uuid (str): UUID of the call to check
+        cdr_index (CDRIndex): Optional per-cycle CDR index to look the call up in
     
     Returns:
         tuple: (has_recording: bool, file_size: int)
     """
     try:
+        if cdr_index is not None:
+            return cdr_index.has_recording(call_uuid)
         cdr_record = get_call_cdr(hostname, token, call_uuid)
         if cdr_record and cdr_record.get('record_file_size', 0) > 0:
             return True, cdr_record.get('record_file_size', 0)
@@ -681,6 +925,10 @@ def main():
     successful_reports = 0
     
     print("\n4. Filtering for incoming calls with recordings...")
+    reset_cdr_request_count()
+    cdr_index = fetch_cdr_index(hostname, token)
+    if cdr_index is None:
+        print("⚠️ CDR index unavailable, falling back to per-call CDR lookups")
     incoming_calls_with_recordings = []
     
     for call in new_calls:
@@ -695,7 +943,7 @@ def main():
             print(f"Skipping call: missing call_uuid")
             continue
             
-        has_rec, rec_size = has_recording(hostname, token, call_uuid)
+        has_rec, rec_size = has_recording(hostname, token, call_uuid, cdr_index)
         
         if has_rec:
             incoming_calls_with_recordings.append(call)
@@ -727,17 +975,17 @@ def main():
         print(f"\nProcessing incoming call {i+1}/{len(incoming_calls_with_recordings)}: {call_uuid}")
         print(f"  Details: {moscow_time_str} | {call.get('duration')}s | {call.get('flow')} | {call.get('result')}")
         
-        audio_data = download_recording(hostname, token, call_uuid)
+        audio_data = download_recording(hostname, token, call_uuid, cdr_index)
         
         if audio_data:
             processed_count += 1
             print(f"✅ Recording found! Processing...")
             
-            # Transcribe with Yandex SpeechKit first, fallback to OpenAI for longer recordings
+            # Transcribe with Yandex SpeechKit first, fallback to OpenAI if it fails
             transcribed_text = transcribe_with_yandex(yandex_api_key, audio_data)
             
-            if transcribed_text == "Аудиозапись слишком длинная для транскрипции (более 30 секунд)":
-                print("Yandex SpeechKit duration limit exceeded, trying OpenAI Whisper...")
+            if not transcribed_text:
+                print("Yandex SpeechKit transcription failed, trying OpenAI Whisper...")
                 openai_api_key = os.environ.get("OPENAI_API_KEY")
                 if openai_api_key:
                     transcribed_text = transcribe_with_openai(openai_api_key, audio_data)
@@ -843,40 +1091,89 @@ def main():
     print(f"New calls found: {len(new_calls)}")
     print(f"Incoming calls with recordings: {len(incoming_calls_with_recordings) if 'incoming_calls_with_recordings' in locals() else 0}")
     print(f"Calls processed: {processed_count}")
+    print(f"CDR HTTP requests: {get_cdr_request_count()}")
     print(f"Successful reports sent: {successful_reports}")
     print("Call analysis cycle completed.")
 
-def web_handler():
-    """Web handler for Heroku that binds to PORT immediately"""
-    import os
-    from flask import Flask
+def _run_process_job(job):
+    """Job runner for /process: one processing cycle of the worker, with progress per call"""
+    from main import main_new
+    summary = main_new(progress=job.update)
+    if summary is None:
+        raise RuntimeError("processing cycle could not run, see worker logs")
+    return summary
+
+def _run_deployment_check_job(job):
+    """Job runner for /deployment-check: the new cycle over the last 2 calls"""
+    from main import main_new
+    summary = main_new(deployment_check=True, progress=job.update)
+    if summary is None:
+        raise RuntimeError("deployment check could not run, see worker logs")
+    return summary
+
+def create_web_app(job_queue=None):
+    """
+    Build the Flask app of the web dyno.
+    
+    /process and /deployment-check queue a cycle and answer 202 with the job id
+    at once; /jobs/<id> reports its progress and result.
+    
+    Args:
+        job_queue (JobQueue): Queue to run cycles on, created if not given
     
+    Returns:
+        Flask: App with the routes registered
+    """
+    from flask import Flask, Response, jsonify, url_for
+    from metrics import render_metrics, CONTENT_TYPE
+    from jobs import JobQueue
+    
+    job_queue = job_queue or JobQueue({
+        "process": _run_process_job,
+        "deployment_check": _run_deployment_check_job,
+    })
     app = Flask(__name__)
     
+    def submit(kind):
+        job, joined = job_queue.submit(kind)
+        # Повторный запуск присоединяется к уже идущему циклу, а не обрабатывает звонки второй раз
+        body = {"job_id": job.id, "status": job.to_dict()["status"], "joined": joined}
+        response = jsonify(body)
+        response.status_code = 202
+        response.headers["Location"] = url_for("job_status", job_id=job.id)
+        return response
+    
     @app.route('/')
     def health_check():
         return "Call Analyzer is running", 200
     
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+    
     @app.route('/process')
     def process_calls():
-        try:
-            main()
-            return "Call processing completed", 200
-        except Exception as e:
-            return f"Error: {str(e)}", 500
+        return submit("process")
     
     @app.route('/deployment-check')
     def deployment_check():
-        try:
-            # Импортируем новую функцию
-            from main import main_new
-            main_new(deployment_check=True)
-            return "🚨 Deployment check completed - last 2 calls processed", 200
-        except Exception as e:
-            return f"Deployment check error: {str(e)}", 500
+        return submit("deployment_check")
+    
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "job not found"}), 404
+        return jsonify(job)
     
+    return app
+
+def web_handler():
+    """Web handler for Heroku that binds to PORT immediately"""
+    app = create_web_app()
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+    # threaded=True - /jobs/<id> отвечает, пока идёт цикл
+    app.run(host="0.0.0.0", port=port, threaded=True)
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,218 @@
+"""
+Prometheus-style metrics shared between the worker and the web process.
+
+The worker counts events in memory (inc(), observe(), set_gauge() are a dict
+update under a lock) and flush_metrics() writes the accumulated deltas into a
+metrics table of the call state database in one transaction, once per
+processing cycle. The web process renders that table in the Prometheus text
+format on /metrics, together with gauges read live from the database (outbox
+depth and age). Both processes must point CALL_STATE_DB at the same file.
+"""
+import re
+import time
+import sqlite3
+import threading
+
+import call_state
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CYCLE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800)
+LAG_BUCKETS = (60, 120, 300, 600, 900, 1800, 3600, 7200, 21600)
+
+# name: (type, help, buckets)
+METRICS = {
+    "analyzer_cycles_total": ("counter", "Processing cycles by result", None),
+    "analyzer_cycle_duration_seconds": ("histogram", "Duration of processing cycles", CYCLE_BUCKETS),
+    "analyzer_last_cycle_timestamp_seconds": ("gauge", "Unix time the last processing cycle finished", None),
+    "analyzer_watermark_lag_seconds": ("gauge", "Age of the polling watermark after the last cycle", None),
+    "analyzer_calls_total": ("counter", "Calls by pipeline step: fetched, new, with_recording, transcribed, alerted", None),
+    "analyzer_call_results_total": ("counter", "Final call statuses", None),
+    "analyzer_stage_duration_seconds": ("histogram", "Duration of per-call pipeline stages", STAGE_BUCKETS),
+    "analyzer_alert_lag_seconds": ("histogram", "Delay from call end to the alert accepted by Telegram", LAG_BUCKETS),
+    "analyzer_http_requests_total": ("counter", "Outbound HTTP requests by endpoint class", None),
+    "analyzer_http_failures_total": ("counter", "Outbound HTTP requests that failed after all retries", None),
+    "analyzer_api_retries_total": ("counter", "Retried API requests by API", None),
+    "analyzer_openai_requests_total": ("counter", "OpenAI requests sent by the scheduler", None),
+    "analyzer_openai_rate_limited_total": ("counter", "OpenAI requests answered with 429", None),
+    "analyzer_openai_tokens_total": ("counter", "OpenAI analysis tokens by cascade tier and kind", None),
+    "analyzer_openai_estimated_usage_total": ("counter", "Analysis requests whose token usage was estimated (stream closed early)", None),
+    "analyzer_cache_events_total": ("counter", "Transcript and analysis cache hits, misses, writes and evictions", None),
+    "analyzer_telegram_outbox_pending": ("gauge", "Alerts waiting in the Telegram outbox", None),
+    "analyzer_telegram_outbox_oldest_pending_age_seconds": ("gauge", "Age of the oldest undelivered alert", None),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+_lock = threading.Lock()
+_pending_counters = {}
+_pending_gauges = {}
+_prepared = set()
+
+def _get_connection():
+    conn = call_state.get_connection()
+    with _lock:
+        if call_state.CALL_STATE_DB not in _prepared:
+            conn.executescript(SCHEMA)
+            _prepared.add(call_state.CALL_STATE_DB)
+    return conn
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items()))
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else f"{bound:g}"
+
+def inc(name, value=1, **labels):
+    """Add to a counter; the delta is written to the database by flush_metrics()"""
+    key = (name, _format_labels(labels))
+    with _lock:
+        _pending_counters[key] = _pending_counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    """Record a value in a histogram with the buckets defined in METRICS"""
+    buckets = METRICS[name][2]
+    with _lock:
+        # Пустые бакеты тоже пишем - Prometheus ждёт полный набор границ
+        for bound in buckets + (float("inf"),):
+            key = (f"{name}_bucket", _format_labels({**labels, "le": _format_bound(bound)}))
+            _pending_counters[key] = _pending_counters.get(key, 0) + (1 if value <= bound else 0)
+        label_text = _format_labels(labels)
+        for suffix, delta in (("_sum", value), ("_count", 1)):
+            key = (f"{name}{suffix}", label_text)
+            _pending_counters[key] = _pending_counters.get(key, 0) + delta
+
+def set_gauge(name, value, **labels):
+    """Set a gauge; the last value before flush_metrics() wins"""
+    with _lock:
+        _pending_gauges[(name, _format_labels(labels))] = value
+
+def flush_metrics():
+    """
+    Write pending counter deltas and gauges to the shared database.
+
+    Returns:
+        int: Number of written series
+    """
+    with _lock:
+        counters = dict(_pending_counters)
+        gauges = dict(_pending_gauges)
+        _pending_counters.clear()
+        _pending_gauges.clear()
+    if not counters and not gauges:
+        return 0
+
+    now = time.time()
+    try:
+        conn = _get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO metrics (name, labels, kind, value, updated_at) VALUES (?, ?, 'counter', ?, ?) "
+                "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value, updated_at = excluded.updated_at",
+                [(name, labels, value, now) for (name, labels), value in counters.items()]
+            )
+            conn.executemany(
+                "INSERT INTO metrics (name, labels, kind, value, updated_at) VALUES (?, ?, 'gauge', ?, ?) "
+                "ON CONFLICT (name, labels) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(name, labels, value, now) for (name, labels), value in gauges.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error as e:
+        # Метрики не должны ронять обработку звонков - вернём дельты до следующей попытки
+        print(f"⚠️ Failed to flush metrics: {e}")
+        with _lock:
+            for key, value in counters.items():
+                _pending_counters[key] = _pending_counters.get(key, 0) + value
+            for key, value in gauges.items():
+                _pending_gauges.setdefault(key, value)
+        return 0
+    return len(counters) + len(gauges)
+
+def _live_gauges():
+    """Gauges computed at scrape time from the shared database"""
+    # Импорт здесь: http_client и другие модули воркера импортируют metrics
+    from telegram_notifier import get_outbox_depth
+    pending, oldest_created_at = get_outbox_depth()
+    age = time.time() - oldest_created_at if oldest_created_at else 0
+    return {
+        ("analyzer_telegram_outbox_pending", ""): pending,
+        ("analyzer_telegram_outbox_oldest_pending_age_seconds", ""): max(0.0, age),
+    }
+
+def _family(series_name):
+    if series_name in METRICS:
+        return series_name
+    for suffix in ("_bucket", "_sum", "_count"):
+        base = series_name[:-len(suffix)] if series_name.endswith(suffix) else None
+        if base in METRICS and METRICS[base][0] == "histogram":
+            return base
+    return None
+
+def _series_order(item):
+    (name, labels), _ = item
+    # Бакеты гистограммы - по возрастанию границы, +Inf последним
+    match = re.search(r'(?:^|,)le="([^"]+)"', labels)
+    bound = float("inf") if match and match.group(1) == "+Inf" else float(match.group(1)) if match else 0
+    return (re.sub(r'(?:^|,)le="[^"]+"', '', labels), not name.endswith("_bucket"), bound, name)
+
+def render_metrics():
+    """
+    Render all published metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: Metrics page for the /metrics endpoint
+    """
+    series = {}
+    try:
+        for name, labels, value in _get_connection().execute("SELECT name, labels, value FROM metrics"):
+            series[(name, labels)] = value
+    except sqlite3.Error as e:
+        print(f"⚠️ Failed to read metrics: {e}")
+    try:
+        series.update(_live_gauges())
+    except sqlite3.Error as e:
+        print(f"⚠️ Failed to read outbox gauges: {e}")
+
+    families = {}
+    for key, value in series.items():
+        family = _family(key[0])
+        if family is not None:
+            families.setdefault(family, []).append((key, value))
+
+    lines = []
+    for family in METRICS:
+        if family not in families:
+            continue
+        kind, help_text, _ = METRICS[family]
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for (name, labels), value in sorted(families[family], key=_series_order):
+            lines.append(f"{name}{{{labels}}} {_format_value(value)}" if labels else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def reset_pending_metrics():
+    """Drop unflushed metrics, for tests"""
+    with _lock:
+        _pending_counters.clear()
+        _pending_gauges.clear()
@@ -0,0 +1,329 @@
+"""
+Shared async OpenAI client with a rate-limit-aware request scheduler.
+
+One AsyncOpenAI client runs on a background event loop for the whole
+process. Analyses and Whisper jobs from any pipeline thread are submitted
+to that loop and run concurrently; a per-model token bucket keeps them within
+OPENAI_RPM_LIMIT requests and OPENAI_TPM_LIMIT tokens per minute. The
+x-ratelimit-* headers of every response tighten the buckets to the quota the
+API actually reports, and 429 / 5xx answers are retried with backoff
+(Retry-After when the API sends it), pausing all requests to that model.
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+import contextvars
+
+import openai
+
+import metrics
+
+# Модель текущего запроса - нужна хуку ответа, чтобы обновить нужный лимит
+_current_model = contextvars.ContextVar("openai_scheduler_model", default=None)
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def _env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def parse_reset_duration(value):
+    """Parse x-ratelimit-reset-* values such as "20ms", "1s" or "6m0s" into seconds"""
+    if not value:
+        return None
+    matches = _DURATION_RE.findall(str(value))
+    if not matches:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in matches)
+
+def get_retry_delay(error, attempt):
+    """Delay before retrying a failed request: Retry-After headers, else exponential backoff with jitter"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+def is_retryable(error):
+    """True for rate limits, server errors and connection problems; never for exhausted quota"""
+    if getattr(error, 'code', None) == 'insufficient_quota':
+        return False
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+def estimate_tokens(messages=None, max_tokens=0):
+    """Rough token count of a chat request as counted against the TPM limit (prompt + max_tokens)"""
+    characters = sum(len(message.get('content') or '') for message in messages or [])
+    return characters // 3 + (max_tokens or 0)
+
+class RateLimiter:
+    """
+    Token buckets for requests and tokens per minute of one model.
+
+    Both buckets start full and refill continuously. Limits come from the
+    configuration and are lowered, never raised, by the API headers.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+        self.updated = now
+
+    def reserve(self, tokens, now=None):
+        """
+        Take one request and the given tokens if the budget allows.
+
+        Args:
+            tokens (int): Estimated tokens of the request
+            now (float): time.monotonic() value, for tests
+
+        Returns:
+            float: 0 if reserved, otherwise seconds to wait before trying again
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        # Запрос больше всего бюджета пропускаем при полном ведре, иначе он ждал бы вечно
+        tokens = min(tokens, self.tpm)
+        wait = 0.0
+        if self.requests < 1:
+            wait = max(wait, (1 - self.requests) * 60 / self.rpm)
+        if self.tokens < tokens:
+            wait = max(wait, (tokens - self.tokens) * 60 / self.tpm)
+        if wait > 0:
+            return wait
+
+        self.requests -= 1
+        self.tokens -= tokens
+        return 0.0
+
+    def refund(self, tokens):
+        """Return over-estimated tokens after the real usage is known"""
+        self.tokens = min(self.tpm, self.tokens + tokens)
+
+    def pause(self, seconds, now=None):
+        """Hold all requests of this model, e.g. after a 429"""
+        now = time.monotonic() if now is None else now
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def update_from_headers(self, headers, now=None):
+        """Adapt limits and remaining budget to the x-ratelimit-* response headers"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        for kind, bucket in (("requests", "requests"), ("tokens", "tokens")):
+            try:
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit:
+                    limit_attr = "rpm" if kind == "requests" else "tpm"
+                    setattr(self, limit_attr, min(getattr(self, limit_attr), float(limit)))
+                if remaining is not None:
+                    setattr(self, bucket, min(getattr(self, bucket), float(remaining)))
+            except ValueError:
+                continue
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is not None and float(remaining) < 1 and reset:
+                self.pause(reset, now)
+
+class OpenAIScheduler:
+    """
+    Runs OpenAI requests of all threads on one long-lived AsyncOpenAI client.
+
+    Limits: OPENAI_RPM_LIMIT (default 500), OPENAI_TPM_LIMIT (default 150000)
+    per model, OPENAI_MAX_CONCURRENCY (default 16) requests in flight and
+    OPENAI_MAX_RETRIES (default 5) retries of rate-limited or failed requests.
+    """
+
+    # Счётчики планировщика, которые публикуются в /metrics
+    EXPORTED_METRICS = {
+        "requests": ("analyzer_openai_requests_total", {}),
+        "retries": ("analyzer_api_retries_total", {"api": "openai"}),
+        "rate_limited": ("analyzer_openai_rate_limited_total", {}),
+    }
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.rpm = _env_number("OPENAI_RPM_LIMIT", "500")
+        self.tpm = _env_number("OPENAI_TPM_LIMIT", "150000")
+        self.max_concurrency = max(1, int(_env_number("OPENAI_MAX_CONCURRENCY", "16")))
+        self.max_retries = int(_env_number("OPENAI_MAX_RETRIES", "5"))
+        self.limiters = {}
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "throttled_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="openai-scheduler", daemon=True)
+        self.thread.start()
+        self.semaphore = None
+        self.client = None
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    async def _setup(self):
+        # Клиент и семафор создаются внутри цикла, которому принадлежат
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            max_retries=0,   # Повторы делает планировщик, с учётом общего лимита
+            http_client=openai.DefaultAsyncHttpxClient(event_hooks={"response": [self._on_response]})
+        )
+
+    def _limiter(self, model):
+        if model not in self.limiters:
+            self.limiters[model] = RateLimiter(self.rpm, self.tpm)
+        return self.limiters[model]
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+        if name in self.EXPORTED_METRICS:
+            metric, labels = self.EXPORTED_METRICS[name]
+            metrics.inc(metric, value, **labels)
+
+    async def _on_response(self, response):
+        model = _current_model.get()
+        if model is not None:
+            self._limiter(model).update_from_headers(response.headers)
+
+    async def request(self, model, call, estimated_tokens=0):
+        """
+        Run call(client) within the rate limits of the model, retrying rate limits and server errors.
+
+        Args:
+            model (str): Model name; limits are tracked per model
+            call (callable): Takes the AsyncOpenAI client and returns an awaitable
+            estimated_tokens (int): Tokens counted against the TPM budget
+
+        Returns:
+            Result of the awaited call
+        """
+        _current_model.set(model)
+        limiter = self._limiter(model)
+        attempt = 0
+        while True:
+            wait = limiter.reserve(estimated_tokens)
+            while wait > 0:
+                self._count("throttled_seconds", wait)
+                await asyncio.sleep(wait)
+                wait = limiter.reserve(estimated_tokens)
+
+            try:
+                async with self.semaphore:
+                    self._count("requests")
+                    result = await call(self.client)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                attempt += 1
+                delay = get_retry_delay(e, attempt)
+                if getattr(e, 'status_code', None) == 429:
+                    self._count("rate_limited")
+                    limiter.pause(delay)
+                self._count("retries")
+                print(f"⚠️ OpenAI {model} request failed ({e.__class__.__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            usage = getattr(result, 'usage', None)
+            total_tokens = getattr(usage, 'total_tokens', None)
+            if isinstance(total_tokens, int) and total_tokens < estimated_tokens:
+                limiter.refund(estimated_tokens - total_tokens)
+            return result
+
+    def submit(self, model, call, estimated_tokens=0):
+        """Schedule a request from any thread; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self.request(model, call, estimated_tokens), self.loop)
+
+    def run(self, model, call, estimated_tokens=0):
+        """Schedule a request and block the calling thread until it completes"""
+        return self.submit(model, call, estimated_tokens).result()
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self.stats:
+                self.stats[name] = 0.0 if name == "throttled_seconds" else 0
+
+    def close(self):
+        """Close the client and stop the event loop"""
+        try:
+            asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result(timeout=5)
+            # Досрочно закрытые потоки оставляют незавершённые асинхронные генераторы
+            asyncio.run_coroutine_threadsafe(self.loop.shutdown_asyncgens(), self.loop).result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler(api_key):
+    """
+    Get the process-wide scheduler, creating it on first use or when the API key changes.
+
+    Args:
+        api_key (str): OpenAI API key
+
+    Returns:
+        OpenAIScheduler: Shared scheduler
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler.api_key != api_key:
+            if _scheduler is not None:
+                _scheduler.close()
+            _scheduler = OpenAIScheduler(api_key)
+        return _scheduler
+
+def reset_scheduler():
+    """Close the shared scheduler; the next get_scheduler() creates a new client"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.close()
+        _scheduler = None
+
+def format_scheduler_stats():
+    """Return request, retry and throttling counters of the shared scheduler as a one-line summary"""
+    with _scheduler_lock:
+        scheduler = _scheduler
+    if scheduler is None:
+        return "no requests"
+    stats = scheduler.get_stats()
+    return (f"{stats['requests']} requests, {stats['retries']} retries "
+            f"({stats['rate_limited']} rate limited), throttled {stats['throttled_seconds']:.1f}s")
+
+def reset_scheduler_stats():
+    """Reset the counters of the shared scheduler at the start of a processing cycle"""
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.reset_stats()
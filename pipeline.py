@@ -0,0 +1,125 @@
+"""
+Staged call-processing pipeline with bounded worker pools.
+
+Each stage (download, convert, transcribe, analyze, notify) has its own pool
+of worker threads and a bounded queue in front of it, so network latencies of
+different calls overlap instead of adding up. Per-stage concurrency is set via
+PIPELINE_<STAGE>_WORKERS and the queue size via PIPELINE_QUEUE_SIZE.
+"""
+import os
+import queue
+import threading
+
+_STOP = object()
+
+class Stage:
+    """One pipeline stage: a function applied to each job by a pool of workers"""
+
+    def __init__(self, name, func, workers=None, default_workers=1):
+        self.name = name
+        self.func = func
+        if workers is None:
+            try:
+                workers = int(os.environ.get(f"PIPELINE_{name.upper()}_WORKERS", default_workers))
+            except ValueError:
+                workers = default_workers
+        self.workers = max(1, workers)
+
+class Pipeline:
+    """
+    Runs jobs through a sequence of stages.
+
+    A stage function receives a job and returns it to pass it on to the next
+    stage, or returns None when the job is finished early (e.g. no recording).
+    Unexpected exceptions are passed to on_error(job, stage_name, exc) and
+    finish the job. on_finish(job) is called for every finished job, e.g. to
+    report progress.
+    """
+
+    def __init__(self, stages, queue_size=None, on_error=None, on_finish=None):
+        self.stages = stages
+        if queue_size is None:
+            queue_size = int(os.environ.get("PIPELINE_QUEUE_SIZE", "8"))
+        self.queue_size = max(1, queue_size)
+        self.on_error = on_error
+        self.on_finish = on_finish
+        self.finished = []
+        self._finished_lock = threading.Lock()
+
+    def _finish(self, job):
+        with self._finished_lock:
+            self.finished.append(job)
+        if self.on_finish:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"❌ Pipeline finish handler failed: {e}")
+
+    def _worker(self, index, in_queue, out_queue, remaining):
+        stage = self.stages[index]
+        while True:
+            job = in_queue.get()
+            if job is _STOP:
+                with remaining['lock']:
+                    remaining['count'] -= 1
+                    last_worker = remaining['count'] == 0
+                # Последний воркер стадии передаёт сигнал остановки дальше
+                if last_worker and out_queue is not None:
+                    for _ in range(self.stages[index + 1].workers):
+                        out_queue.put(_STOP)
+                return
+
+            try:
+                result = stage.func(job)
+            except Exception as e:
+                print(f"❌ Pipeline stage '{stage.name}' failed: {e}")
+                if self.on_error:
+                    try:
+                        self.on_error(job, stage.name, e)
+                    except Exception as handler_error:
+                        print(f"❌ Pipeline error handler failed: {handler_error}")
+                result = None
+
+            if result is None or out_queue is None:
+                self._finish(job if result is None else result)
+            else:
+                out_queue.put(result)
+
+    def run(self, jobs):
+        """
+        Process jobs through all stages and wait until every job is finished.
+
+        Args:
+            jobs (iterable): Jobs to feed into the first stage
+
+        Returns:
+            list: Finished jobs in completion order
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            out_queue = queues[index + 1] if index + 1 < len(self.stages) else None
+            remaining = {'count': stage.workers, 'lock': threading.Lock()}
+            for worker_number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index, queues[index], out_queue, remaining),
+                    name=f"pipeline-{stage.name}-{worker_number}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            # Ограниченная очередь даёт обратное давление на подачу заданий
+            for job in jobs:
+                queues[0].put(job)
+        finally:
+            # Даже если источник заданий упал - воркеры дорабатывают поданное и завершаются
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+            for thread in threads:
+                thread.join()
+
+        return self.finished
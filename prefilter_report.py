@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Precision/recall report of the local pre-filter against labelled calls.
+
+Usage:
+    python prefilter_report.py [fixtures.json]
+
+Positives are calls labelled FAILED_SALE: they must reach the GPT analysis.
+Exits with code 1 if any FAILED_SALE call would be skipped.
+"""
+import os
+import sys
+import json
+from call_prefilter import evaluate_prefilter
+
+DEFAULT_FIXTURES = "prefilter_fixtures.json"
+
+def load_fixtures(path=DEFAULT_FIXTURES):
+    """Load labelled calls, reading transcript_file entries relative to the fixture file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for case in cases:
+        if 'transcript_file' in case:
+            with open(os.path.join(base_dir, case['transcript_file']), 'r', encoding='utf-8') as f:
+                case['transcript'] = f.read()
+    return cases
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FIXTURES
+    report = evaluate_prefilter(load_fixtures(path))
+    
+    print(f"=== Pre-filter report: {path} ===")
+    for case, decision in report['decisions']:
+        action = "→ LLM " if decision['send_to_llm'] else "⏭️ skip"
+        expected = "✅" if decision['send_to_llm'] == (case['label'] == "FAILED_SALE") else "❌"
+        print(f"{expected} {action} {case['id']:<28} label={case['label']:<13} {decision['reason']}")
+    
+    print(f"\nTP={report['tp']} FP={report['fp']} FN={report['fn']} TN={report['tn']}")
+    print(f"Precision: {report['precision']:.2f}")
+    print(f"Recall:    {report['recall']:.2f}")
+    print(f"Skipped:   {report['skip_rate']:.0%} of calls would not reach GPT")
+    
+    if report['fn']:
+        print("❌ Some FAILED_SALE calls would be skipped - lost alerts")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,9 @@
 Модуль для загрузки и управления промптами системы анализа звонков.
 """
 import os
+import hashlib
 from pathlib import Path
+from transcript_compaction import compact_transcript
 
 class PromptLoader:
     """Класс для загрузки промптов из файлов"""
@@ -10,6 +12,11 @@ class PromptLoader:
     def __init__(self, prompts_dir="prompts"):
         self.prompts_dir = Path(prompts_dir)
         self.prompts = {}
+        self.static_system_prompt = ""
+        self.static_triage_prompt = ""
+        self.prompt_version = ""
+        self.prompts_hash = ""
+        self._change_listeners = []
         self._load_all_prompts()
     
     def _load_all_prompts(self):
@@ -19,11 +26,36 @@ class PromptLoader:
             'classification': 'step1_classification.txt', 
             'manager_codes': 'manager_fault_codes.txt',
             'detailed_analysis': 'step2_detailed_analysis.txt',
-            'final_instructions': 'final_instructions.txt'
+            'final_instructions': 'final_instructions.txt',
+            'triage_instructions': 'triage_instructions.txt'
         }
         
         for key, filename in prompt_files.items():
             self.prompts[key] = self._load_prompt(filename)
+        
+        # Статическая часть собирается один раз на версию промптов: одинаковый
+        # префикс во всех запросах позволяет провайдеру кэшировать его
+        self.static_system_prompt = "\n\n".join(
+            self.prompts[key] for key in (
+                'system_context', 'classification', 'manager_codes',
+                'detailed_analysis', 'final_instructions'
+            ) if self.prompts[key]
+        )
+        # Короткий промпт первого уровня каскада: только классификация
+        self.static_triage_prompt = "\n\n".join(
+            self.prompts[key] for key in (
+                'system_context', 'classification', 'triage_instructions'
+            ) if self.prompts[key]
+        )
+        self.prompt_version = hashlib.sha256(
+            (self.static_system_prompt + self.static_triage_prompt).encode('utf-8')
+        ).hexdigest()[:12]
+        
+        # Хэш всех загруженных файлов промптов - часть ключа кэша анализа
+        prompts_digest = hashlib.sha256()
+        for key in sorted(self.prompts):
+            prompts_digest.update(f"{key}\0{self.prompts[key]}\0".encode('utf-8'))
+        self.prompts_hash = prompts_digest.hexdigest()
     
     def _load_prompt(self, filename):
         """Загружает отдельный промпт из файла"""
@@ -54,6 +86,7 @@ class PromptLoader:
         """
         # Форматируем информацию о звонке
         call_details = self._format_call_info(call_info)
+        transcript = compact_transcript(transcript)
         
         # Собираем промпт для новой логики
         full_prompt = f"""{self.prompts['system_context']}
@@ -75,6 +108,49 @@ class PromptLoader:
 """
         return full_prompt
     
+    def get_analysis_messages(self, transcript, call_info):
+        """
+        Собирает сообщения для анализа звонка: статический system-блок и
+        небольшой user-блок с информацией о звонке и транскрипцией
+        
+        Args:
+            transcript (str): Транскрипция звонка
+            call_info (dict): Информация о звонке (время, длительность и т.д.)
+            
+        Returns:
+            list: Сообщения для Chat Completions API
+        """
+        return [
+            {"role": "system", "content": self.static_system_prompt},
+            {"role": "user", "content": self._format_user_block(transcript, call_info)}
+        ]
+    
+    def get_triage_messages(self, transcript, call_info):
+        """
+        Собирает сообщения для быстрой классификации (первый уровень каскада)
+        
+        Args:
+            transcript (str): Транскрипция звонка
+            call_info (dict): Информация о звонке
+            
+        Returns:
+            list: Сообщения для Chat Completions API
+        """
+        return [
+            {"role": "system", "content": self.static_triage_prompt},
+            {"role": "user", "content": self._format_user_block(transcript, call_info)}
+        ]
+    
+    def _format_user_block(self, transcript, call_info):
+        """Форматирует пользовательский блок с информацией о звонке и транскрипцией"""
+        call_details = self._format_call_info(call_info)
+        user_prompt = f"""{call_details}
+**Транскрипция разговора:**
+---
+{transcript}
+---"""
+        return user_prompt.strip()
+    
     def _format_call_info(self, call_info):
         """Форматирует информацию о звонке для промпта"""
         if not call_info:
@@ -105,12 +181,32 @@ class PromptLoader:
 ---
 *Система контроля качества 29ROZ*"""
     
+    def add_change_listener(self, callback):
+        """Регистрирует callback(old_hash, new_hash), вызываемый при изменении промптов"""
+        self._change_listeners.append(callback)
+    
     def reload_prompts(self):
-        """Перезагружает все промпты из файлов"""
+        """
+        Перезагружает все промпты из файлов
+        
+        Returns:
+            bool: True, если содержимое промптов изменилось
+        """
         print("🔄 Reloading prompts...")
+        old_hash = self.prompts_hash
         self.prompts.clear()
         self._load_all_prompts()
-        print("✅ Prompts reloaded")
+        changed = self.prompts_hash != old_hash
+        if changed:
+            print(f"✅ Prompts reloaded, new version {self.prompt_version}")
+            for callback in self._change_listeners:
+                try:
+                    callback(old_hash, self.prompts_hash)
+                except Exception as e:
+                    print(f"❌ Prompt change listener failed: {e}")
+        else:
+            print("✅ Prompts reloaded, no changes")
+        return changed
 
 # Глобальный экземпляр для использования в main.py
 prompt_loader = PromptLoader()
\ No newline at end of file
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Synthetic Telphin calls, recordings and transcripts for load testing.
+
+generate_calls() produces Telphin-shaped call and CDR records for a time
+window: start times follow the hourly profile of a flower shop day (Moscow
+time), with realistic shares of incoming/outgoing calls, answered/missed
+results and log-normal durations. Answered calls get a record_uuid,
+storage_url and record size, plus a Russian transcript from templates whose
+scenario (order, lost sale with a promised callback, inquiry, complaint)
+decides whether the analyzer should alert. Recordings are speech-like
+patterns of tone and noise bursts separated by silences, encoded to MP3
+with ffmpeg on request.
+
+benchmark_pipeline.py --synthetic serves these through the fake services;
+--scale X generates X times SYNTHETIC_BASELINE_CALLS_PER_DAY (default 100)
+calls over a day. The command line writes a dataset to a directory instead.
+
+Usage:
+    python synthetic_calls.py OUT_DIR [--calls N | --scale X] [--hours H] [--seed S] [--mp3-seconds S]
+"""
+import os
+import sys
+import json
+import math
+import array
+import random
+import hashlib
+import subprocess
+from datetime import datetime, timedelta
+
+import pytz
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# Относительная доля звонков по часам (МСК): утренний рост, пики в обед и вечером
+HOURLY_PROFILE = (0.2, 0.1, 0.05, 0.05, 0.05, 0.1, 0.3, 0.8, 2.5, 6, 8, 9,
+                  9.5, 8.5, 8, 8, 8.5, 9, 8, 6, 4, 2, 1, 0.5)
+
+FLOW_WEIGHTS = {"in": 0.72, "out": 0.28}
+RESULT_WEIGHTS = {
+    "in": {"answered": 0.84, "noanswer": 0.11, "busy": 0.05},
+    "out": {"answered": 0.66, "noanswer": 0.24, "busy": 0.10},
+}
+# Сценарии входящих отвеченных звонков; lost_sale - менеджер обещал перезвонить
+SCENARIO_WEIGHTS = {"order": 0.46, "lost_sale": 0.16, "inquiry": 0.26, "complaint": 0.12}
+ALERT_SCENARIOS = ("lost_sale",)
+
+MANAGERS = ("101", "102", "103", "104", "105", "106")
+TELPHIN_DOMAIN = "29roz.sip.telphin.ru"
+
+# Медиана ~1.5 минуты, длинный хвост до получаса
+DURATION_MEDIAN_SECONDS = 95
+DURATION_SIGMA = 0.8
+MIN_DURATION_SECONDS = 8
+MAX_DURATION_SECONDS = 1800
+
+# Записи Telphin: 8 kHz моно, 32 kbps MP3
+SAMPLE_RATE = 8000
+RECORDING_BITRATE = 32000
+
+FLOWERS = ("розы", "пионы", "тюльпаны", "хризантемы", "гортензии", "ромашки", "эустомы")
+OCCASIONS = ("на день рождения", "на юбилей", "на свадьбу", "маме", "коллеге", "без повода", "на выписку")
+NAMES = ("Анна", "Ольга", "Мария", "Екатерина", "Дмитрий", "Сергей", "Ирина", "Алексей")
+DELIVERY_TIMES = ("к десяти утра", "к обеду", "после трёх", "к семи вечера", "завтра утром", "в субботу")
+STREETS = ("Троицкий проспект", "улица Воскресенская", "набережная Северной Двины", "улица Гайдара", "Обводный канал")
+
+OPENINGS = (
+    "Здравствуйте, цветочный магазин, меня зовут {manager}, слушаю вас.",
+    "Добрый день, салон цветов, {manager}, чем могу помочь?",
+)
+CLIENT_REQUESTS = (
+    "Здравствуйте, хочу заказать букет {occasion}, думаю про {flower}.",
+    "Добрый день, мне нужен букет {occasion}, что-нибудь из {flower_gen}.",
+    "Алло, подскажите, есть ли у вас сейчас {flower}? Нужен букет {occasion}.",
+)
+SMALL_TALK = (
+    "Какой бюджет вы рассматриваете? Примерно {price} рублей.",
+    "В какой цветовой гамме собрать? Лучше нежные, светлые оттенки.",
+    "Нужна ли открытка? Да, напишите, пожалуйста, поздравляю с праздником.",
+    "Сколько цветов в букете? Давайте штук пятнадцать.",
+    "Упаковка крафт или плёнка? Крафт, пожалуйста.",
+    "Есть ещё вариант с добавлением зелени, будет пышнее. Хорошо, давайте с зеленью.",
+)
+ORDER_CLOSINGS = (
+    "Оформляю заказ: букет {flower}, {price} рублей, доставка {delivery} по адресу {street}, {house}. "
+    "Получатель {name}. Ссылку на оплату отправлю в Ватсап. Спасибо за заказ, до свидания.",
+    "Записала: {flower}, сумма {price} рублей, самовывоз {delivery}. Оплатить можно на месте. "
+    "Спасибо, ждём вас, всего доброго.",
+)
+LOST_SALE_CLOSINGS = (
+    "Сейчас не могу сказать, есть ли {flower} в наличии, я уточню и вам перезвоню. "
+    "Хорошо, буду ждать. До свидания.",
+    "Давайте я посчитаю стоимость и перезвоню вам минут через двадцать. Ладно, только не забудьте. До свидания.",
+)
+INQUIRY_CLOSINGS = (
+    "Подскажите, до скольки вы сегодня работаете? До девяти вечера. Спасибо, я подумаю и зайду сама.",
+    "А доставка {delivery} возможна? Да, стоимость доставки по городу триста рублей. Понятно, спасибо, я посоветуюсь.",
+)
+COMPLAINT_CLOSINGS = (
+    "Я вчера получала у вас букет, {flower} уже завяли. Приносим извинения, пришлите фото, мы заменим букет. Хорошо.",
+    "Курьер опоздал на час, получатель ждал. Извините, пожалуйста, вернём стоимость доставки. Ладно, спасибо.",
+)
+OUTGOING_SCRIPTS = (
+    "Здравствуйте, {name}, это цветочный магазин, звоним подтвердить доставку {delivery} по адресу {street}. "
+    "Да, всё верно, спасибо. До свидания.",
+    "Добрый день, ваш заказ готов, букет {flower} можно забирать. Отлично, заеду {delivery}.",
+)
+FLOWER_GENITIVE = {"розы": "роз", "пионы": "пионов", "тюльпаны": "тюльпанов", "хризантемы": "хризантем",
+                   "гортензии": "гортензий", "ромашки": "ромашек", "эустомы": "эустом"}
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def baseline_calls_per_day():
+    """Current daily call volume the scale factor is relative to"""
+    return _env_int("SYNTHETIC_BASELINE_CALLS_PER_DAY", "100")
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def _sample_start_times(rng, count, start_utc, end_utc):
+    """Start times within the window distributed by HOURLY_PROFILE in Moscow time"""
+    hours = []
+    hour_start = start_utc.replace(minute=0, second=0, microsecond=0)
+    while hour_start < end_utc:
+        slot_start = max(hour_start, start_utc)
+        slot_end = min(hour_start + timedelta(hours=1), end_utc)
+        weight = HOURLY_PROFILE[hour_start.astimezone(MOSCOW_TZ).hour] * (slot_end - slot_start).total_seconds()
+        if weight > 0:
+            hours.append((slot_start, slot_end, weight))
+        hour_start += timedelta(hours=1)
+    picked = rng.choices(hours, weights=[weight for _, _, weight in hours], k=count)
+    times = [slot_start + (slot_end - slot_start) * rng.random() for slot_start, slot_end, _ in picked]
+    return sorted(times)
+
+def _phone(rng):
+    return f"79{rng.randint(100000000, 999999999)}"
+
+def make_transcript(rng, scenario, duration, flow="in"):
+    """
+    Build a Russian dialogue for a scenario; longer calls get more turns.
+
+    Returns:
+        str: One utterance per line
+    """
+    slots = {
+        "manager": rng.choice(NAMES), "name": rng.choice(NAMES), "flower": rng.choice(FLOWERS),
+        "occasion": rng.choice(OCCASIONS), "delivery": rng.choice(DELIVERY_TIMES), "street": rng.choice(STREETS),
+        "house": rng.randint(1, 120), "price": rng.choice((2500, 3200, 4500, 5900, 7500, 12000)),
+    }
+    slots["flower_gen"] = FLOWER_GENITIVE[slots["flower"]]
+    if flow != "in":
+        return rng.choice(OUTGOING_SCRIPTS).format(**slots)
+
+    closings = {"order": ORDER_CLOSINGS, "lost_sale": LOST_SALE_CLOSINGS,
+                "inquiry": INQUIRY_CLOSINGS, "complaint": COMPLAINT_CLOSINGS}[scenario]
+    lines = [rng.choice(OPENINGS), rng.choice(CLIENT_REQUESTS)]
+    # Примерно одна реплика на 15 секунд разговора
+    turns = min(len(SMALL_TALK), max(0, int(duration // 15) - 3))
+    if scenario != "complaint":
+        lines += rng.sample(SMALL_TALK, turns)
+    lines.append(rng.choice(closings))
+    return "\n".join(line.format(**slots) for line in lines)
+
+class SyntheticCalls:
+    """
+    Generated call and CDR records with their scripts.
+
+    Attributes:
+        calls (list): /calls/ records
+        cdr_records (list): /cdr/ records, one per call
+        scripts (dict): record_uuid -> {"scenario", "duration", "transcript", "seed"}
+    """
+
+    def __init__(self, calls, cdr_records, scripts):
+        self.calls = calls
+        self.cdr_records = cdr_records
+        self.scripts = scripts
+        self._ordered_uuids = sorted(scripts)
+
+    @property
+    def expected_alerts(self):
+        """record_uuids whose scenario should produce an alert"""
+        return {record_uuid for record_uuid, script in self.scripts.items() if script["scenario"] in ALERT_SCENARIOS}
+
+    def filler_recording(self, record_uuid):
+        """
+        OGG-tagged filler sized like the real MP3, for runs without ffmpeg.
+        The analyzer sends it to Yandex as is and transcribe() finds the script by its header.
+        """
+        script = self.scripts[record_uuid]
+        header = b"OggS" + record_uuid.encode("utf-8") + b"\0"
+        size = int(script["duration"] * RECORDING_BITRATE / 8)
+        return header + b"\0" * max(0, size - len(header))
+
+    def mp3_recording(self, record_uuid, max_seconds=None):
+        """Encode the call's tone/noise/silence pattern to MP3, at most max_seconds long"""
+        script = self.scripts[record_uuid]
+        seconds = script["duration"] if not max_seconds else min(script["duration"], max_seconds)
+        return encode_mp3(make_pcm_pattern(seconds, random.Random(script["seed"])))
+
+    def transcribe(self, audio_data):
+        """
+        Transcript for a recording the fake STT receives. Filler recordings carry
+        their record_uuid; converted or chunked MP3 audio does not, so it gets a
+        script picked by the audio hash.
+        """
+        if audio_data.startswith(b"OggS"):
+            record_uuid = audio_data[4:audio_data.find(b"\0", 4)].decode("utf-8", "replace")
+            if record_uuid in self.scripts:
+                return self.scripts[record_uuid]["transcript"]
+        if not self._ordered_uuids:
+            return ""
+        index = int(hashlib.sha1(audio_data).hexdigest()[:8], 16) % len(self._ordered_uuids)
+        return self.scripts[self._ordered_uuids[index]]["transcript"]
+
+    def write(self, out_dir, mp3_seconds=None):
+        """
+        Write calls.json, cdr.json, scripts.json and, with mp3_seconds, recordings/<record_uuid>.mp3.
+
+        Returns:
+            int: Number of written recordings
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        for name, payload in (("calls.json", self.calls), ("cdr.json", self.cdr_records), ("scripts.json", self.scripts)):
+            with open(os.path.join(out_dir, name), 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, indent=1)
+        if not mp3_seconds:
+            return 0
+        recordings_dir = os.path.join(out_dir, "recordings")
+        os.makedirs(recordings_dir, exist_ok=True)
+        for record_uuid in self._ordered_uuids:
+            with open(os.path.join(recordings_dir, f"{record_uuid}.mp3"), 'wb') as f:
+                f.write(self.mp3_recording(record_uuid, mp3_seconds))
+        return len(self._ordered_uuids)
+
+def generate_calls(count, end_utc=None, hours=24, seed=None, storage_base_url=None):
+    """
+    Generate count calls within the hours before end_utc.
+
+    Args:
+        count (int): Number of calls
+        end_utc (datetime): Aware UTC end of the window, defaults to now
+        hours (float): Window length
+        seed (int): Random seed for a reproducible dataset
+        storage_base_url (str): Prefix of storage_url, e.g. the fake Telphin "/storage"
+
+    Returns:
+        SyntheticCalls: Records and scripts
+    """
+    rng = random.Random(seed)
+    end_utc = end_utc or datetime.now(pytz.UTC)
+    # Последние минуты окна пустые - как у реального API, где CDR появляется с задержкой
+    window_end = end_utc - timedelta(minutes=5)
+    start_times = _sample_start_times(rng, count, end_utc - timedelta(hours=hours), window_end)
+    storage_base_url = (storage_base_url or "https://storage.telphin.ru/records").rstrip("/")
+
+    calls, cdr_records, scripts = [], [], {}
+    for started in start_times:
+        call_uuid = f"{rng.getrandbits(128):032x}"
+        call_uuid = f"{call_uuid[:8]}-{call_uuid[8:12]}-{call_uuid[12:16]}-{call_uuid[16:20]}-{call_uuid[20:]}"
+        flow = _weighted(rng, FLOW_WEIGHTS)
+        result = _weighted(rng, RESULT_WEIGHTS[flow])
+        manager = rng.choice(MANAGERS)
+        client = _phone(rng)
+        if result == "answered":
+            duration = int(min(MAX_DURATION_SECONDS, max(MIN_DURATION_SECONDS,
+                               rng.lognormvariate(math.log(DURATION_MEDIAN_SECONDS), DURATION_SIGMA))))
+            ring = rng.randint(3, 20)
+        else:
+            duration, ring = 0, rng.randint(5, 40)
+        start_time_gmt = started.strftime("%Y-%m-%d %H:%M:%S")
+        manager_sip = f"{manager}@{TELPHIN_DOMAIN}"
+        call = {
+            "call_uuid": call_uuid,
+            "flow": flow,
+            "result": result,
+            "start_time_gmt": start_time_gmt,
+            "duration": duration + ring,
+            "bridged_duration": duration,
+            "from_username": client if flow == "in" else manager_sip,
+            "to_username": manager_sip if flow == "in" else client,
+            "bridged_username": client,
+        }
+        cdr_record = {key: call[key] for key in ("call_uuid", "flow", "result", "start_time_gmt", "duration")}
+        cdr_record.update({"record_uuid": None, "record_file_size": 0, "storage_url": None})
+        if duration:
+            record_uuid = f"{call_uuid}-rec"
+            scenario = _weighted(rng, SCENARIO_WEIGHTS) if flow == "in" else "outgoing"
+            scripts[record_uuid] = {
+                "scenario": scenario,
+                "duration": duration,
+                "transcript": make_transcript(rng, scenario, duration, flow),
+                "seed": rng.getrandbits(32),
+            }
+            cdr_record.update({
+                "record_uuid": record_uuid,
+                "record_file_size": duration * RECORDING_BITRATE // 8,
+                "storage_url": f"{storage_base_url}/{record_uuid}.mp3",
+            })
+        calls.append(call)
+        cdr_records.append(cdr_record)
+    return SyntheticCalls(calls, cdr_records, scripts)
+
+def make_pcm_pattern(seconds, rng):
+    """
+    Speech-like 8 kHz mono s16le audio: bursts of tone (voices of different
+    pitch) and noise of 1-6 s separated by 0.2-2 s silences.
+
+    Returns:
+        bytes: Raw PCM of exactly `seconds` length
+    """
+    total = int(seconds * SAMPLE_RATE) * 2
+    # Один период тона целым числом Гц - кусок повторяется без щелчков на стыках
+    voices = []
+    for frequency in (150, 200, 250, 320):
+        one_second = array.array('h', (int(6000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+                                       for i in range(SAMPLE_RATE))).tobytes()
+        voices.append(one_second)
+    noise = array.array('h', (rng.randint(-3000, 3000) for _ in range(SAMPLE_RATE))).tobytes()
+    silence = bytes(2 * SAMPLE_RATE)
+
+    def take(source, length):
+        return (source * (length // len(source) + 1))[:length]
+
+    chunks, size = [], 0
+    while size < total:
+        burst = min(total - size, int(rng.uniform(1.0, 6.0) * SAMPLE_RATE) * 2)
+        chunks.append(take(noise if rng.random() < 0.25 else rng.choice(voices), burst))
+        size += burst
+        pause = min(total - size, int(rng.uniform(0.2, 2.0) * SAMPLE_RATE) * 2)
+        chunks.append(take(silence, pause))
+        size += pause
+    return b"".join(chunks)
+
+def encode_mp3(pcm_data):
+    """Encode 8 kHz mono s16le PCM to 32 kbps MP3 with one ffmpeg run over stdin/stdout"""
+    try:
+        result = subprocess.run([
+            'ffmpeg', '-v', 'quiet', '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', 'pipe:0',
+            '-b:a', '32k', '-f', 'mp3', 'pipe:1'
+        ], input=pcm_data, capture_output=True)
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg is required to encode synthetic MP3 recordings")
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError("ffmpeg could not encode the synthetic recording")
+    return result.stdout
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0].startswith("--"):
+        print(__doc__)
+        sys.exit(1)
+    out_dir = args.pop(0)
+    options = dict(zip(args[::2], args[1::2]))
+    if "--scale" in options:
+        count = int(baseline_calls_per_day() * float(options["--scale"]))
+    else:
+        count = int(options.get("--calls", baseline_calls_per_day()))
+    seed = int(options["--seed"]) if "--seed" in options else None
+    synthetic = generate_calls(count, hours=float(options.get("--hours", 24)), seed=seed)
+    written = synthetic.write(out_dir, float(options.get("--mp3-seconds", 0)))
+    scenarios = {}
+    for script in synthetic.scripts.values():
+        scenarios[script["scenario"]] = scenarios.get(script["scenario"], 0) + 1
+    print(f"✅ {len(synthetic.calls)} calls, {len(synthetic.scripts)} with recordings ({written} MP3 written) in {out_dir}")
+    print(f"📊 Scenarios: {scenarios}, expected alerts: {len(synthetic.expected_alerts)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Durable Telegram alert delivery.
+
+Alerts are written to a telegram_outbox table in the call state database,
+one row per call_uuid, before anything is sent. A single long-lived sender
+(one telegram.Bot and one event loop on a background thread) drains the
+outbox in order. It keeps TELEGRAM_CHAT_INTERVAL_SECONDS between messages
+to a chat, waits out Telegram's retry_after on flood control, and retries
+network errors with capped exponential backoff. Rows survive restarts, so a
+queued alert is never lost, and a sent row is never sent again. The only
+duplicate window is a crash between Telegram accepting a message and the
+row being marked as sent. TELEGRAM_BASE_URL replaces the Bot API URL
+(https://api.telegram.org/bot) for local stand-ins.
+"""
+import os
+import time
+import asyncio
+import threading
+import concurrent.futures
+from datetime import timedelta
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, InvalidToken, RetryAfter
+
+import call_state
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS telegram_outbox (
+    call_uuid TEXT PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    message_id INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_telegram_outbox_status ON telegram_outbox (status, next_attempt_at);
+"""
+
+# Ошибки, которые повтором не исправить: неверный токен, бот удалён из чата, битый запрос
+PERMANENT_ERRORS = (BadRequest, Forbidden, InvalidToken)
+
+_prepared = set()
+_prepared_lock = threading.Lock()
+
+def _env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def _get_connection():
+    conn = call_state.get_connection()
+    with _prepared_lock:
+        if call_state.CALL_STATE_DB not in _prepared:
+            conn.executescript(SCHEMA)
+            _prepared.add(call_state.CALL_STATE_DB)
+    return conn
+
+def enqueue_alert(call_uuid, text, chat_id=None):
+    """
+    Queue an alert for delivery; a call_uuid is only ever queued once.
+
+    Args:
+        call_uuid (str): Call the alert is about, the idempotency key
+        text (str): Message text
+        chat_id (str): Target chat, defaults to TELEGRAM_CHAT_ID
+
+    Returns:
+        bool: True if the alert was queued now, False if it was already queued or sent
+    """
+    chat_id = chat_id or os.environ.get("TELEGRAM_CHAT_ID") or ""
+    now = time.time()
+    cursor = _get_connection().execute(
+        "INSERT OR IGNORE INTO telegram_outbox (call_uuid, chat_id, text, status, attempts, next_attempt_at, created_at) "
+        "VALUES (?, ?, ?, 'pending', 0, ?, ?)",
+        (call_uuid, str(chat_id), text, now, now)
+    )
+    return cursor.rowcount == 1
+
+def get_outbox_entry(call_uuid):
+    """
+    Get the outbox row of a call.
+
+    Returns:
+        dict: Row as dict, None if no alert was queued for the call
+    """
+    cursor = _get_connection().execute("SELECT * FROM telegram_outbox WHERE call_uuid = ?", (call_uuid,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+def count_pending():
+    """Return the number of alerts that still wait for delivery"""
+    return _get_connection().execute("SELECT COUNT(*) FROM telegram_outbox WHERE status = 'pending'").fetchone()[0]
+
+def get_outbox_depth():
+    """
+    Get the size and age of the undelivered part of the outbox.
+
+    Returns:
+        tuple: (pending: int, oldest_created_at: float or None)
+    """
+    return tuple(_get_connection().execute(
+        "SELECT COUNT(*), MIN(created_at) FROM telegram_outbox WHERE status = 'pending'"
+    ).fetchone())
+
+def prune_outbox(retention_days=None):
+    """
+    Delete delivered and failed rows older than the retention period.
+
+    Args:
+        retention_days (float): Defaults to CALL_STATE_RETENTION_DAYS (30)
+
+    Returns:
+        int: Number of deleted rows
+    """
+    if retention_days is None:
+        retention_days = float(os.environ.get("CALL_STATE_RETENTION_DAYS", "30"))
+    cutoff = time.time() - retention_days * 86400
+    cursor = _get_connection().execute(
+        "DELETE FROM telegram_outbox WHERE status != 'pending' AND created_at < ?", (cutoff,)
+    )
+    return cursor.rowcount
+
+def _retry_after_seconds(error):
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class TelegramNotifier:
+    """
+    Background sender that drains the outbox with one long-lived Bot.
+
+    Settings: TELEGRAM_CHAT_INTERVAL_SECONDS (default 1; use 3 for group
+    chats, which Telegram limits to 20 messages a minute) and
+    TELEGRAM_MAX_BACKOFF_SECONDS (default 300).
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.chat_interval = _env_number("TELEGRAM_CHAT_INTERVAL_SECONDS", "1")
+        self.max_backoff = _env_number("TELEGRAM_MAX_BACKOFF_SECONDS", "300")
+        self.last_sent = {}
+        self.stats = {"sent": 0, "retries": 0, "failed": 0}
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self._wake_event = None
+        self._stopping = False
+
+    def start(self):
+        """Start the sender thread; it picks up alerts left pending by earlier runs"""
+        self.thread = threading.Thread(target=self.loop.run_forever, name="telegram-notifier", daemon=True)
+        self.thread.start()
+        self._task = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+        return self
+
+    def wake(self):
+        """Tell the sender that new alerts were queued"""
+        if self._wake_event is not None:
+            self.loop.call_soon_threadsafe(self._wake_event.set)
+
+    def flush(self, timeout=None):
+        """
+        Wait until the outbox has no pending alerts.
+
+        Args:
+            timeout (float): Seconds to wait, defaults to TELEGRAM_FLUSH_TIMEOUT_SECONDS (60)
+
+        Returns:
+            int: Alerts still pending when the wait ended
+        """
+        if timeout is None:
+            timeout = _env_number("TELEGRAM_FLUSH_TIMEOUT_SECONDS", "60")
+        deadline = time.monotonic() + timeout
+        self.wake()
+        pending = count_pending()
+        while pending and time.monotonic() < deadline and not self._task.done():
+            time.sleep(0.05)
+            pending = count_pending()
+        return pending
+
+    def stop(self):
+        """Stop the sender; pending alerts stay in the outbox for the next run"""
+        self._stopping = True
+        self.wake()
+        try:
+            self._task.result(timeout=5)
+        except concurrent.futures.TimeoutError:
+            # Отправитель ждёт retry_after - прерываем, строка останется pending
+            self._task.cancel()
+        except Exception as e:
+            print(f"⚠️ Telegram sender stopped with error: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+    async def _run(self):
+        self._wake_event = asyncio.Event()
+        try:
+            await self.bot.initialize()
+        except Exception as e:
+            # Без getMe отправка всё равно работает, ошибки сети разберёт повтор
+            print(f"⚠️ Telegram bot initialization failed: {e}")
+        try:
+            while not self._stopping:
+                entry, wait = self._next_entry()
+                if entry is None:
+                    self._wake_event.clear()
+                    try:
+                        await asyncio.wait_for(self._wake_event.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                chat_wait = self.last_sent.get(entry['chat_id'], 0) + self.chat_interval - time.monotonic()
+                if chat_wait > 0:
+                    await asyncio.sleep(chat_wait)
+                await self._deliver(entry)
+        finally:
+            try:
+                await self.bot.shutdown()
+            except Exception:
+                pass
+
+    def _next_entry(self):
+        """Return the oldest due pending row, or (None, seconds until one is due)"""
+        conn = _get_connection()
+        now = time.time()
+        cursor = conn.execute(
+            "SELECT call_uuid, chat_id, text, attempts FROM telegram_outbox "
+            "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY created_at LIMIT 1", (now,)
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            return dict(zip([column[0] for column in cursor.description], row)), 0
+        next_due = conn.execute(
+            "SELECT MIN(next_attempt_at) FROM telegram_outbox WHERE status = 'pending'"
+        ).fetchone()[0]
+        return None, min(60.0, max(0.05, next_due - now)) if next_due else 60.0
+
+    async def _deliver(self, entry):
+        call_uuid = entry['call_uuid']
+        # Алерт, поставленный без настроенного чата, уходит в текущий TELEGRAM_CHAT_ID
+        chat_id = entry['chat_id'] or os.environ.get("TELEGRAM_CHAT_ID")
+        conn = _get_connection()
+        attempts = entry['attempts'] + 1
+        conn.execute("UPDATE telegram_outbox SET attempts = ? WHERE call_uuid = ?", (attempts, call_uuid))
+        try:
+            message = await self.bot.send_message(chat_id=chat_id, text=entry['text'])
+        except RetryAfter as e:
+            # Flood control: ждём сколько сказал Telegram, все сообщения в этот чат тоже
+            delay = _retry_after_seconds(e)
+            self.last_sent[entry['chat_id']] = time.monotonic() + delay
+            self._reschedule(call_uuid, delay, f"retry_after {delay:g}s")
+            return
+        except PERMANENT_ERRORS as e:
+            self.stats["failed"] += 1
+            conn.execute(
+                "UPDATE telegram_outbox SET status = 'failed', error = ? WHERE call_uuid = ?", (str(e), call_uuid)
+            )
+            call_state.mark_call(call_uuid, "alert_failed", str(e))
+            print(f"❌ Alert for {call_uuid} rejected by Telegram: {e}")
+            return
+        except Exception as e:
+            delay = min(self.max_backoff, 2 ** attempts)
+            self._reschedule(call_uuid, delay, str(e))
+            return
+        finally:
+            self.last_sent[entry['chat_id']] = max(self.last_sent.get(entry['chat_id'], 0), time.monotonic())
+
+        self.stats["sent"] += 1
+        conn.execute(
+            "UPDATE telegram_outbox SET status = 'sent', sent_at = ?, message_id = ?, error = NULL WHERE call_uuid = ?",
+            (time.time(), getattr(message, 'message_id', None), call_uuid)
+        )
+        call_state.mark_call(call_uuid, "critical_alert_sent")
+        print(f"🚨 Критический отчёт по {call_uuid} отправлен в Telegram!")
+
+    def _reschedule(self, call_uuid, delay, error):
+        self.stats["retries"] += 1
+        _get_connection().execute(
+            "UPDATE telegram_outbox SET next_attempt_at = ?, error = ? WHERE call_uuid = ?",
+            (time.time() + delay, error, call_uuid)
+        )
+        print(f"⚠️ Alert for {call_uuid} not sent ({error}), retry in {delay:.1f}s")
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    """
+    Get the process-wide notifier, starting it on first use.
+
+    Returns:
+        TelegramNotifier: Running notifier, None if TELEGRAM_BOT_TOKEN is not configured
+        (alerts then stay queued until a run with a token)
+    """
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            bot_token = os.environ.get("TELEGRAM_BOT_TOKEN")
+            chat_id = os.environ.get("TELEGRAM_CHAT_ID")
+            if not bot_token or bot_token == "your_telegram_bot_token":
+                print("Error: TELEGRAM_BOT_TOKEN not configured, alerts stay in the outbox")
+                return None
+            if not chat_id or chat_id == "your_telegram_chat_id":
+                print("Error: TELEGRAM_CHAT_ID not configured, alerts stay in the outbox")
+                return None
+            base_url = os.environ.get("TELEGRAM_BASE_URL")
+            bot = Bot(token=bot_token, base_url=base_url) if base_url else Bot(token=bot_token)
+            _notifier = TelegramNotifier(bot).start()
+        return _notifier
+
+def stop_notifier():
+    """Stop the process-wide notifier if it runs"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is not None:
+            _notifier.stop()
+        _notifier = None
@@ -0,0 +1,168 @@
+"""
+Cached Telphin OAuth tokens with expiry-aware refresh.
+
+The token is kept in memory for the lifetime of the process and optionally
+in a file (TELFIN_TOKEN_CACHE_FILE), so separate scheduler runs can reuse it
+too. It is refreshed TELFIN_TOKEN_REFRESH_MARGIN seconds before expiry.
+
+TELFIN_BASE_URL overrides the API base URL (https://<TELFIN_HOSTNAME>), e.g.
+to point the analyzer at the local stand-ins of fake_services.py.
+"""
+import os
+import json
+import time
+import threading
+import requests
+from http_client import http_request
+
+DEFAULT_EXPIRES_IN = 3600
+
+def get_api_base_url(hostname):
+    """Base URL of the Telphin API for a hostname, TELFIN_BASE_URL if set"""
+    return (os.environ.get("TELFIN_BASE_URL") or f"https://{hostname}").rstrip("/")
+
+class TelphinTokenProvider:
+    """Provides a valid Telphin bearer token, requesting a new one only when needed"""
+
+    def __init__(self, hostname, login, password, cache_file=None, refresh_margin=None):
+        self.hostname = hostname
+        self.login = login
+        self.password = password
+        self.cache_file = cache_file if cache_file is not None else os.environ.get("TELFIN_TOKEN_CACHE_FILE")
+        if refresh_margin is None:
+            refresh_margin = int(os.environ.get("TELFIN_TOKEN_REFRESH_MARGIN", "120"))
+        self.refresh_margin = refresh_margin
+        self.access_token = None
+        self.expires_at = 0
+        self.auth_requests = 0
+        self._lock = threading.Lock()
+        self._load_cache_file()
+
+    def _is_fresh(self):
+        return bool(self.access_token) and time.time() < self.expires_at - self.refresh_margin
+
+    def _load_cache_file(self):
+        """Load a previously cached token for the same hostname and login"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                cached = json.load(f)
+            if cached.get('hostname') == self.hostname and cached.get('login') == self.login:
+                self.access_token = cached.get('access_token')
+                self.expires_at = float(cached.get('expires_at', 0))
+        except Exception as e:
+            print(f"Error loading Telphin token cache: {e}")
+
+    def _save_cache_file(self):
+        """Persist the current token so the next process can reuse it"""
+        if not self.cache_file:
+            return
+        try:
+            tmp_file = f"{self.cache_file}.tmp"
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'hostname': self.hostname,
+                    'login': self.login,
+                    'access_token': self.access_token,
+                    'expires_at': self.expires_at
+                }, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"Error saving Telphin token cache: {e}")
+
+    def _request_token(self):
+        """
+        Request a new token from the Telphin OAuth endpoint.
+
+        Returns:
+            bool: True if a token was received
+        """
+        auth_url = f"{get_api_base_url(self.hostname)}/oauth/token"
+
+        auth_data = {
+            "grant_type": "client_credentials",
+            "application_id": self.login,
+            "application_secret": self.password
+        }
+
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        try:
+            self.auth_requests += 1
+            response = http_request("POST", auth_url, endpoint="telphin_auth", data=auth_data, headers=headers)
+            response.raise_for_status()
+
+            auth_result = response.json()
+            token = auth_result.get("access_token")
+
+            if not token:
+                print("Authentication failed: No token in response")
+                return False
+
+            try:
+                expires_in = int(auth_result.get("expires_in") or DEFAULT_EXPIRES_IN)
+            except (TypeError, ValueError):
+                expires_in = DEFAULT_EXPIRES_IN
+
+            self.access_token = token
+            self.expires_at = time.time() + expires_in
+            self._save_cache_file()
+            print(f"Authentication successful. Token received (expires in {expires_in}s).")
+            return True
+
+        except requests.exceptions.RequestException as e:
+            print(f"Authentication error: {e}")
+            return False
+        except Exception as e:
+            print(f"Unexpected error during authentication: {e}")
+            return False
+
+    def get_token(self, force_refresh=False):
+        """
+        Get a valid bearer token.
+
+        Args:
+            force_refresh (bool): Request a new token even if the cached one looks valid
+
+        Returns:
+            str: Bearer token if available, None if authentication failed
+        """
+        with self._lock:
+            if force_refresh or not self._is_fresh():
+                if not self._request_token():
+                    return None
+            return self.access_token
+
+    def invalidate(self, rejected_token=None):
+        """
+        Drop the cached token after the API rejected it.
+
+        Args:
+            rejected_token (str): Token that got a 401; a newer token is kept
+        """
+        with self._lock:
+            if rejected_token is None or rejected_token == self.access_token:
+                self.access_token = None
+                self.expires_at = 0
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_token_provider(hostname, login, password):
+    """
+    Get the process-wide token provider for a Telphin account.
+
+    Returns:
+        TelphinTokenProvider: Shared provider instance
+    """
+    key = (hostname, login)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None or provider.password != password:
+            provider = TelphinTokenProvider(hostname, login, password)
+            _providers[key] = provider
+        return provider
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import tempfile
+from types import SimpleNamespace
+import main
+import openai_scheduler
+import call_state
+import analysis_cache
+from prompt_loader import prompt_loader
+
+def run_with_fake_client(func):
+    """Run func(requests) with a temp call state DB and a fake OpenAI client that records requests"""
+    requests = []
+
+    class FakeCompletions:
+        async def create(self, model, messages, **kwargs):
+            requests.append(model)
+            content = "не JSON" if "сломанный ответ" in messages[1]["content"] else json.dumps({"status": "ignore"})
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=SimpleNamespace(prompt_tokens=100, completion_tokens=5, prompt_tokens_details=None)
+            )
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    settings = {"OPENAI_API_KEY": "test-key", "ANALYSIS_CASCADE_ENABLED": "0", "ANALYSIS_CACHE_ENABLED": "1",
+                "ANALYSIS_STREAMING": "0"}
+    original_env = {name: os.environ.get(name) for name in settings}
+    original_client = main.openai.AsyncOpenAI
+    original_db = call_state.CALL_STATE_DB
+    original_legacy = call_state.LEGACY_PROCESSED_CALLS_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        call_state.CALL_STATE_DB = os.path.join(tmp_dir, "call_state.db")
+        call_state.LEGACY_PROCESSED_CALLS_FILE = os.path.join(tmp_dir, "missing.txt")
+        main.openai.AsyncOpenAI = lambda **kwargs: fake_client
+        openai_scheduler.reset_scheduler()
+        os.environ.update(settings)
+        analysis_cache.reset_cache_stats()
+        try:
+            return func(requests)
+        finally:
+            main.openai.AsyncOpenAI = original_client
+            openai_scheduler.reset_scheduler()
+            call_state.CALL_STATE_DB = original_db
+            call_state.LEGACY_PROCESSED_CALLS_FILE = original_legacy
+            for name, value in original_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+def test_repeated_analysis_is_served_from_cache():
+    """Test that the same transcript, prompts and model hit the cache"""
+    print("=== Testing Analysis Cache Hits ===")
+
+    def run(requests):
+        first = main.analyze_with_gpt_new("Клиент  спросил про букет\nи ушёл", {"duration": 42})
+        second = main.analyze_with_gpt_new("Клиент спросил про букет и ушёл", {"duration": 42})
+        assert first == second == {"status": "ignore"}
+        assert len(requests) == 1, "Whitespace differences share one cache entry"
+
+        main.analyze_with_gpt_new("Клиент спросил про букет и ушёл", {"duration": 43})
+        assert len(requests) == 2, "Different call info is a different prompt"
+
+        os.environ["ANALYSIS_MODEL"] = "other-model"
+        try:
+            main.analyze_with_gpt_new("Клиент спросил про букет и ушёл", {"duration": 42})
+        finally:
+            os.environ.pop("ANALYSIS_MODEL")
+        assert requests[-1] == "other-model", "Another model is a miss"
+
+        stats = analysis_cache.get_cache_stats()
+        assert (stats["hits"], stats["misses"], stats["writes"]) == (1, 3, 3)
+        assert "25% hit rate" in analysis_cache.format_cache_stats()
+        print("✅ Repeated analyses are cached")
+
+    run_with_fake_client(run)
+
+def test_errors_are_not_cached():
+    """Test that failed analyses are retried instead of served from the cache"""
+    print("=== Testing Analysis Cache Errors ===")
+
+    def run(requests):
+        for _ in range(2):
+            result = main.analyze_with_gpt_new("сломанный ответ модели", {"duration": 42})
+            assert result["status"] == "error" and result["error"].startswith("invalid_analysis")
+        assert len(requests) == 2, "Errors are not stored"
+        print("✅ Errors are not cached")
+
+    run_with_fake_client(run)
+
+def test_prompt_change_invalidates_cache():
+    """Test that reloading changed prompt files drops old entries"""
+    print("=== Testing Analysis Cache Invalidation ===")
+
+    def run(requests):
+        main.analyze_with_gpt_new("Клиент спросил про розы", {"duration": 42})
+        conn = call_state.get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] == 1
+
+        original_load = prompt_loader._load_prompt
+        prompt_loader._load_prompt = lambda filename: original_load(filename) + " (новая редакция)"
+        try:
+            assert prompt_loader.reload_prompts() is True
+            assert conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] == 0, "Old entries dropped"
+            main.analyze_with_gpt_new("Клиент спросил про розы", {"duration": 42})
+            assert len(requests) == 2, "Changed prompts are a miss"
+        finally:
+            prompt_loader._load_prompt = original_load
+            prompt_loader.reload_prompts()
+
+        assert prompt_loader.reload_prompts() is False, "Unchanged files are not a change"
+        print("✅ Prompt changes invalidate the cache")
+
+    run_with_fake_client(run)
+
+def test_prune_cache():
+    """Test that unused entries expire"""
+    print("=== Testing Analysis Cache Pruning ===")
+
+    def run(requests):
+        analysis_cache.put_analysis("старый звонок", None, {}, {"status": "ignore"})
+        analysis_cache.put_analysis("новый звонок", None, {}, {"status": "ignore"})
+        call_state.get_connection().execute(
+            "UPDATE analysis_cache SET last_used = ? WHERE key = ?",
+            (time.time() - 40 * 86400, analysis_cache.make_key("старый звонок", None, {}))
+        )
+        assert analysis_cache.prune_cache(30) == 1
+        assert analysis_cache.get_analysis("новый звонок", None, {}) == {"status": "ignore"}
+        assert analysis_cache.get_analysis("старый звонок", None, {}) is None
+        print("✅ Unused entries are pruned")
+
+    run_with_fake_client(run)
+
+if __name__ == "__main__":
+    test_repeated_analysis_is_served_from_cache()
+    test_errors_are_not_cached()
+    test_prompt_change_invalidates_cache()
+    test_prune_cache()
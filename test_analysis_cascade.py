@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from types import SimpleNamespace
+import main
+import openai_scheduler
+
+TRIAGE_ANSWERS = {
+    "успешный заказ": {"category": "SUCCESS_SALE", "responsibility": "NONE"},
+    "клиент передумал": {"category": "FAILED_SALE", "responsibility": "CLIENT_FAULT"},
+    "менеджер не перезвонил": {"category": "FAILED_SALE", "responsibility": "MANAGER_FAULT"},
+    "непонятно чья вина": {"category": "FAILED_SALE", "responsibility": "UNSURE"},
+}
+
+ALERT = {"status": "alert", "error_code": "M3", "error_description": "Не перезвонил",
+         "context": "Клиент ждал звонка", "solution": "Перезвонить в обещанное время"}
+
+def run_cascade(transcripts, env=None, triage_error=False):
+    """Analyze transcripts with a fake OpenAI client; return results and models called per transcript"""
+    calls = []
+
+    class FakeCompletions:
+        async def create(self, model, messages, **kwargs):
+            transcript = messages[1]["content"]
+            calls.append((model, transcript))
+            if model == "tiny-model":
+                if triage_error:
+                    raise RuntimeError("triage model unavailable")
+                answer = next((value for key, value in TRIAGE_ANSWERS.items() if key in transcript), None)
+                content = json.dumps(answer) if answer else "не JSON"
+            else:
+                content = json.dumps(ALERT)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=SimpleNamespace(prompt_tokens=500 if model == "tiny-model" else 2000,
+                                      completion_tokens=10, prompt_tokens_details=None)
+            )
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    settings = {"OPENAI_API_KEY": "test-key", "ANALYSIS_TRIAGE_MODEL": "tiny-model", "ANALYSIS_MODEL": "big-model",
+                "ANALYSIS_CASCADE_ENABLED": "1", "ANALYSIS_CACHE_ENABLED": "0", "ANALYSIS_STREAMING": "0", **(env or {})}
+    original_env = {name: os.environ.get(name) for name in settings}
+    original_client = main.openai.AsyncOpenAI
+    main.openai.AsyncOpenAI = lambda **kwargs: fake_client
+    openai_scheduler.reset_scheduler()
+    os.environ.update(settings)
+    main.reset_analysis_usage()
+    try:
+        results = [main.analyze_with_gpt_new(transcript, {"duration": 60}) for transcript in transcripts]
+    finally:
+        main.openai.AsyncOpenAI = original_client
+        openai_scheduler.reset_scheduler()
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    models = [[model for model, text in calls if transcript in text] for transcript in transcripts]
+    return results, models
+
+def test_only_candidates_reach_full_model():
+    """Test that the small model filters out calls and candidates are escalated"""
+    print("=== Testing Analysis Cascade ===")
+
+    transcripts = list(TRIAGE_ANSWERS) + ["ответ модели сломан"]
+    results, models = run_cascade(transcripts)
+
+    assert models == [
+        ["tiny-model"],
+        ["tiny-model"],
+        ["tiny-model", "big-model"],
+        ["tiny-model", "big-model"],
+        ["tiny-model", "big-model"],
+    ], models
+    assert results[0]["status"] == "ignore" and results[0]["tier"] == "triage"
+    assert results[2] == ALERT and results[3] == ALERT, "Manager fault and unsure calls keep their alerts"
+    assert results[4] == ALERT, "Unparsable triage answers are escalated"
+
+    assert main.analysis_usage_stats["triage"]["requests"] == 5
+    assert main.analysis_usage_stats["analysis"]["requests"] == 3
+    assert len(main.analysis_usage_stats["triage"]["latencies"]) == 5
+    summary = main.format_analysis_usage()
+    assert "triage: 5 requests" in summary and "analysis: 3 requests" in summary
+    print("✅ Cascade works")
+
+def test_escalation_rules_are_configurable():
+    """Test escalation rules from the environment, cascade switch and triage failures"""
+    print("=== Testing Cascade Configuration ===")
+
+    _, models = run_cascade(["непонятно чья вина"], env={"ANALYSIS_ESCALATE_RESPONSIBILITY": "MANAGER_FAULT"})
+    assert models == [["tiny-model"]], "UNSURE is not escalated when excluded from the rules"
+
+    _, models = run_cascade(["успешный заказ"], env={"ANALYSIS_CASCADE_ENABLED": "0"})
+    assert models == [["big-model"]], "Disabled cascade sends every call to the full model"
+
+    results, models = run_cascade(["успешный заказ"], triage_error=True)
+    assert models == [["tiny-model", "big-model"]] and results[0] == ALERT, "Triage errors escalate"
+    print("✅ Cascade configuration works")
+
+if __name__ == "__main__":
+    test_only_candidates_reach_full_model()
+    test_escalation_rules_are_configurable()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import struct
+import subprocess
+import audio_utils
+import main_backup
+
+# MPEG-1 Layer III, 32 kbps, 32 kHz, mono: 144 байта на кадр, 1152 сэмпла = 36 мс
+MP3_HEADER = bytes([0xFF, 0xFB, 0x18, 0xC4])
+MP3_FRAME = MP3_HEADER + b'\x00' * 140
+
+def make_id3(size=20):
+    return b'ID3\x04\x00\x00' + bytes([0, 0, 0, size]) + b'\x00' * size
+
+def make_box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+def make_mp4(timescale, duration, moov_first=True):
+    mvhd = make_box(b'mvhd', b'\x00' * 4 + struct.pack('>IIII', 0, 0, timescale, duration) + b'\x00' * 80)
+    moov = make_box(b'moov', mvhd)
+    mdat = make_box(b'mdat', b'\x00' * 64)
+    ftyp = make_box(b'ftyp', b'M4A \x00\x00\x00\x00')
+    return ftyp + (moov + mdat if moov_first else mdat + moov)
+
+def make_ogg_opus(granule, pre_skip=312):
+    opus_head = b'OpusHead' + bytes([1, 1]) + struct.pack('<H', pre_skip) + b'\x00' * 7
+    first_page = b'OggS\x00\x02' + struct.pack('<q', 0) + b'\x00' * 13 + opus_head
+    last_page = b'OggS\x00\x04' + struct.pack('<q', granule) + b'\x00' * 13 + b'\x00' * 20
+    return first_page + last_page
+
+def test_mp3_duration():
+    """Test CBR estimation and Xing frame count"""
+    print("=== Testing MP3 Duration Parsing ===")
+
+    cbr = make_id3() + MP3_FRAME * 500
+    duration = audio_utils.get_mp3_duration(cbr)
+    assert abs(duration - 500 * 0.036) < 0.01, f"CBR duration should be 18s, got {duration}"
+
+    xing = bytearray(MP3_FRAME)
+    xing[4 + 17:4 + 17 + 12] = b'Xing' + struct.pack('>II', 1, 1000)
+    duration = audio_utils.get_mp3_duration(make_id3() + bytes(xing) + MP3_FRAME * 10)
+    assert abs(duration - 1000 * 0.036) < 0.01, f"Xing duration should be 36s, got {duration}"
+
+    assert audio_utils.get_mp3_duration(b'ID3' + b'\x00' * 200) is None, "No frames means no duration"
+    print("✅ MP3 duration parsing works")
+
+def test_mp4_and_ogg_duration():
+    """Test MP4 mvhd and OGG Opus granule durations"""
+    print("=== Testing MP4 and OGG Duration Parsing ===")
+
+    assert audio_utils.get_audio_duration(make_mp4(1000, 42500)) == 42.5
+    assert not audio_utils._mp4_needs_seek(make_mp4(1000, 42500))
+    assert audio_utils._mp4_needs_seek(make_mp4(1000, 42500, moov_first=False))
+    assert audio_utils.get_ogg_opus_duration(make_ogg_opus(48000 * 10 + 312)) == 10.0
+    assert audio_utils.get_ogg_opus_duration(b'not ogg') is None
+    print("✅ MP4 and OGG duration parsing works")
+
+def test_conversion_uses_pipes():
+    """Test that ffmpeg runs once over stdin/stdout and long recordings are not converted"""
+    print("=== Testing In-Memory Conversion ===")
+
+    calls = []
+
+    def fake_run(cmd, input=None, **kwargs):
+        calls.append((cmd, input))
+        return subprocess.CompletedProcess(cmd, 0, stdout=make_ogg_opus(48000 * 5 + 312), stderr=b'')
+
+    original_run = audio_utils.subprocess.run
+    audio_utils.subprocess.run = fake_run
+    try:
+        short_mp3 = make_id3() + MP3_FRAME * 100
+        ogg_data, duration = main_backup.convert_for_yandex(short_mp3)
+        assert ogg_data and abs(duration - 3.6) < 0.01
+        assert len(calls) == 1, "Exactly one subprocess per recording"
+        cmd, stdin_data = calls[0]
+        assert cmd[0] == 'ffmpeg' and 'pipe:0' in cmd and cmd[-1] == 'pipe:1'
+        assert stdin_data == short_mp3, "Audio is passed over stdin"
+
+        long_mp3 = make_id3() + MP3_FRAME * 1000
+        ogg_data, duration = main_backup.convert_for_yandex(long_mp3)
+        assert ogg_data is None and duration > main_backup.YANDEX_MAX_DURATION_SECONDS
+        assert len(calls) == 1, "Too long recordings are rejected before ffmpeg"
+
+        ogg_data, duration = main_backup.convert_for_yandex(b'\x00' * 64)
+        assert ogg_data and duration == 5.0, "Duration falls back to the converted stream"
+    finally:
+        audio_utils.subprocess.run = original_run
+    print("✅ In-memory conversion works")
+
+def test_silence_parsing_and_splitting():
+    """Test silencedetect parsing and chunk planning"""
+    print("=== Testing Silence-Based Splitting ===")
+
+    log = (
+        "[silencedetect @ 0x1] silence_start: 9.5\n"
+        "[silencedetect @ 0x1] silence_end: 10.5 | silence_duration: 1\n"
+        "[silencedetect @ 0x1] silence_start: 58.2\n"
+    )
+    silences = audio_utils._parse_silences(log, 60.0)
+    assert silences == [(9.5, 10.5), (58.2, 60.0)], silences
+
+    chunks = audio_utils.split_at_silences(70.0, [(10, 11), (27, 28), (50, 51)], 28)
+    assert chunks == [(0.0, 27.5), (27.5, 50.5), (50.5, 70.0)], "Cut in the latest silence within the limit"
+
+    chunks = audio_utils.split_at_silences(65.0, [], 28)
+    assert chunks == [(0.0, 28.0), (28.0, 56.0), (56.0, 65.0)], "Without silences cut at the limit"
+
+    assert audio_utils.split_at_silences(20.0, [(5, 6)], 28) == [(0.0, 20.0)], "Short audio is one chunk"
+    print("✅ Silence-based splitting works")
+
+if __name__ == "__main__":
+    test_mp3_duration()
+    test_mp4_and_ogg_duration()
+    test_conversion_uses_pipes()
+    test_silence_parsing_and_splitting()
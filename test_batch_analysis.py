@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import tempfile
+from types import SimpleNamespace
+import openai
+import batch_analysis
+import call_state
+from fake_openai_server import FakeOpenAIServer
+
+def test_batch_roundtrip_against_fake_server():
+    """Test build, submit, poll and merge of a batch fully offline"""
+    print("=== Testing Batch Analysis Offline ===")
+
+    original_db = call_state.CALL_STATE_DB
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeOpenAIServer() as server:
+        call_state.CALL_STATE_DB = os.path.join(tmp_dir, "call_state.db")
+        try:
+            transcripts_path = os.path.join(tmp_dir, "transcripts.jsonl")
+            with open(transcripts_path, "w", encoding="utf-8") as f:
+                for item in (
+                    {"call_uuid": "call-alert", "transcript": "Хочу букет. Я уточню и перезвоню вам.", "call_info": {"duration": 40}},
+                    {"call_uuid": "call-ignore", "transcript": "Где мой заказ? Курьер уже выехал."},
+                    {"call_uuid": "call-alert", "transcript": "Дубликат"},
+                    {"call_uuid": "no-transcript", "transcript": ""},
+                ):
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+            batch_path = batch_analysis.build_batch_file(
+                batch_analysis.load_transcripts(transcripts_path), os.path.join(tmp_dir, "batch.jsonl"), model="gpt-4o"
+            )
+            with open(batch_path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+            assert [line["custom_id"] for line in lines] == ["call-alert", "call-ignore"]
+            assert lines[0]["url"] == "/v1/chat/completions" and lines[0]["body"]["messages"][0]["role"] == "system"
+
+            client = openai.OpenAI(api_key="test", base_url=server.base_url)
+            batch_id = batch_analysis.submit_batch(client, batch_path)
+            batch = batch_analysis.wait_for_batch(client, batch_id, poll_interval=0.01, timeout=5)
+            assert batch.status == "completed"
+
+            counts = batch_analysis.merge_batch_results(client, batch)
+            assert counts == {"merged": 2, "alerts": 1, "failed": 0}, counts
+
+            alert = call_state.get_analysis("call-alert")
+            assert alert["result"]["status"] == "alert" and alert["source"] == f"batch:{batch_id}"
+            assert call_state.get_analysis("call-ignore")["result"] == {"status": "ignore"}
+            assert call_state.get_analysis("no-transcript") is None
+        finally:
+            call_state.CALL_STATE_DB = original_db
+    print("✅ Batch analysis works offline")
+
+def test_merge_skips_malformed_results():
+    """Test that empty choices and refusals count as failed without stopping the merge"""
+    print("=== Testing Batch Merge of Malformed Results ===")
+
+    def record(call_uuid, body):
+        return json.dumps({"custom_id": call_uuid, "response": {"status_code": 200, "body": body}, "error": None})
+
+    output = "\n".join([
+        record("no-choices", {"choices": []}),
+        record("no-message", {"choices": [{"index": 0}]}),
+        record("refusal", {"choices": [{"message": {"content": None, "refusal": "I can't help with that"}}]}),
+        record("good", {"model": "gpt-4o", "choices": [{"message": {"content": '{"status": "ignore"}'}}]}),
+    ])
+    client = SimpleNamespace(files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=output)))
+    batch = SimpleNamespace(id="batch_1", output_file_id="file-1", status="completed")
+
+    original_db = call_state.CALL_STATE_DB
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        call_state.CALL_STATE_DB = os.path.join(tmp_dir, "call_state.db")
+        try:
+            counts = batch_analysis.merge_batch_results(client, batch)
+            assert counts == {"merged": 1, "alerts": 0, "failed": 3}, counts
+            assert call_state.get_analysis("good")["result"] == {"status": "ignore"}
+        finally:
+            call_state.CALL_STATE_DB = original_db
+    print("✅ Malformed results are skipped")
+
+if __name__ == "__main__":
+    test_batch_roundtrip_against_fake_server()
+    test_merge_skips_malformed_results()
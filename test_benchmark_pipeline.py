@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import os
+from benchmark_pipeline import run_benchmark, make_calls, format_report
+from telphin_auth import get_api_base_url
+
+def test_base_url_override():
+    """Test that TELFIN_BASE_URL replaces the Telphin host"""
+    print("=== Testing Telphin Base URL Override ===")
+
+    original = os.environ.pop("TELFIN_BASE_URL", None)
+    try:
+        assert get_api_base_url("example.telphin.ru") == "https://example.telphin.ru"
+        os.environ["TELFIN_BASE_URL"] = "http://127.0.0.1:8080/"
+        assert get_api_base_url("example.telphin.ru") == "http://127.0.0.1:8080"
+    finally:
+        os.environ.pop("TELFIN_BASE_URL", None)
+        if original is not None:
+            os.environ["TELFIN_BASE_URL"] = original
+    print("✅ Base URL can point at a local stand-in")
+
+def test_cycle_against_fakes():
+    """Test a full cycle over paged calls with injected latency"""
+    print("=== Testing Pipeline Benchmark ===")
+
+    calls, cdr_records = make_calls(12, incoming_share=0.75)
+    original_page_size = os.environ.get("CALLS_PAGE_SIZE")
+    os.environ["CALLS_PAGE_SIZE"] = "5"
+    try:
+        report = run_benchmark(calls, cdr_records, latency=0.005, openai_latency=0.01, alert_share=0.5)
+    finally:
+        if original_page_size is None:
+            os.environ.pop("CALLS_PAGE_SIZE", None)
+        else:
+            os.environ["CALLS_PAGE_SIZE"] = original_page_size
+
+    incoming = sum(1 for call in calls if call["flow"] == "in")
+    assert report["result"]["new_calls"] == 12, "All pages are listed"
+    assert report["result"]["processed"] == incoming
+    assert report["result"]["alerts"] == report["messages"] > 0, "Alerts reach the fake Telegram"
+    assert report["stages"]["transcribe"]["count"] == incoming
+    assert report["stages"]["analyze"]["p95"] >= report["stages"]["analyze"]["p50"]
+    assert report["services"]["yandex"]["requests"] == incoming
+    assert report["calls_per_minute"] > 0 and report["peak_rss_mb"] > 0
+    assert "calls/min" in format_report(report)
+    print(format_report(report))
+    print("✅ One cycle runs end to end offline")
+
+def test_synthetic_day():
+    """Test that a synthetic day alerts exactly on the scripted lost sales"""
+    print("=== Testing Synthetic Day Benchmark ===")
+
+    report = run_benchmark(synthetic=True, calls=60, seed=5, window_hours=24, latency=0, openai_latency=0)
+    assert report["result"]["new_calls"] == 60
+    assert report["expected_alerts"] > 0
+    assert report["result"]["alerts"] == report["expected_alerts"] == report["messages"]
+    print("✅ Synthetic calls flow through the fakes")
+
+if __name__ == "__main__":
+    test_base_url_override()
+    test_cycle_against_fakes()
+    test_synthetic_day()
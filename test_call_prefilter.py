@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import main
+from call_prefilter import prefilter_call, evaluate_prefilter
+from prefilter_report import load_fixtures
+
+def test_fixture_recall_and_precision():
+    """Test that no labelled FAILED_SALE call is skipped and most others are"""
+    print("=== Testing Pre-filter on Labelled Fixtures ===")
+
+    report = evaluate_prefilter(load_fixtures())
+    missed = [case['id'] for case, decision in report['decisions']
+              if case['label'] == "FAILED_SALE" and not decision['send_to_llm']]
+
+    assert report['recall'] == 1.0, f"FAILED_SALE calls must reach GPT, missed: {missed}"
+    assert report['precision'] >= 0.8, f"Precision dropped to {report['precision']:.2f}"
+    assert report['skip_rate'] >= 0.4, f"Pre-filter skips too little: {report['skip_rate']:.0%}"
+    print(f"✅ Precision {report['precision']:.2f}, recall {report['recall']:.2f}")
+
+def test_failure_signals_override_confirmation():
+    """Test that any sign of a lost sale sends the call to GPT"""
+    print("=== Testing Failure Signal Priority ===")
+
+    transcript = ("Хочу заказать букет на завтра. Я бы оформила заказ, но это дорого, "
+                  "давайте я подумаю и сама наберу вам позже.")
+    decision = prefilter_call(transcript, {"duration": 60, "result": "answered"})
+    assert decision['send_to_llm'] and decision['category'] == "FAILED_SALE", decision
+
+    decision = prefilter_call(transcript, {"duration": 60, "result": "busy"})
+    assert not decision['send_to_llm'] and "busy" in decision['reason']
+    print("✅ Failure signals take priority")
+
+def test_pipeline_skips_without_gpt():
+    """Test that the analyze stage records the skip reason and never calls GPT"""
+    print("=== Testing Pre-filter in Pipeline ===")
+
+    saved = []
+    gpt_calls = []
+    originals = (main.save_processed_call, main.analyze_with_gpt_new)
+    main.save_processed_call = lambda call_id, status="success", error=None: saved.append((call_id, status, error))
+    main.analyze_with_gpt_new = lambda transcript, call_info=None: gpt_calls.append(transcript) or {"status": "ignore"}
+    try:
+        job = {
+            "call_uuid": "logistics-call",
+            "call": {"duration": 50, "result": "answered", "flow": "in", "start_time_gmt": "2026-01-01 10:00:00"},
+            "transcript": ("Добрый день, номер заказа 3381, где мой заказ? Курьер уже выехал "
+                           "по адресу Садовая семь, доставка будет через час. Спасибо."),
+        }
+        assert main._stage_analyze({}, job) is None
+    finally:
+        main.save_processed_call, main.analyze_with_gpt_new = originals
+
+    assert gpt_calls == [], "Skipped calls must not reach GPT"
+    assert saved[0][:2] == ("logistics-call", "prefilter_ignore") and "logistics" in saved[0][2]
+    print("✅ Pipeline pre-filter works")
+
+if __name__ == "__main__":
+    test_fixture_recall_and_precision()
+    test_failure_signals_override_confirmation()
+    test_pipeline_skips_without_gpt()
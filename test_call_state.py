@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import tempfile
+import call_state
+
+def with_temp_db(func):
+    """Run func against a fresh call state database in a temporary directory"""
+    original_db = call_state.CALL_STATE_DB
+    original_legacy = call_state.LEGACY_PROCESSED_CALLS_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        call_state.LEGACY_PROCESSED_CALLS_FILE = os.path.join(tmp_dir, "missing.txt")
+        call_state.CALL_STATE_DB = os.path.join(tmp_dir, "call_state.db")
+        try:
+            return func(tmp_dir)
+        finally:
+            call_state.CALL_STATE_DB = original_db
+            call_state.LEGACY_PROCESSED_CALLS_FILE = original_legacy
+
+def test_status_transitions_and_attempts():
+    """Test that statuses are kept per call and attempts are counted"""
+    print("=== Testing Call State Transitions ===")
+
+    def run(tmp_dir):
+        call_state.mark_call("call-1", "processing")
+        call_state.mark_call("call-1", "transcription_error", "timeout")
+        call_state.mark_call("call-1", "processing")
+        call_state.mark_call("call-1", "analyzed_ignore")
+
+        row = call_state.get_call("call-1")
+        assert row["status"] == "analyzed_ignore", "Latest status wins"
+        assert row["attempts"] == 2, "Each processing start is an attempt"
+        assert row["error"] is None, "Error is cleared on success"
+        assert row["first_seen"] <= row["updated_at"]
+
+        conn = call_state.get_connection()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal", "WAL mode expected"
+        print("✅ Status transitions work")
+
+    with_temp_db(run)
+
+def test_batched_lookup_and_prune():
+    """Test batched status lookups and time-based pruning"""
+    print("=== Testing Batched Lookup and Pruning ===")
+
+    def run(tmp_dir):
+        for i in range(1200):
+            call_state.mark_call(f"call-{i}", "analyzed_ignore")
+        calls = [{"call_uuid": f"call-{i}"} for i in range(1195, 1205)]
+
+        annotated = list(call_state.annotate_known_calls(calls, batch_size=4))
+        assert [status for _, status in annotated] == ["analyzed_ignore"] * 5 + [None] * 5
+        assert len(call_state.get_statuses(f"call-{i}" for i in range(1200))) == 1200, \
+            "Lookups larger than one SQL batch should work"
+
+        old = time.time() - 40 * 86400
+        call_state.get_connection().execute(
+            "UPDATE calls SET updated_at = ? WHERE call_uuid IN ('call-0', 'call-1')", (old,)
+        )
+        assert call_state.prune_calls(30) == 2, "Only rows older than retention are pruned"
+        assert call_state.get_call("call-0") is None
+        assert call_state.get_call("call-2") is not None, "No arbitrary rows are dropped"
+        print("✅ Batched lookup and pruning work")
+
+    with_temp_db(run)
+
+def test_legacy_import():
+    """Test the one-time import of processed_calls.txt"""
+    print("=== Testing Legacy Import ===")
+
+    def run(tmp_dir):
+        legacy_file = os.path.join(tmp_dir, "processed_calls.txt")
+        with open(legacy_file, "w") as f:
+            f.write("OLD-1\nOLD-2\n\n")
+        call_state.LEGACY_PROCESSED_CALLS_FILE = legacy_file
+
+        conn = call_state.get_connection()
+        assert call_state.get_statuses(["OLD-1", "OLD-2"]) == {"OLD-1": "imported", "OLD-2": "imported"}
+
+        with open(legacy_file, "a") as f:
+            f.write("OLD-3\n")
+        call_state._import_legacy_file(conn, legacy_file)
+        assert call_state.get_call("OLD-3") is None, "Import runs only once"
+        print("✅ Legacy import works")
+
+    with_temp_db(run)
+
+if __name__ == "__main__":
+    test_status_transitions_and_attempts()
+    test_batched_lookup_and_prune()
+    test_legacy_import()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import main_backup
+
+class FakeResponse:
+    status_code = 200
+    def __init__(self, payload):
+        self.payload = payload
+    def raise_for_status(self):
+        pass
+    def json(self):
+        return self.payload
+
+def run_with_fake_calls(total, page_size, report_total, func):
+    """Run func with requests.get replaced by a fake paginated /calls/ endpoint"""
+    calls = [{"call_uuid": f"call-{i}", "flow": "in"} for i in range(total)]
+    requested_pages = []
+
+    def fake_get(method, url, headers=None, params=None, **kwargs):
+        page = params["page"]
+        requested_pages.append(page)
+        payload = {"calls": calls[(page - 1) * page_size:page * page_size]}
+        if report_total:
+            payload["total"] = total
+        return FakeResponse(payload)
+
+    original_request = main_backup.http_request
+    original_env = os.environ.get("CALLS_PAGE_SIZE")
+    main_backup.http_request = fake_get
+    os.environ["CALLS_PAGE_SIZE"] = str(page_size)
+    try:
+        return func(), requested_pages
+    finally:
+        main_backup.http_request = original_request
+        if original_env is None:
+            del os.environ["CALLS_PAGE_SIZE"]
+        else:
+            os.environ["CALLS_PAGE_SIZE"] = original_env
+
+def test_all_pages_without_total():
+    """Test that pages are followed until a short page when total is unknown"""
+    print("=== Testing Sequential Pagination ===")
+
+    calls, pages = run_with_fake_calls(
+        250, 100, False,
+        lambda: main_backup.get_recent_calls("example.invalid", "token")
+    )
+
+    assert len(calls) == 250, "Calls past the first page must not be dropped"
+    assert pages == [1, 2, 3], "Should stop after the short third page"
+    print("✅ Sequential pagination works")
+
+def test_concurrent_pages_with_total():
+    """Test concurrent page fetching when the total count is known"""
+    print("=== Testing Concurrent Pagination ===")
+
+    calls, pages = run_with_fake_calls(
+        1000, 100, True,
+        lambda: list(main_backup.iter_recent_calls("example.invalid", "token"))
+    )
+
+    assert len(calls) == 1000, "All calls should be yielded"
+    assert len({c["call_uuid"] for c in calls}) == 1000, "No call should be yielded twice"
+    assert sorted(pages) == list(range(1, 11)), "Every page should be requested exactly once"
+
+    ordered, _ = run_with_fake_calls(
+        1000, 100, True,
+        lambda: main_backup.get_recent_calls("example.invalid", "token")
+    )
+    assert [c["call_uuid"] for c in ordered] == [f"call-{i}" for i in range(1000)], \
+        "get_recent_calls should keep API order"
+    print("✅ Concurrent pagination works")
+
+if __name__ == "__main__":
+    test_all_pages_without_total()
+    test_concurrent_pages_with_total()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import main_backup
+from cdr_index import CDRIndex
+
+def test_cdr_index_lookup():
+    """Test CDR index lookups by call_uuid and record_uuid"""
+    print("=== Testing CDR Index Lookups ===")
+
+    cdr_index = CDRIndex()
+    cdr_index.add_records([
+        {"call_uuid": "call-1", "record_uuid": "rec-1", "record_file_size": 2048},
+        {"call_uuid": "call-2", "record_uuid": None, "record_file_size": 0},
+        {"call_uuid": "call-1", "record_uuid": None, "record_file_size": 0},
+        {"call_uuid": "call-3", "record_uuid": None, "record_file_size": None},
+        {"call_uuid": "call-3", "record_uuid": None, "record_file_size": None},
+    ])
+
+    assert len(cdr_index) == 3, "Should index 3 distinct calls"
+    assert cdr_index.has_recording("call-1") == (True, 2048), "Leg with recording should win"
+    assert cdr_index.has_recording("call-2") == (False, 0), "Zero-size recording is not a recording"
+    assert cdr_index.has_recording("missing") == (False, 0), "Unknown call has no recording"
+    assert cdr_index.has_recording("call-3") == (False, 0), "Null file size means no recording"
+    assert cdr_index.by_record_uuid["rec-1"]["call_uuid"] == "call-1"
+
+    print("✅ CDR index lookups work")
+
+def test_fetch_cdr_index_pages():
+    """Test that the CDR index walks all pages and counts requests"""
+    print("=== Testing CDR Index Pagination ===")
+
+    page_size = 3
+    records = [{"call_uuid": f"call-{i}", "record_file_size": i} for i in range(7)]
+
+    class FakeResponse:
+        status_code = 200
+        def __init__(self, payload):
+            self.payload = payload
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self.payload
+
+    def fake_get(method, url, headers=None, params=None, **kwargs):
+        page = params["page"]
+        chunk = records[(page - 1) * page_size:page * page_size]
+        return FakeResponse({"cdr": chunk})
+
+    original_request = main_backup.http_request
+    original_page_size = main_backup.CDR_PAGE_SIZE
+    main_backup.http_request = fake_get
+    main_backup.CDR_PAGE_SIZE = page_size
+    try:
+        main_backup.reset_cdr_request_count()
+        cdr_index = main_backup.fetch_cdr_index("example.invalid", "token")
+    finally:
+        main_backup.http_request = original_request
+        main_backup.CDR_PAGE_SIZE = original_page_size
+
+    assert cdr_index is not None, "Index should be built"
+    assert len(cdr_index) == 7, "All pages should be indexed"
+    assert cdr_index.request_count == 3, "7 records at 3 per page need 3 requests"
+    assert main_backup.get_cdr_request_count() == 3, "Cycle counter should match"
+
+    has_rec, size = main_backup.has_recording("example.invalid", "token", "call-6", cdr_index)
+    assert has_rec and size == 6, "Lookup should be served from the index"
+    assert main_backup.get_cdr_request_count() == 3, "Index lookups must not hit the API"
+
+    print("✅ CDR index pagination works")
+
+if __name__ == "__main__":
+    test_cdr_index_lookup()
+    test_fetch_cdr_index_pages()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import time
+import tempfile
+import threading
+import main_backup
+import transcript_cache
+from audio_utils import PCM_SAMPLE_RATE
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self._text = text
+        self.text = text
+
+    def json(self):
+        return {"result": self._text}
+
+def run_chunked(fail_chunk_at=None):
+    """Transcribe 70 s of fake PCM with silences at 20 s and 45 s"""
+    pcm_data = bytes(70 * PCM_SAMPLE_RATE * 2)
+    silences = [(19.8, 20.2), (44.6, 45.4)]
+    requests_seen = []
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def fake_http_request(method, url, endpoint="default", headers=None, params=None, data=None, **kwargs):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            requests_seen.append((params, len(data)))
+        # Первый фрагмент отвечает дольше всех - порядок текста не должен от этого зависеть
+        seconds = len(data) / (2 * PCM_SAMPLE_RATE)
+        time.sleep(0.2 if seconds < 21 else 0.05)
+        with lock:
+            in_flight["now"] -= 1
+        if fail_chunk_at is not None and abs(seconds - fail_chunk_at) < 0.5:
+            return FakeResponse(None)
+        return FakeResponse(f"фрагмент {seconds:.1f}с")
+
+    originals = (main_backup.decode_to_pcm, main_backup.http_request, transcript_cache.TRANSCRIPT_CACHE_DIR)
+    main_backup.decode_to_pcm = lambda audio_data: (pcm_data, silences)
+    main_backup.http_request = fake_http_request
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            transcript_cache.TRANSCRIPT_CACHE_DIR = cache_dir
+            transcript = main_backup.transcribe_with_yandex_chunked("key", b"ID3 long mp3")
+    finally:
+        main_backup.decode_to_pcm, main_backup.http_request, transcript_cache.TRANSCRIPT_CACHE_DIR = originals
+    return transcript, requests_seen, in_flight["max"]
+
+def test_chunks_are_transcribed_in_parallel_and_stitched_in_order():
+    """Test silence-aligned chunks, parallel requests and ordered timestamped output"""
+    print("=== Testing Chunked Yandex Transcription ===")
+
+    transcript, requests_seen, max_in_flight = run_chunked()
+
+    assert len(requests_seen) == 3, "70 s with silences at 20 s and 45 s gives 3 chunks"
+    assert all(params["format"] == "lpcm" and params["sampleRateHertz"] == str(PCM_SAMPLE_RATE)
+               for params, _ in requests_seen)
+    assert all(size <= main_backup.YANDEX_MAX_AUDIO_BYTES for _, size in requests_seen), "Chunks fit the 1 MB limit"
+    assert max_in_flight > 1, "Chunks should be recognized concurrently"
+    assert transcript.splitlines() == [
+        "[00:00] фрагмент 20.0с",
+        "[00:20] фрагмент 25.0с",
+        "[00:45] фрагмент 25.0с",
+    ], transcript
+    print("✅ Chunked transcription works")
+
+def test_failed_chunk_fails_transcription():
+    """Test that a missing chunk does not produce a transcript with a gap"""
+    print("=== Testing Chunk Failure ===")
+
+    transcript, _, _ = run_chunked(fail_chunk_at=20.0)
+    assert transcript is None, "Any failed chunk should fail the whole transcription"
+    print("✅ Chunk failure is reported")
+
+if __name__ == "__main__":
+    test_chunks_are_transcribed_in_parallel_and_stitched_in_order()
+    test_failed_chunk_fails_transcription()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import threading
+from datetime import datetime
+import pytz
+import main
+from daemon import get_poll_interval, run_daemon
+
+DAEMON_ENV = ("DAEMON_POLL_ACTIVE_SECONDS", "DAEMON_POLL_BUSINESS_SECONDS", "DAEMON_POLL_OFF_HOURS_SECONDS",
+              "DAEMON_POLL_MAX_SECONDS", "DAEMON_BUSINESS_HOURS")
+
+def with_env(env, func):
+    """Run func with DAEMON_* settings replaced by env"""
+    original_env = {name: os.environ.pop(name, None) for name in DAEMON_ENV}
+    os.environ.update(env)
+    try:
+        return func()
+    finally:
+        for name in DAEMON_ENV:
+            os.environ.pop(name, None)
+            if original_env[name] is not None:
+                os.environ[name] = original_env[name]
+
+def test_adaptive_poll_interval():
+    """Test the active, idle backoff and off-hours intervals"""
+    print("=== Testing Adaptive Poll Interval ===")
+
+    def run():
+        noon = datetime(2026, 10, 17, 9, 0, tzinfo=pytz.UTC)        # 12:00 MSK
+        night = datetime(2026, 10, 17, 23, 0, tzinfo=pytz.UTC)      # 02:00 MSK
+        early = datetime(2026, 10, 17, 5, 58, tzinfo=pytz.UTC)      # 08:58 MSK
+
+        assert get_poll_interval(0, noon) == 20, "Busy cycles poll quickly"
+        assert [get_poll_interval(idle, noon) for idle in (1, 2, 3, 4, 10)] == [60, 120, 240, 240, 240]
+        assert [get_poll_interval(idle, night) for idle in (1, 2, 3)] == [300, 600, 900]
+        assert get_poll_interval(5, early) == 120, "The night pause ends when business hours start"
+        print("✅ Poll interval adapts to load and business hours")
+
+    with_env({}, run)
+
+def test_sigterm_finishes_cycle_and_stops():
+    """Test that SIGTERM during a cycle lets it finish and stops the daemon"""
+    print("=== Testing Daemon Shutdown ===")
+
+    cycles = []
+
+    def fake_cycle(stop_event):
+        cycles.append(stop_event.is_set())
+        if len(cycles) == 3:
+            os.kill(os.getpid(), signal.SIGTERM)
+            assert stop_event.is_set(), "The handler only sets the stop flag"
+        return {'new_calls': len(cycles) % 2}
+
+    def run():
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        completed = run_daemon(fake_cycle, threading.Event())
+        assert completed == 3
+        assert cycles == [False, False, False]
+        assert signal.getsignal(signal.SIGTERM) is previous_handler, "Signal handlers are restored"
+        print("✅ SIGTERM finishes the cycle and stops the daemon")
+
+    with_env({"DAEMON_POLL_ACTIVE_SECONDS": "0.01", "DAEMON_POLL_BUSINESS_SECONDS": "0.01",
+              "DAEMON_POLL_OFF_HOURS_SECONDS": "0.01"}, run)
+
+def test_alert_lag():
+    """Test call end → alert lag samples and their summary"""
+    print("=== Testing Alert Lag ===")
+
+    main.reset_alert_lags()
+    call_end = datetime(2026, 10, 17, 12, 1, tzinfo=pytz.UTC).timestamp()
+    call = {"start_time_gmt": "2026-10-17 12:00:00", "duration": "60"}
+    for minutes in (2, 3, 4, 30):
+        main.record_alert_lag(call, call_end + minutes * 60)
+    assert main.record_alert_lag({"start_time_gmt": None}, call_end) is None
+
+    assert main.format_alert_lag() == "4 alerts, p50 4.0 min, p95 30.0 min, max 30.0 min", main.format_alert_lag()
+    main.reset_alert_lags()
+    assert main.format_alert_lag() == "no alerts"
+    print("✅ Alert lag is measured from the call end")
+
+if __name__ == "__main__":
+    test_adaptive_poll_interval()
+    test_sigterm_finishes_cycle_and_stops()
+    test_alert_lag()
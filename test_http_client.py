@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http_client
+
+def start_flaky_server(failures):
+    """Start a local server that answers 503 `failures` times, then 200"""
+    state = {"requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            state["requests"] += 1
+            status = 503 if state["requests"] <= failures else 200
+            body = b"ok"
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+def test_retry_with_backoff():
+    """Test that 5xx responses are retried and counted"""
+    print("=== Testing HTTP Retries ===")
+
+    os.environ["HTTP_BACKOFF_BASE"] = "0.01"
+    server, state = start_flaky_server(failures=2)
+    try:
+        http_client.reset_http_stats()
+        url = f"http://127.0.0.1:{server.server_port}/calls/"
+        response = http_client.http_request("GET", url, endpoint="telphin_api")
+    finally:
+        server.shutdown()
+        del os.environ["HTTP_BACKOFF_BASE"]
+
+    assert response.status_code == 200, "Request should succeed after retries"
+    assert state["requests"] == 3, "Two failures plus one success"
+    stats = http_client.get_http_stats()["telphin_api"]
+    assert stats["requests"] == 1 and stats["retries"] == 2, "Retries should be reported"
+    print("✅ HTTP retries work")
+
+def test_retry_limit():
+    """Test that the last 5xx response is returned once retries are exhausted"""
+    print("=== Testing HTTP Retry Limit ===")
+
+    os.environ["HTTP_BACKOFF_BASE"] = "0.01"
+    server, state = start_flaky_server(failures=10)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/stt"
+        response = http_client.http_request("GET", url, endpoint="yandex_stt", max_retries=1)
+    finally:
+        server.shutdown()
+        del os.environ["HTTP_BACKOFF_BASE"]
+
+    assert response.status_code == 503, "Final error response is returned to the caller"
+    assert state["requests"] == 2, "One retry allowed"
+    print("✅ HTTP retry limit works")
+
+def test_timeouts_per_endpoint():
+    """Test endpoint timeout defaults and env overrides"""
+    print("=== Testing Endpoint Timeouts ===")
+
+    assert http_client.get_timeout("telphin_download") == (5, 120)
+    assert http_client.get_timeout("unknown") == http_client.ENDPOINT_TIMEOUTS["default"]
+    os.environ["HTTP_TIMEOUT_YANDEX_STT"] = "2,10"
+    try:
+        assert http_client.get_timeout("yandex_stt") == (2.0, 10.0)
+    finally:
+        del os.environ["HTTP_TIMEOUT_YANDEX_STT"]
+    print("✅ Endpoint timeouts work")
+
+if __name__ == "__main__":
+    test_retry_with_backoff()
+    test_retry_limit()
+    test_timeouts_per_endpoint()
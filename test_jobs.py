@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import threading
+import main
+from jobs import JobQueue
+from main_backup import create_web_app, _run_process_job
+
+def make_queue():
+    """Job queue whose "process" runner blocks until released"""
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def process(job):
+        runs.append(job.id)
+        job.update(stage="processing_calls", total=3, done=0)
+        started.set()
+        release.wait(5)
+        for _ in range(3):
+            job.update(advance=1)
+        return {"new_calls": 3}
+
+    def deployment_check(job):
+        raise RuntimeError("deployment check could not run")
+
+    job_queue = JobQueue({"process": process, "deployment_check": deployment_check}, history_size=3)
+    return job_queue, started, release, runs
+
+def test_single_flight_and_progress():
+    """Test that a second trigger joins the running job and progress is reported"""
+    print("=== Testing Job Queue Single-Flight ===")
+
+    job_queue, started, release, runs = make_queue()
+    job, joined = job_queue.submit("process")
+    assert not joined
+    assert started.wait(5)
+
+    same_job, joined = job_queue.submit("process")
+    assert joined and same_job is job, "A running job is joined, not duplicated"
+    running = job_queue.get(job.id)
+    assert (running["status"], running["stage"], running["done"], running["total"]) == ("running", "processing_calls", 0, 3)
+
+    release.set()
+    assert job_queue.wait(5)
+    finished = job_queue.get(job.id)
+    assert finished["status"] == "succeeded" and finished["done"] == 3 and finished["joined"] == 1
+    assert finished["result"] == {"new_calls": 3}
+    assert len(runs) == 1, "The cycle ran once"
+
+    next_job, joined = job_queue.submit("process")
+    assert not joined and next_job.id != job.id, "A finished job is not joined"
+    assert job_queue.wait(5)
+    print("✅ Triggers join the running cycle")
+
+def test_failures_and_history():
+    """Test failed jobs and the bounded history"""
+    print("=== Testing Job Failures ===")
+
+    job_queue, _, release, _ = make_queue()
+    release.set()
+    failed, _ = job_queue.submit("deployment_check")
+    assert job_queue.wait(5)
+    assert job_queue.get(failed.id)["status"] == "failed"
+    assert "could not run" in job_queue.get(failed.id)["error"]
+
+    for _ in range(4):
+        job_queue.submit("process")
+        job_queue.wait(5)
+    assert job_queue.get(failed.id) is None, "Old finished jobs are dropped"
+    assert len(job_queue.jobs) == 3
+    print("✅ Failures are reported and history is bounded")
+
+def test_endpoints_return_immediately():
+    """Test that /process answers 202 with a job id while the cycle runs"""
+    print("=== Testing Job Endpoints ===")
+
+    job_queue, started, release, _ = make_queue()
+    client = create_web_app(job_queue).test_client()
+
+    response = client.get("/process")
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert response.headers["Location"].endswith(f"/jobs/{job_id}")
+    assert started.wait(5)
+
+    response = client.get("/process")
+    assert response.get_json() == {"job_id": job_id, "status": "running", "joined": True}
+    assert client.get(f"/jobs/{job_id}").get_json()["stage"] == "processing_calls"
+    assert client.get("/jobs/unknown").status_code == 404
+
+    release.set()
+    job_queue.wait(5)
+    assert client.get(f"/jobs/{job_id}").get_json()["status"] == "succeeded"
+    print("✅ Endpoints queue jobs and report progress")
+
+def test_process_job_reports_cycle_progress():
+    """Test that /process runs the processing cycle with per-call progress and its summary"""
+    print("=== Testing /process Job Progress ===")
+
+    progress_seen = []
+
+    def fake_main_new(deployment_check=False, stop_event=None, progress=None):
+        progress(stage="processing_calls", total=2, done=0)
+        for _ in range(2):
+            progress(advance=1)
+            progress_seen.append(job_queue.get(job.id)["done"])
+        return {"new_calls": 3, "processed": 2, "alerts": 1}
+
+    original = main.main_new
+    main.main_new = fake_main_new
+    try:
+        job_queue = JobQueue({"process": _run_process_job})
+        client = create_web_app(job_queue).test_client()
+        job_id = client.get("/process").get_json()["job_id"]
+        job = job_queue.jobs[job_id]
+        assert job_queue.wait(5)
+    finally:
+        main.main_new = original
+
+    status = client.get(f"/jobs/{job_id}").get_json()
+    assert status["status"] == "succeeded"
+    assert (status["stage"], status["done"], status["total"]) == ("processing_calls", 2, 2)
+    assert status["result"] == {"new_calls": 3, "processed": 2, "alerts": 1}
+    assert progress_seen == [1, 2], "Calls done are visible while the cycle runs"
+    print("✅ /process reports calls done / total and the cycle result")
+
+if __name__ == "__main__":
+    test_single_flight_and_progress()
+    test_failures_and_history()
+    test_endpoints_return_immediately()
+    test_process_job_reports_cycle_progress()
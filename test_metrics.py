@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import tempfile
+import call_state
+import metrics
+from telegram_notifier import enqueue_alert
+
+def with_temp_registry(func):
+    """Run func against a fresh call state database and no pending metrics"""
+    original_db = call_state.CALL_STATE_DB
+    original_legacy = call_state.LEGACY_PROCESSED_CALLS_FILE
+    metrics.reset_pending_metrics()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        call_state.CALL_STATE_DB = os.path.join(tmp_dir, "call_state.db")
+        call_state.LEGACY_PROCESSED_CALLS_FILE = os.path.join(tmp_dir, "missing.txt")
+        try:
+            return func()
+        finally:
+            metrics.reset_pending_metrics()
+            call_state.CALL_STATE_DB = original_db
+            call_state.LEGACY_PROCESSED_CALLS_FILE = original_legacy
+
+def test_flush_accumulates_counters():
+    """Test that counter deltas add up across flushes and gauges keep the last value"""
+    print("=== Testing Metrics Registry ===")
+
+    def run():
+        metrics.inc("analyzer_calls_total", step="fetched")
+        metrics.inc("analyzer_calls_total", 2, step="fetched")
+        metrics.set_gauge("analyzer_last_cycle_timestamp_seconds", 100)
+        assert metrics.flush_metrics() == 2
+        assert metrics.flush_metrics() == 0, "Nothing pending after a flush"
+
+        metrics.inc("analyzer_calls_total", step="fetched")
+        metrics.set_gauge("analyzer_last_cycle_timestamp_seconds", 200)
+        metrics.flush_metrics()
+
+        page = metrics.render_metrics()
+        assert 'analyzer_calls_total{step="fetched"} 4' in page
+        assert "analyzer_last_cycle_timestamp_seconds 200" in page
+        assert "# TYPE analyzer_calls_total counter" in page
+        print("✅ Counters accumulate across flushes")
+
+    with_temp_registry(run)
+
+def test_histogram_exposition():
+    """Test cumulative buckets, sum and count of a histogram"""
+    print("=== Testing Histogram Exposition ===")
+
+    def run():
+        for seconds in (0.2, 3, 200):
+            metrics.observe("analyzer_stage_duration_seconds", seconds, stage="transcribe")
+        metrics.flush_metrics()
+
+        lines = [line for line in metrics.render_metrics().splitlines()
+                 if line.startswith("analyzer_stage_duration_seconds")]
+        buckets = [line for line in lines if "_bucket" in line]
+        assert buckets[0] == 'analyzer_stage_duration_seconds_bucket{le="0.05",stage="transcribe"} 0'
+        assert 'analyzer_stage_duration_seconds_bucket{le="0.25",stage="transcribe"} 1' in buckets
+        assert 'analyzer_stage_duration_seconds_bucket{le="5",stage="transcribe"} 2' in buckets
+        assert buckets[-1] == 'analyzer_stage_duration_seconds_bucket{le="+Inf",stage="transcribe"} 3', "+Inf is last"
+        assert 'analyzer_stage_duration_seconds_sum{stage="transcribe"} 203.2' in lines
+        assert 'analyzer_stage_duration_seconds_count{stage="transcribe"} 3' in lines
+        print("✅ Histograms follow the Prometheus text format")
+
+    with_temp_registry(run)
+
+def test_metrics_endpoint_reads_worker_registry():
+    """Test that the web app serves what another process flushed, plus live outbox gauges"""
+    print("=== Testing /metrics Endpoint ===")
+
+    def run():
+        import app
+
+        metrics.inc("analyzer_cache_events_total", cache="analysis", event="hits")
+        metrics.flush_metrics()
+        enqueue_alert("call-1", "alert", chat_id="chat-1")
+        call_state.get_connection().execute(
+            "UPDATE telegram_outbox SET created_at = ? WHERE call_uuid = 'call-1'", (time.time() - 120,)
+        )
+
+        response = app.app.test_client().get("/metrics")
+        page = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert 'analyzer_cache_events_total{cache="analysis",event="hits"} 1' in page
+        assert "analyzer_telegram_outbox_pending 1" in page
+        age_line = [line for line in page.splitlines()
+                    if line.startswith("analyzer_telegram_outbox_oldest_pending_age_seconds ")][0]
+        age = float(age_line.split()[1])
+        assert 119 <= age < 130
+        print("✅ /metrics serves the shared registry")
+
+    with_temp_registry(run)
+
+if __name__ == "__main__":
+    test_flush_accumulates_counters()
+    test_histogram_exposition()
+    test_metrics_endpoint_reads_worker_registry()
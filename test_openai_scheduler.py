@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import asyncio
+from types import SimpleNamespace
+import openai_scheduler
+from openai_scheduler import RateLimiter, OpenAIScheduler, parse_reset_duration
+
+class FakeRateLimit(Exception):
+    """Stand-in for openai.RateLimitError with a Retry-After header"""
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after-ms": "50"})
+
+def make_scheduler(fake_client, **env):
+    """Create a scheduler whose AsyncOpenAI client is fake_client"""
+    original_client = openai_scheduler.openai.AsyncOpenAI
+    original_env = {name: os.environ.get(name) for name in env}
+    openai_scheduler.openai.AsyncOpenAI = lambda **kwargs: fake_client
+    os.environ.update(env)
+    try:
+        return OpenAIScheduler("test-key")
+    finally:
+        openai_scheduler.openai.AsyncOpenAI = original_client
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def test_rate_limiter_budgets():
+    """Test RPM/TPM buckets, header adaptation and pauses"""
+    print("=== Testing Rate Limiter ===")
+
+    limiter = RateLimiter(rpm=2, tpm=1000)
+    limiter.updated = 100.0
+    assert limiter.reserve(400, now=100.0) == 0
+    assert limiter.reserve(400, now=100.0) == 0
+    assert abs(limiter.reserve(100, now=100.0) - 30.0) < 0.01, "Third request waits for the RPM bucket"
+    assert limiter.reserve(100, now=130.0) == 0, "Bucket refills over time"
+
+    limiter = RateLimiter(rpm=100, tpm=6000)
+    limiter.updated = 0.0
+    assert abs(limiter.reserve(7000, now=0.0)) < 0.01, "Oversized requests pass with a full bucket"
+    assert abs(limiter.reserve(3000, now=0.0) - 30.0) < 0.01, "Tokens are refilled at TPM/60 per second"
+
+    limiter = RateLimiter(rpm=500, tpm=150000)
+    limiter.updated = 0.0
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1s", "x-ratelimit-limit-tokens": "30000",
+        "x-ratelimit-remaining-tokens": "29000",
+    }, now=0.0)
+    assert (limiter.rpm, limiter.tpm, limiter.tokens) == (60, 30000, 29000), "Headers lower the budget"
+    assert abs(limiter.reserve(10, now=0.0) - 1.0) < 0.01, "Exhausted quota pauses until reset"
+
+    assert parse_reset_duration("6m0s") == 360
+    assert parse_reset_duration("20ms") == 0.02
+    assert parse_reset_duration("1h2m3.5s") == 3723.5
+    print("✅ Rate limiter works")
+
+def test_requests_run_concurrently_and_retry_429():
+    """Test that a burst is not serialized by latency and that 429s are retried"""
+    print("=== Testing OpenAI Scheduler ===")
+
+    attempts = {}
+
+    class FakeCompletions:
+        async def create(self, model, messages, **kwargs):
+            key = messages[0]["content"]
+            attempts[key] = attempts.get(key, 0) + 1
+            if key == "call-0" and attempts[key] == 1:
+                raise FakeRateLimit("rate limited")
+            await asyncio.sleep(0.2)
+            return SimpleNamespace(usage=SimpleNamespace(total_tokens=10), text=key)
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()), close=lambda: asyncio.sleep(0))
+    scheduler = make_scheduler(fake_client, OPENAI_MAX_CONCURRENCY="20")
+    try:
+        started = time.monotonic()
+        futures = [
+            scheduler.submit("gpt-test", lambda client, i=i: client.chat.completions.create(
+                model="gpt-test", messages=[{"role": "user", "content": f"call-{i}"}]), estimated_tokens=100)
+            for i in range(20)
+        ]
+        results = [future.result(timeout=10) for future in futures]
+        elapsed = time.monotonic() - started
+    finally:
+        scheduler.close()
+
+    assert [result.text for result in results] == [f"call-{i}" for i in range(20)]
+    assert elapsed < 1.5, f"20 requests of 0.2s should overlap, took {elapsed:.2f}s"
+    assert attempts["call-0"] == 2, "Rate-limited request is retried"
+    stats = scheduler.get_stats()
+    assert (stats["requests"], stats["retries"], stats["rate_limited"]) == (21, 1, 1)
+    print(f"✅ 20 requests in {elapsed:.2f}s with one 429 retry")
+
+def test_non_retryable_errors_are_raised():
+    """Test that client errors are not retried"""
+    print("=== Testing OpenAI Scheduler Errors ===")
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    calls = []
+
+    async def failing(client):
+        calls.append(1)
+        raise BadRequest("bad request")
+
+    scheduler = make_scheduler(SimpleNamespace(close=lambda: asyncio.sleep(0)))
+    try:
+        scheduler.run("gpt-test", failing)
+        assert False, "BadRequest should be raised"
+    except BadRequest:
+        pass
+    finally:
+        scheduler.close()
+    assert len(calls) == 1
+    print("✅ Client errors are raised without retries")
+
+if __name__ == "__main__":
+    test_rate_limiter_budgets()
+    test_requests_run_concurrently_and_retry_429()
+    test_non_retryable_errors_are_raised()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+import main
+from pipeline import Pipeline, Stage
+
+def test_stages_overlap_with_bounded_workers():
+    """Test that jobs run concurrently per stage and respect the worker limit"""
+    print("=== Testing Pipeline Concurrency ===")
+
+    active = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def slow_stage(job):
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        job["slow_done"] = True
+        return job
+
+    def finish_stage(job):
+        job["status"] = "done"
+        return job
+
+    pipeline = Pipeline([Stage("slow", slow_stage, workers=3), Stage("finish", finish_stage, workers=1)], queue_size=2)
+    started = time.monotonic()
+    finished = pipeline.run({"id": i} for i in range(9))
+    elapsed = time.monotonic() - started
+
+    assert len(finished) == 9, "Every job should finish"
+    assert all(job["status"] == "done" for job in finished)
+    assert active["peak"] == 3, "Stage concurrency should reach but not exceed its worker limit"
+    assert elapsed < 0.05 * 9 * 0.7, "Jobs should overlap instead of running serially"
+    print("✅ Pipeline runs stages concurrently")
+
+def test_early_finish_and_errors():
+    """Test that jobs can finish early and that stage errors reach the error handler"""
+    print("=== Testing Pipeline Early Finish and Errors ===")
+
+    errors = []
+
+    def first(job):
+        if job["id"] == 0:
+            return None
+        if job["id"] == 1:
+            raise RuntimeError("boom")
+        return job
+
+    pipeline = Pipeline(
+        [Stage("first", first, workers=2), Stage("second", lambda job: job, workers=2)],
+        on_error=lambda job, stage, error: errors.append((job["id"], stage))
+    )
+    finished = pipeline.run({"id": i} for i in range(4))
+
+    assert sorted(job["id"] for job in finished) == [0, 1, 2, 3], "Finished jobs are all reported"
+    assert errors == [(1, "first")], "Stage error should be reported once with its stage"
+    print("✅ Early finish and errors work")
+
+def test_failing_job_source_stops_workers():
+    """Test that an exception from the job source still stops and joins the workers"""
+    print("=== Testing Pipeline Failing Job Source ===")
+
+    def failing_jobs():
+        yield {"id": 0}
+        yield {"id": 1}
+        raise ValueError("listing failed")
+
+    pipeline = Pipeline([Stage("first", lambda job: job, workers=2), Stage("second", lambda job: job, workers=2)])
+    threads_before = threading.active_count()
+    try:
+        pipeline.run(failing_jobs())
+        assert False, "The source error should propagate"
+    except ValueError:
+        pass
+
+    assert sorted(job["id"] for job in pipeline.finished) == [0, 1], "Jobs fed before the error are finished"
+    assert threading.active_count() == threads_before, "No worker thread is left blocked"
+    print("✅ Workers stop when the job source fails")
+
+def test_call_pipeline_status_transitions():
+    """Test that call statuses are saved in the same order as the sequential loop did"""
+    print("=== Testing Call Pipeline Statuses ===")
+
+    saved = []
+    queued = []
+    saved_lock = threading.Lock()
+
+    def fake_save(call_id, status="success", error=None):
+        with saved_lock:
+            saved.append((call_id, status))
+
+    fakes = {
+        "save_processed_call": fake_save,
+        "download_recording": lambda hostname, token, call_uuid, cdr_index=None: None if call_uuid == "no-rec" else b"OggS audio",
+        "transcribe_with_yandex": lambda api_key, audio: (
+            "Здравствуйте, хочу заказать букет из пятнадцати роз на вечер. "
+            "Сейчас уточню у флориста и перезвоню вам. Хорошо, жду звонка."
+        ),
+        "analyze_with_gpt_new": lambda transcript, call_info=None: {"status": "alert", "error_code": "M1"},
+        "enqueue_alert": lambda call_uuid, text: queued.append(call_uuid) or True,
+    }
+
+    originals = {name: getattr(main, name) for name in fakes}
+    try:
+        for name, fake in fakes.items():
+            setattr(main, name, fake)
+        ctx = {"hostname": "example.invalid", "token_provider": None, "cdr_index": None, "yandex_api_key": "key"}
+        calls = [{"call_uuid": "alert-call", "flow": "in"}, {"call_uuid": "no-rec", "flow": "in"}]
+        jobs = [{"index": i + 1, "total": 2, "call": call, "call_uuid": call["call_uuid"]} for i, call in enumerate(calls)]
+        finished = main.build_call_pipeline(ctx).run(jobs)
+    finally:
+        for name, original in originals.items():
+            setattr(main, name, original)
+
+    statuses = {job["call_uuid"]: job["status"] for job in finished}
+    assert statuses == {"alert-call": "alert_queued", "no-rec": "no_recording"}
+    assert [s for c, s in saved if c == "alert-call"] == ["processing", "alert_queued"]
+    assert queued == ["alert-call"], "Alerts go to the Telegram outbox"
+    assert [s for c, s in saved if c == "no-rec"] == ["processing", "no_recording"]
+    print("✅ Call pipeline statuses are correct")
+
+if __name__ == "__main__":
+    test_stages_overlap_with_bounded_workers()
+    test_early_finish_and_errors()
+    test_failing_job_source_stops_workers()
+    test_call_pipeline_status_transitions()
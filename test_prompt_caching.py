@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+import main
+import openai_scheduler
+from prompt_loader import PromptLoader
+
+def test_static_prefix_is_shared():
+    """Test that the system block is identical for all calls and holds no per-call data"""
+    print("=== Testing Static Prompt Prefix ===")
+
+    loader = PromptLoader()
+    first = loader.get_analysis_messages("Алло, нужны пионы сорта Сара Бернар", {"duration": 42, "time": "2026-01-01 10:00:00"})
+    second = loader.get_analysis_messages("Хочу тюльпаны", {"duration": 7})
+
+    assert [m["role"] for m in first] == ["system", "user"]
+    assert first[0] == second[0], "System block must be byte-identical across calls"
+    assert "Сара Бернар" not in first[0]["content"] and "42 сек" not in first[0]["content"]
+    assert "Сара Бернар" in first[1]["content"] and "42 сек" in first[1]["content"]
+    assert len(first[1]["content"]) < len(first[0]["content"]) / 5, "Per-call block should be small"
+    print("✅ Static prompt prefix works")
+
+def test_prompt_version_changes_on_reload():
+    """Test that the static block is rebuilt when prompt files change"""
+    print("=== Testing Prompt Version ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prompts_dir = os.path.join(tmp_dir, "prompts")
+        shutil.copytree("prompts", prompts_dir)
+        loader = PromptLoader(prompts_dir)
+        version = loader.prompt_version
+
+        with open(os.path.join(prompts_dir, "final_instructions.txt"), "a", encoding="utf-8") as f:
+            f.write("\nДополнительное правило.")
+        loader.reload_prompts()
+
+        assert loader.prompt_version != version
+        assert loader.static_system_prompt.endswith("Дополнительное правило.")
+    print("✅ Prompt version works")
+
+def test_cached_tokens_are_reported():
+    """Test that cached prompt tokens from the usage field are accumulated"""
+    print("=== Testing Cached Token Reporting ===")
+
+    sent = []
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            sent.append(kwargs["messages"])
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content='{"status": "ignore"}'))],
+                usage=SimpleNamespace(
+                    prompt_tokens=2100, completion_tokens=6,
+                    prompt_tokens_details=SimpleNamespace(cached_tokens=1920)
+                )
+            )
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    original_client = main.openai.AsyncOpenAI
+    original_env = {name: os.environ.get(name) for name in ("OPENAI_API_KEY", "ANALYSIS_CASCADE_ENABLED", "ANALYSIS_CACHE_ENABLED", "ANALYSIS_STREAMING")}
+    main.openai.AsyncOpenAI = lambda **kwargs: fake_client
+    openai_scheduler.reset_scheduler()
+    os.environ["OPENAI_API_KEY"] = "test-key"
+    os.environ["ANALYSIS_CASCADE_ENABLED"] = "0"
+    os.environ["ANALYSIS_CACHE_ENABLED"] = "0"
+    os.environ["ANALYSIS_STREAMING"] = "0"
+    main.reset_analysis_usage()
+    try:
+        assert main.analyze_with_gpt_new("текст", {"duration": 10}) == {"status": "ignore"}
+        assert main.analyze_with_gpt_new("другой текст", {"duration": 20}) == {"status": "ignore"}
+    finally:
+        main.openai.AsyncOpenAI = original_client
+        openai_scheduler.reset_scheduler()
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    assert sent[0][0]["role"] == "system" and sent[0][0] == sent[1][0]
+    stats = main.analysis_usage_stats["analysis"]
+    assert (stats["requests"], stats["prompt_tokens"], stats["cached_tokens"], stats["completion_tokens"]) == (2, 4200, 3840, 12)
+    assert "91%" in main.format_analysis_usage()
+    print("✅ Cached token reporting works")
+
+if __name__ == "__main__":
+    test_static_prefix_is_shared()
+    test_prompt_version_changes_on_reload()
+    test_cached_tokens_are_reported()
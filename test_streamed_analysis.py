@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import os
+import main
+import openai_scheduler
+from fake_openai_server import FakeOpenAIServer
+from analysis_schema import sniff_status, validate_analysis
+
+def test_sniff_status_and_validation():
+    """Test status detection on partial answers and alert validation"""
+    print("=== Testing Analysis Schema ===")
+
+    assert sniff_status('{"sta') is None
+    assert sniff_status('{"status": "ign') is None, "Status value is not complete yet"
+    assert sniff_status('{"status": "ignore"') == "ignore"
+    assert sniff_status('{ "status":"alert", "error_code": "M') == "alert"
+
+    alert = {"status": "alert", "error_code": "M4", "error_description": "Не предложил альтернативу",
+             "context": "Нет пионов", "solution": "Предложить розы", "client_wanted": None}
+    assert validate_analysis(alert) == []
+    assert validate_analysis({"status": "ignore", "error_code": None}) == []
+    assert validate_analysis(dict(alert, solution=None)) == ["solution is missing"]
+    assert validate_analysis(dict(alert, error_code="X1")) == ["unknown error_code 'X1'"]
+    assert validate_analysis(None) == ["result is not a JSON object"]
+    print("✅ Schema helpers work")
+
+def test_streamed_analysis_against_fake_server():
+    """Test early stop on ignore and full validated alerts over a real streamed connection"""
+    print("=== Testing Streamed Analysis ===")
+
+    settings = {"OPENAI_API_KEY": "test-key", "ANALYSIS_CASCADE_ENABLED": "0", "ANALYSIS_CACHE_ENABLED": "0",
+                "ANALYSIS_STREAMING": "1"}
+    with FakeOpenAIServer() as server:
+        settings["OPENAI_BASE_URL"] = server.base_url
+        original_env = {name: os.environ.get(name) for name in settings}
+        os.environ.update(settings)
+        openai_scheduler.reset_scheduler()
+        try:
+            main.reset_analysis_usage()
+            ignored = main.analyze_with_gpt_new("Клиент уточнил адрес доставки и попрощался", {"duration": 42})
+            assert ignored == {"status": "ignore"}
+            stats = main.analysis_usage_stats["analysis"]
+            assert stats["requests"] == 1 and stats["estimated"] == 1, "Stream closed before the usage chunk"
+            assert stats["prompt_tokens"] > 0 and stats["completion_tokens"] > 0, "Usage is estimated, not zero"
+            assert "1 with estimated usage" in main.format_analysis_usage()
+
+            alert = main.analyze_with_gpt_new("Клиент хотел букет, менеджер сказал: я вам перезвоню", {"duration": 42})
+        finally:
+            openai_scheduler.reset_scheduler()
+            for name, value in original_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    assert alert["status"] == "alert" and alert["error_code"] == "M3"
+    assert "price_mentioned" not in alert, "Null fields are dropped"
+    assert validate_analysis(alert) == []
+    print("✅ Streamed analysis stops early on ignore and validates alerts")
+
+if __name__ == "__main__":
+    test_sniff_status_and_validation()
+    test_streamed_analysis_against_fake_server()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import random
+import statistics
+from datetime import datetime
+from unittest import mock
+
+import pytz
+
+import synthetic_calls
+from synthetic_calls import generate_calls, make_pcm_pattern, encode_mp3, MOSCOW_TZ, SAMPLE_RATE
+
+END = pytz.UTC.localize(datetime(2026, 10, 16, 21, 0))
+
+def test_day_distributions():
+    """Test Telphin-shaped records with realistic shares over a day"""
+    print("=== Testing Synthetic Call Records ===")
+
+    synthetic = generate_calls(2000, end_utc=END, hours=24, seed=1)
+    calls = synthetic.calls
+    assert len(calls) == len(synthetic.cdr_records) == 2000
+    starts = [call["start_time_gmt"] for call in calls]
+    assert starts == sorted(starts)
+    assert "2026-10-15 21:00:00" <= starts[0] and starts[-1] <= "2026-10-16 20:55:00"
+
+    incoming_share = sum(call["flow"] == "in" for call in calls) / len(calls)
+    assert 0.67 < incoming_share < 0.77
+    business = sum(9 <= pytz.UTC.localize(datetime.strptime(start, "%Y-%m-%d %H:%M:%S")).astimezone(MOSCOW_TZ).hour < 21
+                   for start in starts)
+    assert business / len(calls) > 0.85, "Most calls fall into shop hours"
+
+    answered = [call for call in calls if call["result"] == "answered"]
+    assert 0.7 < len(answered) / len(calls) < 0.85
+    assert 60 < statistics.median(call["bridged_duration"] for call in answered) < 140
+    for call, cdr_record in zip(calls, synthetic.cdr_records):
+        assert cdr_record["call_uuid"] == call["call_uuid"] and call["bridged_username"]
+        if call["result"] == "answered":
+            assert cdr_record["record_file_size"] > 0 and cdr_record["storage_url"].endswith(f"{cdr_record['record_uuid']}.mp3")
+        else:
+            assert cdr_record["record_uuid"] is None and cdr_record["record_file_size"] == 0
+
+    again = generate_calls(2000, end_utc=END, hours=24, seed=1)
+    assert again.calls == calls, "A seed gives the same dataset"
+    print("✅ Records follow the daily profile and call shares")
+
+def test_scripts_and_filler_recordings():
+    """Test that scenarios decide alerts and the fake STT finds each transcript"""
+    print("=== Testing Synthetic Transcripts ===")
+
+    synthetic = generate_calls(300, end_utc=END, seed=2)
+    assert synthetic.expected_alerts
+    for record_uuid, script in synthetic.scripts.items():
+        assert ("перезвон" in script["transcript"]) == (script["scenario"] == "lost_sale")
+        recording = synthetic.filler_recording(record_uuid)
+        assert recording.startswith(b"OggS") and len(recording) == script["duration"] * 4000
+        assert synthetic.transcribe(recording) == script["transcript"]
+    assert synthetic.transcribe(b"\xff\xfbother audio") in {script["transcript"] for script in synthetic.scripts.values()}
+    print("✅ Transcripts match their recordings")
+
+def test_recording_pattern():
+    """Test the tone/noise/silence pattern and the single ffmpeg encode"""
+    print("=== Testing Synthetic Recordings ===")
+
+    pcm = make_pcm_pattern(10, random.Random(3))
+    assert len(pcm) == 10 * SAMPLE_RATE * 2
+    assert bytes(2 * SAMPLE_RATE // 5) in pcm, "Pauses of at least 0.2 s"
+    assert pcm.count(0) < len(pcm) * 0.6, "Mostly speech-like bursts"
+
+    calls = []
+
+    def fake_run(cmd, input=None, capture_output=False):
+        calls.append((cmd, input))
+        return mock.Mock(returncode=0, stdout=b"ID3 encoded")
+
+    with mock.patch.object(synthetic_calls.subprocess, "run", fake_run):
+        assert encode_mp3(pcm) == b"ID3 encoded"
+    cmd, piped = calls[0]
+    assert cmd[0] == "ffmpeg" and cmd[-1] == "pipe:1" and piped == pcm
+    print("✅ Recordings are encoded in one ffmpeg run")
+
+if __name__ == "__main__":
+    test_day_distributions()
+    test_scripts_and_filler_recordings()
+    test_recording_pattern()
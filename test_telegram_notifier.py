@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from telegram.error import RetryAfter, TimedOut, Forbidden
+import call_state
+from telegram_notifier import TelegramNotifier, enqueue_alert, get_outbox_entry, count_pending
+
+class FakeBot:
+    """Bot stand-in: records sends and raises queued errors first"""
+
+    def __init__(self, errors=None):
+        self.errors = list(errors or [])
+        self.sent = []
+        self.send_times = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+        self.send_times.append(time.monotonic())
+        return SimpleNamespace(message_id=len(self.sent))
+
+def with_temp_outbox(func):
+    """Run func against a fresh call state database with a fast chat interval"""
+    env = {"TELEGRAM_CHAT_ID": "chat-1", "TELEGRAM_CHAT_INTERVAL_SECONDS": "0.1", "TELEGRAM_MAX_BACKOFF_SECONDS": "0.2"}
+    original_env = {name: os.environ.get(name) for name in env}
+    original_db = call_state.CALL_STATE_DB
+    original_legacy = call_state.LEGACY_PROCESSED_CALLS_FILE
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        call_state.CALL_STATE_DB = os.path.join(tmp_dir, "call_state.db")
+        call_state.LEGACY_PROCESSED_CALLS_FILE = os.path.join(tmp_dir, "missing.txt")
+        os.environ.update(env)
+        try:
+            return func()
+        finally:
+            call_state.CALL_STATE_DB = original_db
+            call_state.LEGACY_PROCESSED_CALLS_FILE = original_legacy
+            for name, value in original_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+def test_alerts_are_sent_once_in_order():
+    """Test idempotent queueing, ordered delivery and the per-chat interval"""
+    print("=== Testing Telegram Outbox Delivery ===")
+
+    def run():
+        assert enqueue_alert("call-1", "alert 1")
+        assert enqueue_alert("call-2", "alert 2")
+        assert not enqueue_alert("call-1", "alert 1 again"), "A call is queued only once"
+
+        bot = FakeBot()
+        notifier = TelegramNotifier(bot).start()
+        try:
+            assert notifier.flush(timeout=5) == 0
+            assert not enqueue_alert("call-1", "alert 1 after restart"), "Sent alerts are not queued again"
+            notifier.wake()
+            time.sleep(0.2)
+        finally:
+            notifier.stop()
+
+        assert bot.sent == [("chat-1", "alert 1"), ("chat-1", "alert 2")]
+        assert bot.send_times[1] - bot.send_times[0] >= 0.09, "Messages to one chat are spaced"
+        entry = get_outbox_entry("call-1")
+        assert entry["status"] == "sent" and entry["message_id"] == 1 and entry["attempts"] == 1
+        assert call_state.get_call("call-2")["status"] == "critical_alert_sent"
+        print("✅ Alerts are delivered once and in order")
+
+    with_temp_outbox(run)
+
+def test_retry_after_and_network_errors_are_retried():
+    """Test that flood control and network errors delay the alert instead of dropping it"""
+    print("=== Testing Telegram Retries ===")
+
+    def run():
+        enqueue_alert("call-1", "alert")
+        bot = FakeBot(errors=[RetryAfter(1), TimedOut()])
+        notifier = TelegramNotifier(bot).start()
+        started = time.monotonic()
+        try:
+            assert notifier.flush(timeout=5) == 0
+        finally:
+            notifier.stop()
+
+        assert bot.sent == [("chat-1", "alert")]
+        assert time.monotonic() - started >= 1.0, "retry_after is respected"
+        assert get_outbox_entry("call-1")["attempts"] == 3
+        assert notifier.stats == {"sent": 1, "retries": 2, "failed": 0}
+        print("✅ Flood control and network errors are retried")
+
+    with_temp_outbox(run)
+
+def test_pending_alerts_survive_restart():
+    """Test that alerts queued while Telegram is unreachable are sent by the next notifier"""
+    print("=== Testing Telegram Outbox Restart ===")
+
+    def run():
+        enqueue_alert("call-1", "alert")
+        bot = FakeBot(errors=[TimedOut()] * 100)
+        notifier = TelegramNotifier(bot).start()
+        assert notifier.flush(timeout=0.3) == 1, "Still pending while Telegram is down"
+        notifier.stop()
+
+        call_state.get_connection().execute("UPDATE telegram_outbox SET next_attempt_at = 0")
+        bot = FakeBot(errors=[Forbidden("bot was kicked")])
+        enqueue_alert("call-2", "another alert")
+        notifier = TelegramNotifier(bot).start()
+        try:
+            assert notifier.flush(timeout=5) == 0
+        finally:
+            notifier.stop()
+
+        assert get_outbox_entry("call-1")["status"] == "failed", "Permanent errors stop retries"
+        assert call_state.get_call("call-1")["status"] == "alert_failed"
+        assert bot.sent == [("chat-1", "another alert")]
+        assert count_pending() == 0
+        print("✅ Pending alerts survive a restart")
+
+    with_temp_outbox(run)
+
+if __name__ == "__main__":
+    test_alerts_are_sent_once_in_order()
+    test_retry_after_and_network_errors_are_retried()
+    test_pending_alerts_survive_restart()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import tempfile
+import telphin_auth
+import main_backup
+from telphin_auth import TelphinTokenProvider
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise telphin_auth.requests.exceptions.HTTPError(f"{self.status_code}")
+    def json(self):
+        return self.payload
+
+def test_token_cached_until_expiry():
+    """Test that the token is reused across calls and persisted to the cache file"""
+    print("=== Testing Token Caching ===")
+
+    issued = []
+
+    def fake_post(method, url, data=None, headers=None, **kwargs):
+        issued.append(url)
+        return FakeResponse(200, {"access_token": f"token-{len(issued)}", "expires_in": 3600})
+
+    original_auth_request = telphin_auth.http_request
+    telphin_auth.http_request = fake_post
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, "token.json")
+            provider = TelphinTokenProvider("example.invalid", "login", "secret", cache_file=cache_file)
+
+            assert provider.get_token() == "token-1"
+            assert provider.get_token() == "token-1", "Fresh token must be reused"
+            assert len(issued) == 1, "Only one auth round trip expected"
+
+            with open(cache_file) as f:
+                assert json.load(f)["access_token"] == "token-1", "Token should be persisted"
+
+            second = TelphinTokenProvider("example.invalid", "login", "secret", cache_file=cache_file)
+            assert second.get_token() == "token-1", "New process should reuse the cached token"
+            assert len(issued) == 1, "Cached token must not trigger auth"
+
+            provider.expires_at = 0
+            assert provider.get_token() == "token-2", "Expired token should be refreshed"
+    finally:
+        telphin_auth.http_request = original_auth_request
+
+    print("✅ Token caching works")
+
+def test_retry_on_401():
+    """Test that a 401 refreshes the token and retries the request once"""
+    print("=== Testing 401 Retry ===")
+
+    issued = []
+    seen_tokens = []
+
+    def fake_post(method, url, data=None, headers=None, **kwargs):
+        issued.append(url)
+        return FakeResponse(200, {"access_token": f"token-{len(issued)}", "expires_in": 3600})
+
+    def fake_get(method, url, headers=None, **kwargs):
+        seen_tokens.append(headers["Authorization"])
+        if headers["Authorization"] == "Bearer token-1":
+            return FakeResponse(401)
+        return FakeResponse(200, {"cdr": []})
+
+    original_auth_request = telphin_auth.http_request
+    original_request = main_backup.http_request
+    telphin_auth.http_request = fake_post
+    main_backup.http_request = fake_get
+    try:
+        provider = TelphinTokenProvider("example.invalid", "login", "secret", cache_file="")
+        response = main_backup.telphin_get("https://example.invalid/cdr/", provider)
+    finally:
+        telphin_auth.http_request = original_auth_request
+        main_backup.http_request = original_request
+
+    assert response.status_code == 200, "Retried request should succeed"
+    assert seen_tokens == ["Bearer token-1", "Bearer token-2"], "Exactly one retry with a new token"
+    print("✅ 401 retry works")
+
+def test_no_request_without_token():
+    """Test that no Telphin request is sent when authentication fails"""
+    print("=== Testing Failed Authentication ===")
+
+    sent = []
+
+    def fake_post(method, url, data=None, headers=None, **kwargs):
+        return FakeResponse(401)
+
+    def fake_get(method, url, headers=None, **kwargs):
+        sent.append(headers["Authorization"])
+        return FakeResponse(200)
+
+    original_auth_request = telphin_auth.http_request
+    original_request = main_backup.http_request
+    telphin_auth.http_request = fake_post
+    main_backup.http_request = fake_get
+    try:
+        provider = TelphinTokenProvider("example.invalid", "login", "secret", cache_file="")
+        try:
+            main_backup.telphin_get("https://example.invalid/cdr/", provider)
+            raised = False
+        except telphin_auth.requests.exceptions.RequestException:
+            raised = True
+    finally:
+        telphin_auth.http_request = original_auth_request
+        main_backup.http_request = original_request
+
+    assert raised, "Missing token should raise a RequestException"
+    assert sent == [], "No request with 'Bearer None' may be sent"
+    print("✅ Failed authentication stops the request")
+
+if __name__ == "__main__":
+    test_token_cached_until_expiry()
+    test_retry_on_401()
+    test_no_request_without_token()
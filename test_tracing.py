@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import time
+import threading
+import tracing
+from tracing import Trace, log_event, set_log_level, get_stage_timings, reset_stage_timings, format_stage_table
+
+def capture_logs(func, level="INFO"):
+    """Run func with the JSON log handler writing into a buffer; returns the parsed lines"""
+    handler = tracing.logger.handlers[0]
+    buffer = io.StringIO()
+    original_stream = handler.setStream(buffer)
+    original_level = tracing.logger.level
+    set_log_level(level)
+    try:
+        func()
+    finally:
+        handler.setStream(original_stream)
+        tracing.logger.setLevel(original_level)
+    return [json.loads(line) for line in buffer.getvalue().splitlines()]
+
+def test_json_lines_and_levels():
+    """Test that events are JSON lines and DEBUG is off by default"""
+    print("=== Testing Structured Logs ===")
+
+    lines = capture_logs(lambda: (log_event("DEBUG", "noisy", payload="x" * 1000),
+                                  log_event("INFO", "call_found", call_uuid="call-1", record_bytes=1024)))
+    assert len(lines) == 1, "DEBUG events are skipped at INFO"
+    assert lines[0]["level"] == "INFO" and lines[0]["event"] == "call_found"
+    assert lines[0]["call_uuid"] == "call-1" and lines[0]["record_bytes"] == 1024
+    assert lines[0]["ts"].endswith("Z")
+
+    lines = capture_logs(lambda: log_event("DEBUG", "noisy"), level="DEBUG")
+    assert [line["event"] for line in lines] == ["noisy"]
+    print("✅ Logs are JSON lines filtered by level")
+
+def test_spans_across_threads():
+    """Test child spans from several threads, the call_uuid context and the call trace"""
+    print("=== Testing Call Traces ===")
+
+    reset_stage_timings()
+    trace = Trace("call-1")
+
+    def stage_worker(name):
+        with trace.span(name):
+            log_event("INFO", "inside_worker")
+
+    def run():
+        with trace.span("cdr_lookup"):
+            log_event("INFO", "inside_span")
+        for stage in ("download", "transcribe"):
+            worker = threading.Thread(target=stage_worker, args=(stage,))
+            worker.start()
+            worker.join()
+        try:
+            with trace.span("analyze"):
+                time.sleep(0.02)
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        log_event("INFO", "outside_span")
+        trace.finish("analysis_failed")
+        trace.finish("ignored")
+
+    lines = capture_logs(run, level="DEBUG")
+    events = {line["event"]: line for line in lines}
+    assert events["inside_span"]["call_uuid"] == "call-1", "Events inside a span carry the call_uuid"
+    assert events["inside_worker"]["call_uuid"] == "call-1", "Pipeline threads get the context from the span"
+    assert "call_uuid" not in events["outside_span"]
+
+    analyze_span = [line for line in lines if line["event"] == "span" and line["span"] == "analyze"][0]
+    assert analyze_span["status"] == "error" and analyze_span["duration_ms"] >= 20
+
+    call_lines = [line for line in lines if line["event"] == "call_trace"]
+    assert len(call_lines) == 1, "A trace is finished once"
+    assert call_lines[0]["status"] == "analysis_failed"
+    assert set(call_lines[0]["spans"]) == {"cdr_lookup", "download", "transcribe", "analyze"}
+    assert call_lines[0]["duration_ms"] >= 20
+
+    timings = get_stage_timings()
+    assert set(timings) == {"cdr_lookup", "download", "transcribe", "analyze", "call"}
+    print("✅ Spans are timed per call and per stage")
+
+def test_stage_table():
+    """Test the p50/p95 summary table"""
+    print("=== Testing Stage Table ===")
+
+    reset_stage_timings()
+    assert format_stage_table() == "no spans recorded"
+    for seconds in (1, 2, 3, 4, 100):
+        tracing.record_stage_timing("transcribe", seconds)
+    tracing.record_stage_timing("download", 0.5)
+
+    rows = format_stage_table().splitlines()
+    assert rows[0].split() == ["stage", "count", "p50", "p95", "max", "total"]
+    assert rows[1].split() == ["download", "1", "0.50s", "0.50s", "0.50s", "0.5s"], "Stages keep pipeline order"
+    assert rows[2].split() == ["transcribe", "5", "3.00s", "100.00s", "100.00s", "110.0s"]
+    reset_stage_timings()
+    print("✅ Stage table shows p50 and p95")
+
+if __name__ == "__main__":
+    test_json_lines_and_levels()
+    test_spans_across_threads()
+    test_stage_table()
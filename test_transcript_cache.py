@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import tempfile
+import transcript_cache
+
+def with_temp_cache(func, max_mb="1"):
+    """Run func against an empty cache directory with a size limit in MB"""
+    original_dir = transcript_cache.TRANSCRIPT_CACHE_DIR
+    original_limit = os.environ.get("TRANSCRIPT_CACHE_MAX_MB")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        transcript_cache.TRANSCRIPT_CACHE_DIR = cache_dir
+        os.environ["TRANSCRIPT_CACHE_MAX_MB"] = max_mb
+        transcript_cache.reset_cache_stats()
+        try:
+            return func(cache_dir)
+        finally:
+            transcript_cache.TRANSCRIPT_CACHE_DIR = original_dir
+            if original_limit is None:
+                os.environ.pop("TRANSCRIPT_CACHE_MAX_MB", None)
+            else:
+                os.environ["TRANSCRIPT_CACHE_MAX_MB"] = original_limit
+
+def test_decorator_hits_and_misses():
+    """Test that a repeated transcription is served from the cache"""
+    print("=== Testing Transcript Cache Hits ===")
+
+    engine_calls = []
+
+    @transcript_cache.cached_transcription("yandex", lambda: {"lang": "ru-RU"})
+    def transcribe(api_key, audio_data):
+        engine_calls.append(audio_data)
+        return None if audio_data == b"broken" else f"текст {len(audio_data)}"
+
+    def run(cache_dir):
+        assert transcribe("key", b"audio-1") == "текст 7"
+        assert transcribe("key", b"audio-1") == "текст 7"
+        assert transcribe("key", b"broken") is None
+        assert transcribe("key", b"broken") is None
+        assert engine_calls == [b"audio-1", b"broken", b"broken"], "Only successes are cached"
+
+        stats = transcript_cache.get_cache_stats()
+        assert (stats["hits"], stats["misses"], stats["writes"]) == (1, 3, 1), stats
+
+        assert transcript_cache.get_transcript(b"audio-1", "yandex", {"lang": "en-US"}) is None, \
+            "Different parameters must not share an entry"
+        assert transcript_cache.get_transcript(b"audio-1", "whisper", {"lang": "ru-RU"}) is None, \
+            "Different engines must not share an entry"
+        print("✅ Cache hits and misses work")
+
+    with_temp_cache(run)
+
+def test_lru_eviction():
+    """Test that the least recently used entries are evicted when over the size limit"""
+    print("=== Testing Transcript Cache Eviction ===")
+
+    def run(cache_dir):
+        text = "x" * 3000
+        for i in range(5):
+            transcript_cache.put_transcript(f"audio-{i}".encode(), "yandex", {}, text)
+            path = transcript_cache._entry_path(transcript_cache.make_key(f"audio-{i}".encode(), "yandex", {}))
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+        # Обращение к самой старой записи делает её самой свежей
+        assert transcript_cache.get_transcript(b"audio-0", "yandex", {}) == text
+
+        os.environ["TRANSCRIPT_CACHE_MAX_MB"] = str(12000 / (1024 * 1024))
+        transcript_cache.put_transcript(b"audio-5", "yandex", {}, text)
+
+        remaining = {i for i in range(6) if transcript_cache.get_transcript(f"audio-{i}".encode(), "yandex", {})}
+        assert 0 in remaining and 5 in remaining, f"Recently used entries are kept: {remaining}"
+        assert 1 not in remaining, f"Least recently used entry is evicted: {remaining}"
+        assert transcript_cache.get_cache_stats()["evictions"] >= 1
+        print("✅ LRU eviction works")
+
+    with_temp_cache(run)
+
+if __name__ == "__main__":
+    test_decorator_hits_and_misses()
+    test_lru_eviction()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+from transcript_compaction import (
+    compact_transcript, count_tokens, get_compaction_stats, reset_compaction_stats, GAP_MARKER
+)
+
+OPENING = "[00:01] Здравствуйте, хочу заказать букет из пионов на юбилей маме."
+PRICE = "[03:10] Пионов нет в наличии, могу предложить розы за 4500 рублей."
+CLOSING = "[09:58] Ладно, я подумаю и перезвоню, до свидания."
+
+def build_long_call():
+    """A ten-minute call: a need, a price exchange and a closing buried in small talk"""
+    weather = ["солнечно", "ветрено", "тепло", "прохладно", "пасмурно", "снежно", "сыро", "душно"]
+    places = ["в городе", "на набережной", "у вокзала", "в парке", "за рекой", "во дворе", "на рынке", "в центре"]
+    small_talk = [f"[0{minute}:{second:02d}] Сегодня {weather[minute - 1]} {places[second // 8]}, все спокойно."
+                  for minute in range(1, 9) for second in range(0, 60, 8)]
+    filler = ["[01:00] Угу.", "[01:01] Да, да.", "[01:02] Алло, алло.", "[01:03] Здравствуйте."]
+    return "\n".join([OPENING] + filler + small_talk[:30] + [PRICE] + small_talk[30:] + [CLOSING])
+
+def test_short_transcripts_are_untouched():
+    """Test that transcripts within the budget are passed through as is"""
+    print("=== Testing Compaction Pass-Through ===")
+
+    text = "Здравствуйте. Угу. Сколько стоит букет?"
+    assert compact_transcript(text, budget=100) == text
+    assert compact_transcript(build_long_call(), budget=0) == build_long_call(), "Budget 0 disables compaction"
+    print("✅ Short transcripts are untouched")
+
+def test_long_call_keeps_key_parts():
+    """Test that opening, price exchange and closing survive and the budget holds"""
+    print("=== Testing Transcript Compaction ===")
+
+    reset_compaction_stats()
+    transcript = build_long_call()
+    original_tokens = count_tokens(transcript)
+    compacted = compact_transcript(transcript, budget=150)
+
+    assert count_tokens(compacted) <= 150 < original_tokens
+    for part in (OPENING, PRICE, CLOSING):
+        assert part in compacted, f"Missing: {part}"
+    assert GAP_MARKER in compacted
+    assert "Угу." not in compacted and "Да, да." not in compacted, "Filler is dropped"
+    assert compacted.count("Здравствуйте") == 1, "Repeated greetings are dropped"
+
+    repeated = "\n".join([OPENING] + ["[05:00] Спасибо, что позвонили в наш магазин цветов."] * 60 + [CLOSING])
+    assert compact_transcript(repeated, budget=150).count("Спасибо, что позвонили") == 1, "Repeats are collapsed"
+
+    stats = get_compaction_stats()
+    assert (stats["calls"], stats["compacted"]) == (2, 2)
+    assert stats["original_tokens"] > original_tokens
+    print(f"✅ {original_tokens} → {count_tokens(compacted)} tokens, key parts kept")
+
+def test_filler_removal_alone_can_fit():
+    """Test that a call that only exceeds the budget with filler keeps all content"""
+    print("=== Testing Filler Removal ===")
+
+    content = ["Хочу тюльпаны к восьмому марта.", "Тюльпанов много, есть красные и жёлтые."]
+    transcript = "\n".join(content + ["Угу."] * 40 + ["Хорошо, оформляем."])
+    compacted = compact_transcript(transcript, budget=40)
+    assert compacted == "\n".join(content + ["Хорошо, оформляем."]), compacted
+    print("✅ Filler removal keeps all content")
+
+if __name__ == "__main__":
+    test_short_transcripts_are_untouched()
+    test_long_call_keeps_key_parts()
+    test_filler_removal_alone_can_fit()
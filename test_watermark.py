@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+import pytz
+import watermark
+import call_state
+
+POLLING_ENV = ("TIME_WINDOW_HOURS", "POLL_OVERLAP_MINUTES", "POLL_MAX_CATCHUP_HOURS",
+               "POLL_MAX_WINDOW_HOURS", "POLL_RECORDING_GRACE_MINUTES")
+
+def with_temp_watermark(func):
+    """Run func with default polling settings and the watermark in a temporary file"""
+    original_file = watermark.WATERMARK_FILE
+    original_env = {name: os.environ.pop(name, None) for name in POLLING_ENV}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        watermark.WATERMARK_FILE = os.path.join(tmp_dir, "polling_watermark.json")
+        try:
+            return func()
+        finally:
+            watermark.WATERMARK_FILE = original_file
+            for name, value in original_env.items():
+                if value is not None:
+                    os.environ[name] = value
+
+def test_incremental_window():
+    """Test that the window starts at the watermark minus overlap"""
+    print("=== Testing Incremental Polling Window ===")
+
+    def run():
+        now = datetime(2026, 10, 17, 12, 0, 0, tzinfo=pytz.UTC)
+
+        start, end = watermark.get_polling_window(now)
+        assert start == "2026-10-17 06:00:00", "Without watermark the full window is used"
+        assert end == "2026-10-17 12:00:00"
+
+        watermark.advance_watermark(end, ["2026-10-17 11:40:00", "2026-10-17 11:58:00"])
+        assert watermark.load_watermark() == datetime(2026, 10, 17, 11, 58, tzinfo=pytz.UTC), \
+            "Watermark is the latest start_time_gmt seen, not the wall-clock window end"
+
+        later = now + timedelta(minutes=10)
+        start, end = watermark.get_polling_window(later)
+        assert start == "2026-10-17 10:58:00", "Window should start 60 min before the watermark"
+        assert end == "2026-10-17 12:10:00"
+        print("✅ Incremental window works")
+
+    with_temp_watermark(run)
+
+def test_in_progress_call_is_polled_again():
+    """Test that a long call still in progress during a cycle is covered by the next window"""
+    print("=== Testing In-progress Call Coverage ===")
+
+    def run():
+        # Звонок начался в 11:30 и длится 40 минут - в листинге до 12:00 его ещё нет
+        in_progress_start = "2026-10-17 11:30:00"
+        watermark.advance_watermark("2026-10-17 12:00:00", ["2026-10-17 11:58:00"])
+
+        start, _ = watermark.get_polling_window(datetime(2026, 10, 17, 12, 10, tzinfo=pytz.UTC))
+        assert start <= in_progress_start, "Next window must still include the in-progress call"
+        print("✅ In-progress call is polled again")
+
+    with_temp_watermark(run)
+
+def test_idle_window_advances():
+    """Test that a window without calls still moves the watermark forward"""
+    print("=== Testing Idle Window ===")
+
+    def run():
+        watermark.advance_watermark("2026-10-17 12:00:00")
+        assert watermark.load_watermark() == datetime(2026, 10, 17, 11, 0, tzinfo=pytz.UTC), \
+            "Without calls the watermark moves to window end minus overlap"
+        print("✅ Idle window advances the watermark")
+
+    with_temp_watermark(run)
+
+def test_pending_calls_hold_watermark():
+    """Test that recent calls waiting for a recording hold the watermark back"""
+    print("=== Testing Pending Recording Hold ===")
+
+    def run():
+        watermark.advance_watermark(
+            "2026-10-17 12:00:00",
+            ["2026-10-17 11:55:00"],
+            ["2026-10-17 11:50:00", "2026-10-17 08:00:00"]
+        )
+        assert watermark.load_watermark() == datetime(2026, 10, 17, 11, 50, tzinfo=pytz.UTC), \
+            "Only recent pending calls should hold the watermark"
+
+        watermark.advance_watermark("2026-10-17 11:00:00")
+        assert watermark.load_watermark() == datetime(2026, 10, 17, 11, 50, tzinfo=pytz.UTC), \
+            "Watermark must never move backwards"
+        print("✅ Pending calls hold the watermark")
+
+    with_temp_watermark(run)
+
+def test_bounded_catch_up():
+    """Test that catch-up after downtime is bounded in start and window length"""
+    print("=== Testing Bounded Catch-up ===")
+
+    def run():
+        watermark.save_watermark(datetime(2026, 10, 10, 0, 0, tzinfo=pytz.UTC))
+        now = datetime(2026, 10, 17, 12, 0, 0, tzinfo=pytz.UTC)
+        start, end = watermark.get_polling_window(now)
+        assert start == "2026-10-15 12:00:00", "Start is clamped to the catch-up limit"
+        assert end == "2026-10-15 18:00:00", "Catch-up proceeds in bounded slices"
+        print("✅ Catch-up is bounded")
+
+    with_temp_watermark(run)
+
+def run_main_new(calls_stream, deployment_check=False, stop_event=None):
+    """Run main_new() against faked Telphin, transcription and analysis functions"""
+    import main
+    from cdr_index import CDRIndex
+
+    class FakeTokenProvider:
+        def get_token(self):
+            return "token"
+
+    def fake_index(*args, **kwargs):
+        cdr_index = CDRIndex()
+        cdr_index.add_records([{"call_uuid": "call-1", "record_file_size": 1024}])
+        return cdr_index
+
+    fakes = {
+        "get_token_provider": lambda *args, **kwargs: FakeTokenProvider(),
+        "save_processed_call": lambda call_id, status="success": None,
+        "iter_recent_calls": lambda *args, **kwargs: calls_stream(),
+        "get_recent_calls": lambda *args, **kwargs: list(calls_stream()),
+        "fetch_cdr_index": fake_index,
+        "download_recording": lambda *args, **kwargs: b"ID3",
+        "transcribe_with_yandex": lambda *args, **kwargs: "текст",
+        "analyze_with_gpt_new": lambda *args, **kwargs: {"status": "ignore"},
+        "get_notifier": lambda: None,
+    }
+    env = {"TELFIN_HOSTNAME": "example.invalid", "TELFIN_LOGIN": "login",
+           "TELFIN_PASSWORD": "secret", "YANDEX_API_KEY": "key"}
+
+    originals = {name: getattr(main, name) for name in fakes}
+    original_env = {name: os.environ.get(name) for name in env}
+    original_db = call_state.CALL_STATE_DB
+    try:
+        for name, fake in fakes.items():
+            setattr(main, name, fake)
+        os.environ.update(env)
+        call_state.CALL_STATE_DB = os.path.join(os.path.dirname(watermark.WATERMARK_FILE), "call_state.db")
+        return main.main_new(deployment_check=deployment_check, stop_event=stop_event)
+    finally:
+        call_state.CALL_STATE_DB = original_db
+        for name, original in originals.items():
+            setattr(main, name, original)
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+CALL = {"call_uuid": "call-1", "flow": "in", "start_time_gmt": "2026-10-17 11:58:00", "duration": 60}
+
+def test_main_new_keeps_watermark_on_partial_listing():
+    """Test that main_new() does not advance the watermark when the listing fails partway"""
+    print("=== Testing Watermark on Partial Listing ===")
+
+    def failing_stream():
+        yield CALL
+        raise ValueError("page 2 failed")
+
+    def run():
+        run_main_new(failing_stream)
+        assert watermark.load_watermark() is None, "Partial listing must not move the watermark"
+
+        run_main_new(lambda: iter([CALL]))
+        assert watermark.load_watermark() is not None, "Complete listing should move the watermark"
+        print("✅ Partial listing keeps the watermark")
+
+    with_temp_watermark(run)
+
+def test_main_new_deployment_check_ignores_watermark():
+    """Test that deployment-check mode leaves the watermark alone"""
+    print("=== Testing Watermark in Deployment Check ===")
+
+    def run():
+        run_main_new(lambda: iter([CALL]), deployment_check=True)
+        assert watermark.load_watermark() is None, "Deployment check must not move the watermark"
+        print("✅ Deployment check keeps the watermark")
+
+    with_temp_watermark(run)
+
+def test_main_new_shutdown_leaves_calls_for_next_run():
+    """Test that a stopped daemon cycle starts no new calls and keeps the watermark"""
+    print("=== Testing Watermark on Daemon Shutdown ===")
+
+    def run():
+        stop_event = threading.Event()
+        stop_event.set()
+        summary = run_main_new(lambda: iter([CALL]), stop_event=stop_event)
+        assert summary == {'new_calls': 1, 'processed': 0, 'alerts': 0}, summary
+        assert watermark.load_watermark() is None, "Skipped calls must be listed again"
+
+        summary = run_main_new(lambda: iter([CALL]))
+        assert summary == {'new_calls': 1, 'processed': 1, 'alerts': 0}, summary
+        assert watermark.load_watermark() is not None
+        print("✅ Shutdown leaves unstarted calls for the next run")
+
+    with_temp_watermark(run)
+
+if __name__ == "__main__":
+    test_incremental_window()
+    test_in_progress_call_is_polled_again()
+    test_idle_window_advances()
+    test_pending_calls_hold_watermark()
+    test_bounded_catch_up()
+    test_main_new_keeps_watermark_on_partial_listing()
+    test_main_new_deployment_check_ignores_watermark()
+    test_main_new_shutdown_leaves_calls_for_next_run()
@@ -0,0 +1,170 @@
+"""
+Lightweight per-call tracing and JSON-lines structured logging.
+
+Every call gets a Trace keyed by its call_uuid with one child span per step
+(cdr_lookup, download, convert, transcribe, analyze, notify). Span durations
+are collected per stage for the p50/p95 table at the end of a cycle, and each
+finished trace is logged as one "call_trace" line.
+
+log_event() writes one JSON object per line to stdout with a timestamp,
+level, event name, the call_uuid of the active span and the given fields.
+LOG_LEVEL (default INFO) filters the output; DEBUG events are skipped before
+they are formatted, so verbose diagnostics cost nothing when disabled.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytz
+
+import metrics
+
+STAGES = ("cdr_lookup", "download", "convert", "transcribe", "analyze", "notify")
+
+# Трасса звонка, внутри span которого выполняется текущий код
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+_stage_timings_lock = threading.Lock()
+stage_timings = {}
+
+class _JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, pytz.UTC).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _build_logger():
+    logger = logging.getLogger("call_analyzer")
+    logger.setLevel(getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO))
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_JsonLinesFormatter())
+        logger.addHandler(handler)
+    return logger
+
+logger = _build_logger()
+
+def set_log_level(level):
+    """Change the log level at runtime, e.g. "DEBUG" for a troubleshooting run"""
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+def is_enabled(level):
+    """True if events of this level are written; use it to skip building expensive fields"""
+    return logger.isEnabledFor(getattr(logging, level))
+
+def log_event(level, event, **fields):
+    """
+    Write one structured log line.
+
+    Args:
+        level (str): "DEBUG", "INFO", "WARNING" or "ERROR"
+        event (str): Short snake_case event name
+        **fields: Extra JSON fields; call_uuid is added from the active span
+    """
+    levelno = getattr(logging, level)
+    if not logger.isEnabledFor(levelno):
+        return
+    trace = _current_trace.get()
+    if trace is not None and "call_uuid" not in fields:
+        fields["call_uuid"] = trace.call_uuid
+    logger.log(levelno, event, extra={"fields": fields})
+
+def record_stage_timing(stage, seconds):
+    with _stage_timings_lock:
+        stage_timings.setdefault(stage, []).append(seconds)
+    metrics.observe("analyzer_stage_duration_seconds", seconds, stage=stage)
+
+def get_stage_timings():
+    with _stage_timings_lock:
+        return {stage: list(values) for stage, values in stage_timings.items()}
+
+def reset_stage_timings():
+    """Reset stage timings at the start of a processing cycle"""
+    with _stage_timings_lock:
+        stage_timings.clear()
+
+def _percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def format_stage_table():
+    """
+    Return per-stage span timings as a text table for the cycle summary.
+
+    Returns:
+        str: One row per stage with count, p50, p95, max and total seconds
+    """
+    timings = get_stage_timings()
+    if not timings:
+        return "no spans recorded"
+    order = [stage for stage in STAGES + ("call",) if stage in timings]
+    order += sorted(stage for stage in timings if stage not in order)
+    rows = [f"{'stage':<12}{'count':>7}{'p50':>9}{'p95':>9}{'max':>9}{'total':>10}"]
+    for stage in order:
+        values = timings[stage]
+        rows.append(f"{stage:<12}{len(values):>7}{_percentile(values, 0.5):>8.2f}s{_percentile(values, 0.95):>8.2f}s"
+                    f"{max(values):>8.2f}s{sum(values):>9.1f}s")
+    return "\n".join(rows)
+
+class Trace:
+    """Timing of one call across pipeline threads; child spans are opened with span()"""
+
+    def __init__(self, call_uuid):
+        self.call_uuid = call_uuid
+        self.started = time.monotonic()
+        self.last_end = self.started
+        self.spans = {}
+        self.finished = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **fields):
+        """
+        Time a step of this call and make its call_uuid the logging context.
+
+        Args:
+            name (str): Stage name, one of STAGES for the summary table
+            **fields: Extra fields for the DEBUG span line
+        """
+        token = _current_trace.set(self)
+        started = time.monotonic()
+        status = "ok"
+        try:
+            yield self
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            ended = time.monotonic()
+            _current_trace.reset(token)
+            duration = ended - started
+            with self._lock:
+                self.spans[name] = self.spans.get(name, 0.0) + duration
+                self.last_end = max(self.last_end, ended)
+            record_stage_timing(name, duration)
+            log_event("DEBUG", "span", call_uuid=self.call_uuid, span=name, status=status,
+                      duration_ms=round(duration * 1000, 1), **fields)
+
+    def finish(self, status):
+        """Log the whole call with its span durations; later calls are ignored"""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            duration = self.last_end - self.started
+            spans_ms = {name: round(seconds * 1000, 1) for name, seconds in self.spans.items()}
+        record_stage_timing("call", duration)
+        metrics.inc("analyzer_call_results_total", status=status)
+        log_event("INFO", "call_trace", call_uuid=self.call_uuid, status=status,
+                  duration_ms=round(duration * 1000, 1), spans=spans_ms)
@@ -0,0 +1,199 @@
+"""
+Content-addressed on-disk cache of transcripts.
+
+Entries are keyed by a SHA-256 of the audio bytes plus the transcription
+engine and its parameters, so replays, deployment checks and retries of the
+same recording skip Yandex/Whisper entirely. The cache directory is bounded
+by TRANSCRIPT_CACHE_MAX_MB; least recently used entries are evicted first.
+"""
+import os
+import json
+import time
+import hashlib
+import functools
+import threading
+
+import metrics
+
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", "transcript_cache")
+
+# После вытеснения оставляем запас, чтобы не сканировать каталог на каждой записи
+EVICTION_TARGET_RATIO = 0.9
+
+_lock = threading.Lock()
+_size_state = {"dir": None, "bytes": 0}
+cache_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+def _max_bytes():
+    try:
+        return int(float(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "100")) * 1024 * 1024)
+    except ValueError:
+        return 100 * 1024 * 1024
+
+def _count(name):
+    with _lock:
+        cache_stats[name] += 1
+    metrics.inc("analyzer_cache_events_total", cache="transcript", event=name)
+
+def get_cache_stats():
+    """Return a snapshot of hit, miss, write and eviction counters"""
+    with _lock:
+        return dict(cache_stats)
+
+def format_cache_stats():
+    """Return the counters as a one-line summary for cycle reports"""
+    stats = get_cache_stats()
+    return f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions"
+
+def reset_cache_stats():
+    """Reset the counters, e.g. at the start of a processing cycle"""
+    with _lock:
+        for name in cache_stats:
+            cache_stats[name] = 0
+
+def make_key(audio_data, engine, params=None):
+    """
+    Build the cache key of a transcription.
+
+    Args:
+        audio_data (bytes): Audio that is transcribed
+        engine (str): Transcription engine, e.g. "yandex" or "whisper"
+        params (dict): Engine parameters that affect the result
+
+    Returns:
+        str: Hex SHA-256 key
+    """
+    audio_hash = hashlib.sha256(audio_data).hexdigest()
+    params_json = json.dumps(params or {}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{audio_hash}\n{engine}\n{params_json}".encode('utf-8')).hexdigest()
+
+def _entry_path(key):
+    return os.path.join(TRANSCRIPT_CACHE_DIR, key[:2], f"{key}.json")
+
+def get_transcript(audio_data, engine, params=None):
+    """
+    Look up a cached transcript and mark it as recently used.
+
+    Returns:
+        str: Cached transcript, None on a miss or when the cache is disabled
+    """
+    if _max_bytes() <= 0:
+        return None
+
+    path = _entry_path(make_key(audio_data, engine, params))
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        os.utime(path, None)
+    except FileNotFoundError:
+        _count("misses")
+        return None
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Unreadable transcript cache entry {path}: {e}")
+        _count("misses")
+        return None
+
+    _count("hits")
+    return entry.get('text')
+
+def put_transcript(audio_data, engine, params, text):
+    """
+    Store a transcript and evict old entries if the cache is over its size limit.
+
+    Args:
+        audio_data (bytes): Audio that was transcribed
+        engine (str): Transcription engine
+        params (dict): Engine parameters that affect the result
+        text (str): Transcript to store
+    """
+    max_bytes = _max_bytes()
+    if max_bytes <= 0 or not text:
+        return
+
+    path = _entry_path(make_key(audio_data, engine, params))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'engine': engine,
+                'params': params or {},
+                'text': text,
+                'created_at': time.time()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+    except OSError as e:
+        print(f"⚠️ Could not write transcript cache entry: {e}")
+        return
+
+    _count("writes")
+    with _lock:
+        if _size_state["dir"] != TRANSCRIPT_CACHE_DIR:
+            _size_state["dir"] = TRANSCRIPT_CACHE_DIR
+            _size_state["bytes"] = sum(entry_size for _, entry_size, _ in _scan_entries())
+        else:
+            _size_state["bytes"] += size
+        if _size_state["bytes"] > max_bytes:
+            _evict(int(max_bytes * EVICTION_TARGET_RATIO))
+
+def _scan_entries():
+    """Return (path, size, mtime) of all cache entries"""
+    entries = []
+    for root, _, files in os.walk(TRANSCRIPT_CACHE_DIR):
+        for name in files:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+
+def _evict(target_bytes):
+    """Delete least recently used entries until the cache fits target_bytes; caller holds _lock"""
+    entries = sorted(_scan_entries(), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    for path, size, _ in entries:
+        if total <= target_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        cache_stats["evictions"] += 1
+        metrics.inc("analyzer_cache_events_total", cache="transcript", event="evictions")
+    _size_state["bytes"] = total
+
+def cached_transcription(engine, params_func=None):
+    """
+    Decorator that serves func(api_key, audio_data) from the transcript cache.
+
+    Only successful (non-empty) transcripts are stored. The undecorated
+    function stays available as func.__wrapped__.
+
+    Args:
+        engine (str): Transcription engine name used in the key
+        params_func (callable): Returns the parameters that affect the result
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(api_key, audio_data):
+            if not audio_data:
+                return func(api_key, audio_data)
+
+            params = params_func() if params_func else {}
+            cached = get_transcript(audio_data, engine, params)
+            if cached is not None:
+                print(f"💾 Transcript cache hit ({engine}, {len(audio_data)} bytes of audio)")
+                return cached
+
+            text = func(api_key, audio_data)
+            if text:
+                put_transcript(audio_data, engine, params, text)
+            return text
+        return wrapper
+    return decorator
@@ -0,0 +1,191 @@
+"""
+Token-budgeted compaction of long transcripts before the GPT analysis.
+
+Transcripts over ANALYSIS_TRANSCRIPT_TOKEN_BUDGET tokens (default 2500, 0
+disables compaction) are shortened in two steps. First, filler replies
+("угу", "да, да"), repeated greetings and consecutive duplicates are dropped.
+If the text is still too long, the opening (where the client states the
+need), the closing and the price, availability and refusal exchanges in
+between are kept, and the rest is replaced by "[…]". Tokens are counted
+locally with a tokenizer-free estimate.
+"""
+import os
+import re
+import threading
+
+from call_prefilter import FAILURE_PATTERNS
+
+GAP_MARKER = "[…]"
+
+# Доли бюджета под начало и конец разговора
+OPENING_SHARE = 0.3
+CLOSING_SHARE = 0.2
+
+FILLER_WORDS = {
+    "угу", "ага", "да", "ну", "так", "вот", "ой", "алло", "але", "ало", "хорошо", "окей", "ок",
+    "понятно", "ясно", "слушаю", "минуточку", "секундочку", "сейчас", "спасибо", "пожалуйста", "мм", "эм",
+}
+GREETING_RE = re.compile(r'^(здравствуйте|добрый (день|вечер|утро)|доброе утро|привет\w*|алло|до свидания)\b', re.IGNORECASE)
+
+# Цена, наличие и отказ - то, на чём ловятся ошибки менеджера
+KEY_PATTERNS = [
+    r'\d{3}|\d \d{3}',
+    r'руб\w*|₽|р\.',
+    r'цен\w*|стоит|стоимост\w+|сколько|дорог\w*|дешевл\w*|бюджет\w*',
+    r'наличи\w+|нету|нет\b|закончил\w+|разобрал\w*|остал\w+',
+    r'предлож\w+|вариант\w*|замен\w*|альтернатив\w*',
+    r'доставк\w+|оплат\w+|заказ\w*',
+] + FAILURE_PATTERNS
+KEY_RE = re.compile("|".join(f"(?:{pattern})" for pattern in KEY_PATTERNS), re.IGNORECASE)
+
+_TOKEN_RE = re.compile(r'\w{1,4}|[^\w\s]')
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+_lock = threading.Lock()
+compaction_stats = {"calls": 0, "compacted": 0, "original_tokens": 0, "compacted_tokens": 0}
+
+def count_tokens(text):
+    """
+    Estimate the number of model tokens of a text without a tokenizer.
+
+    Words are counted in pieces of up to four characters plus one token per
+    punctuation mark, which is close to what the OpenAI tokenizers produce
+    for Russian speech transcripts.
+    """
+    return len(_TOKEN_RE.findall(text or ''))
+
+def get_token_budget():
+    try:
+        return int(os.environ.get("ANALYSIS_TRANSCRIPT_TOKEN_BUDGET", "2500"))
+    except ValueError:
+        return 2500
+
+def get_compaction_stats():
+    with _lock:
+        return dict(compaction_stats)
+
+def format_compaction_stats():
+    """Return compaction counters as a one-line summary for cycle reports"""
+    stats = get_compaction_stats()
+    if not stats["compacted"]:
+        return f"{stats['calls']} transcripts, none over budget"
+    return (f"{stats['compacted']}/{stats['calls']} transcripts compacted, "
+            f"{stats['original_tokens']} → {stats['compacted_tokens']} tokens")
+
+def reset_compaction_stats():
+    with _lock:
+        for name in compaction_stats:
+            compaction_stats[name] = 0
+
+def _split_segments(transcript):
+    """Split a transcript into (line_number, sentence) segments"""
+    segments = []
+    for line_number, line in enumerate(transcript.splitlines()):
+        for sentence in _SENTENCE_SPLIT_RE.split(line.strip()):
+            if sentence:
+                segments.append((line_number, sentence))
+    return segments
+
+def _is_filler(sentence):
+    words = re.findall(r'\w+', sentence.lower())
+    return all(word in FILLER_WORDS or word.isdigit() and len(word) <= 2 for word in words)
+
+def _drop_filler(segments):
+    """Remove filler replies, greetings after the first one and consecutive duplicates"""
+    kept = []
+    greeted = False
+    previous = None
+    for line_number, sentence in segments:
+        # Таймкоды "[00:28]" и "19:37:56" не считаем содержанием
+        normalized = re.sub(r'^\[?\d{1,2}:\d{2}(:\d{2})?\]?\s*', '', sentence).strip().lower()
+        if not normalized or _is_filler(normalized) or normalized == previous:
+            continue
+        if GREETING_RE.match(normalized):
+            if greeted:
+                continue
+            greeted = True
+        previous = normalized
+        kept.append((line_number, sentence))
+    return kept
+
+def _render(segments, total):
+    """Join segments in transcript order, marking dropped stretches with GAP_MARKER"""
+    lines = []
+    last_index = -1
+    previous_line = None
+    for index, (line_number, sentence) in segments:
+        if index != last_index + 1:
+            lines.append(GAP_MARKER)
+            lines.append(sentence)
+        elif lines and lines[-1] != GAP_MARKER and line_number == previous_line:
+            lines[-1] += " " + sentence
+        else:
+            lines.append(sentence)
+        last_index = index
+        previous_line = line_number
+    if last_index != total - 1:
+        lines.append(GAP_MARKER)
+    return "\n".join(lines)
+
+def _select(segments, budget):
+    """Pick the opening, the closing and key exchanges within the token budget"""
+    # С запасом на маркер пропуска после каждого сегмента - так результат точно влезет в бюджет
+    gap_cost = count_tokens(GAP_MARKER) + 1
+    costs = [count_tokens(sentence) + gap_cost for _, sentence in segments]
+    selected = set()
+    used = 0
+
+    def take(index):
+        nonlocal used
+        if index in selected or used + costs[index] > budget:
+            return False
+        selected.add(index)
+        used += costs[index]
+        return True
+
+    opening_budget = budget * OPENING_SHARE
+    for index in range(len(segments)):
+        if used + costs[index] > opening_budget or not take(index):
+            break
+
+    closing_budget = used + budget * CLOSING_SHARE
+    for index in range(len(segments) - 1, -1, -1):
+        if index in selected or used + costs[index] > closing_budget or not take(index):
+            break
+
+    for index, (_, sentence) in enumerate(segments):
+        if index not in selected and KEY_RE.search(sentence):
+            take(index)
+
+    return [(index, segments[index]) for index in sorted(selected)]
+
+def compact_transcript(transcript, budget=None):
+    """
+    Shorten a transcript to the token budget, keeping what matters for fault detection.
+
+    Args:
+        transcript (str): Transcript text
+        budget (int): Token budget, defaults to ANALYSIS_TRANSCRIPT_TOKEN_BUDGET
+
+    Returns:
+        str: The transcript itself if it fits, otherwise the compacted text
+    """
+    budget = get_token_budget() if budget is None else budget
+    original_tokens = count_tokens(transcript)
+    with _lock:
+        compaction_stats["calls"] += 1
+    if budget <= 0 or original_tokens <= budget:
+        return transcript
+
+    segments = _drop_filler(_split_segments(transcript))
+    compacted = _render(list(enumerate(segments)), len(segments))
+    if count_tokens(compacted) > budget:
+        compacted = _render(_select(segments, budget), len(segments))
+
+    compacted_tokens = count_tokens(compacted)
+    with _lock:
+        compaction_stats["compacted"] += 1
+        compaction_stats["original_tokens"] += original_tokens
+        compaction_stats["compacted_tokens"] += compacted_tokens
+    print(f"✂️ Transcript compacted: {original_tokens} → {compacted_tokens} tokens (budget {budget})")
+    return compacted
@@ -0,0 +1,148 @@
+"""
+Persisted high-water mark for incremental Telphin polling.
+
+Instead of re-querying the whole TIME_WINDOW_HOURS window every cycle, the
+worker remembers the latest start_time_gmt of fully processed calls and only
+asks Telphin for the delta since then, minus an overlap margin.
+
+Telphin lists a call only after it has ended, so POLL_OVERLAP_MINUTES must
+cover the longest expected call: a call that started before the watermark but
+was still in progress during the last cycle is then polled again.
+"""
+import os
+import json
+from datetime import datetime, timedelta
+import pytz
+
+WATERMARK_FILE = os.environ.get("WATERMARK_FILE", "polling_watermark.json")
+
+TELFIN_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def load_watermark():
+    """
+    Load the persisted high-water mark.
+
+    Returns:
+        datetime: Aware UTC datetime of the last fully processed moment, None if unknown
+    """
+    try:
+        if os.path.exists(WATERMARK_FILE):
+            with open(WATERMARK_FILE, 'r') as f:
+                data = json.load(f)
+            value = datetime.strptime(data['watermark'], TELFIN_DATETIME_FORMAT)
+            return value.replace(tzinfo=pytz.UTC)
+        return None
+    except Exception as e:
+        print(f"Error loading polling watermark: {e}")
+        return None
+
+def save_watermark(watermark):
+    """
+    Persist the high-water mark atomically.
+
+    Args:
+        watermark (datetime): Aware UTC datetime up to which calls are fully processed
+    """
+    try:
+        tmp_file = f"{WATERMARK_FILE}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'watermark': watermark.astimezone(pytz.UTC).strftime(TELFIN_DATETIME_FORMAT),
+                'updated_at': datetime.now(pytz.UTC).strftime(TELFIN_DATETIME_FORMAT)
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, WATERMARK_FILE)
+    except Exception as e:
+        print(f"Error saving polling watermark: {e}")
+
+def get_polling_window(now_utc=None):
+    """
+    Compute the Telphin query window for this cycle.
+
+    Without a watermark the classic TIME_WINDOW_HOURS window is used. With a
+    watermark the window starts POLL_OVERLAP_MINUTES before it. After downtime
+    the start is clamped to POLL_MAX_CATCHUP_HOURS ago and the window length to
+    POLL_MAX_WINDOW_HOURS, so catch-up happens in bounded slices over several cycles.
+
+    Args:
+        now_utc (datetime): Current aware UTC time, defaults to now
+
+    Returns:
+        tuple: (start_datetime: str, end_datetime: str) in Telphin UTC format
+    """
+    now_utc = now_utc or datetime.now(pytz.UTC)
+    time_window_hours = _env_float("TIME_WINDOW_HOURS", "6")
+    overlap = timedelta(minutes=_env_float("POLL_OVERLAP_MINUTES", "60"))
+    max_catchup = timedelta(hours=_env_float("POLL_MAX_CATCHUP_HOURS", "48"))
+    max_window = timedelta(hours=_env_float("POLL_MAX_WINDOW_HOURS", str(time_window_hours)))
+
+    watermark = load_watermark()
+
+    if watermark is None:
+        start = now_utc - timedelta(hours=time_window_hours)
+        print(f"No polling watermark yet, using full {time_window_hours:g}h window")
+    else:
+        start = watermark - overlap
+        if start < now_utc - max_catchup:
+            print(f"⚠️ Watermark {watermark:%Y-%m-%d %H:%M:%S} is older than catch-up limit, "
+                  f"calls before {now_utc - max_catchup:%Y-%m-%d %H:%M:%S} UTC are skipped")
+            start = now_utc - max_catchup
+
+    end = min(now_utc, start + max_window)
+    if end < now_utc:
+        print(f"🔁 Catch-up mode: polling {start:%Y-%m-%d %H:%M:%S} - {end:%Y-%m-%d %H:%M:%S} UTC")
+
+    return start.strftime(TELFIN_DATETIME_FORMAT), end.strftime(TELFIN_DATETIME_FORMAT)
+
+def advance_watermark(window_end, seen_call_starts=(), pending_call_starts=()):
+    """
+    Move the watermark after a fully processed window.
+
+    The watermark becomes the latest start_time_gmt seen in the listing. When
+    no call started later than window_end - POLL_OVERLAP_MINUTES, the watermark
+    moves to that point instead, because every call that started earlier has
+    ended and was listed. Calls that are still waiting for their recording
+    hold the watermark back, so they are listed again on the next cycle.
+
+    Args:
+        window_end (str): End of the polled window in Telphin UTC format
+        seen_call_starts (iterable): start_time_gmt values of all listed calls
+        pending_call_starts (iterable): start_time_gmt values of calls to revisit
+    """
+    window_end = _parse_telfin_datetime(window_end)
+    overlap = timedelta(minutes=_env_float("POLL_OVERLAP_MINUTES", "60"))
+    grace = timedelta(minutes=_env_float("POLL_RECORDING_GRACE_MINUTES", "30"))
+
+    new_watermark = window_end - overlap
+    for start_time in seen_call_starts:
+        call_start = _parse_telfin_datetime(start_time)
+        if call_start and call_start <= window_end:
+            new_watermark = max(new_watermark, call_start)
+
+    for start_time in pending_call_starts:
+        call_start = _parse_telfin_datetime(start_time)
+        # Запись могла ещё не появиться в CDR - не уходим дальше такого звонка,
+        # но и не держим watermark бесконечно из-за пропущенных звонков без записи
+        if call_start and call_start >= window_end - grace:
+            new_watermark = min(new_watermark, call_start)
+
+    previous = load_watermark()
+    if previous and new_watermark <= previous:
+        return
+
+    save_watermark(new_watermark)
+    print(f"Polling watermark advanced to {new_watermark:%Y-%m-%d %H:%M:%S} UTC")
+
+def _parse_telfin_datetime(value):
+    """Parse a Telphin UTC datetime string, None if it is missing or malformed"""
+    try:
+        return datetime.strptime(value, TELFIN_DATETIME_FORMAT).replace(tzinfo=pytz.UTC)
+    except (ValueError, TypeError):
+        return None